@@ -0,0 +1,35 @@
+"""
+python -m benchmarks [--only tokens sqldb] [--iterations 1000] [--output bench_output.json]
+python -m benchmarks.compare old.json new.json
+"""
+import argparse
+import asyncio
+
+from benchmarks.runner import print_results, write_results
+from benchmarks.suite import BENCHMARKS
+
+
+async def run(names: list[str], iterations: int, password_iterations: int) -> list[dict]:
+    results = []
+    for name in names:
+        results.extend(
+            await BENCHMARKS[name](password_iterations if name == 'password' else iterations),
+        )
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog='python -m benchmarks')
+    parser.add_argument('--only', nargs='+', choices=BENCHMARKS, default=list(BENCHMARKS))
+    parser.add_argument('--iterations', type=int, default=1000)
+    parser.add_argument('--password-iterations', type=int, default=20)
+    parser.add_argument('--output', default='bench_output.json')
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args.only, args.iterations, args.password_iterations))
+    print_results(results)
+    write_results(args.output, results)
+
+
+if __name__ == '__main__':
+    main()
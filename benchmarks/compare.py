@@ -0,0 +1,31 @@
+import argparse
+import json
+
+
+def load(path: str) -> dict:
+    with open(path) as file:
+        data = json.load(file)
+    return {(result['name'], result['backend']): result for result in data['results']}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.compare')
+    parser.add_argument('baseline')
+    parser.add_argument('candidate')
+    args = parser.parse_args()
+
+    baseline = load(args.baseline)
+    candidate = load(args.candidate)
+    print(f'{"benchmark":<40} {"backend":<8} {"ops/s old":>12} {"ops/s new":>12} {"change":>8} {"p99 change":>10}')
+    for key in sorted(baseline.keys() & candidate.keys()):
+        old, new = baseline[key], candidate[key]
+        ops_change = new['ops_per_second'] / old['ops_per_second'] - 1 if old['ops_per_second'] else 0
+        p99_change = new['p99_us'] / old['p99_us'] - 1 if old['p99_us'] else 0
+        print(
+            f'{key[0]:<40} {key[1]:<8} {old["ops_per_second"]:>12.1f} {new["ops_per_second"]:>12.1f} '
+            f'{ops_change:>+8.1%} {p99_change:>+10.1%}',
+        )
+
+
+if __name__ == '__main__':
+    main()
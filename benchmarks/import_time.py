@@ -0,0 +1,78 @@
+"""
+python -m benchmarks.import_time [--budget-ms 150] [--repeat 5]
+COLD IMPORT OF THE CORE TOKEN PATH IN A FRESH INTERPRETER, PARSED FROM "python -X importtime"
+TIME OF --baseline MODULES, WHICH EVERY APP IMPORTS ANYWAY, IS NOT COUNTED
+EXITS WITH 1 IF MEDIAN IS OVER BUDGET OR A --forbid MODULE IS IMPORTED
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+
+
+CORE_MODULES = ['fastapi_jwt.auth.auth', 'fastapi_jwt.services.jwt', 'fastapi_jwt.repositories.jwt.memory']
+BASELINE_MODULES = ['fastapi']
+FORBIDDEN_MODULES = ['sqlalchemy', 'redis', 'asyncpg']
+
+
+def parse_importtime(output: str) -> list[tuple[str, int, int, int]]:
+    """ [(module, depth, self_us, cumulative_us), ...] IN COMPLETION ORDER """
+    entries = []
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip())) // 2
+        entries.append((name.strip(), depth, int(self_us), int(cumulative_us)))
+    return entries
+
+
+def measure(modules: list[str], baseline: list[str]) -> list[tuple[str, int, int, int]]:
+    """ ENTRIES IMPORTED BY modules AFTER baseline WAS IMPORTED """
+    code = ''.join(f'import {module};' for module in baseline + modules)
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    entries = parse_importtime(result.stderr)
+    baseline_entries = 0
+    for index, (name, depth, _, _) in enumerate(entries):
+        if depth == 0 and name in baseline:
+            baseline_entries = index + 1
+    return entries[baseline_entries:]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.import_time')
+    parser.add_argument('--modules', nargs='+', default=CORE_MODULES)
+    parser.add_argument('--baseline', nargs='*', default=BASELINE_MODULES)
+    parser.add_argument('--forbid', nargs='*', default=FORBIDDEN_MODULES)
+    parser.add_argument('--budget-ms', type=float, default=150)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--top', type=int, default=10)
+    args = parser.parse_args()
+
+    runs = [measure(args.modules, args.baseline) for _ in range(args.repeat)]
+    totals_ms = [sum(cumulative for _, depth, _, cumulative in entries if depth == 0) / 1000 for entries in runs]
+    median_ms = statistics.median(totals_ms)
+    entries = runs[totals_ms.index(min(totals_ms, key=lambda total: abs(total - median_ms)))]
+
+    print(f'{"module":<60} {"self ms":>10} {"cumulative ms":>14}')
+    for name, _, self_us, cumulative_us in sorted(entries, key=lambda entry: entry[2], reverse=True)[:args.top]:
+        print(f'{name:<60} {self_us / 1000:>10.1f} {cumulative_us / 1000:>14.1f}')
+    print(f'median of {args.repeat}: {median_ms:.1f} ms, budget: {args.budget_ms:.1f} ms')
+
+    imported = {name.split('.')[0] for name, _, _, _ in entries}
+    forbidden = sorted(imported & set(args.forbid))
+    if forbidden:
+        print(f'FAIL: core path imports {", ".join(forbidden)}')
+    if median_ms > args.budget_ms:
+        print('FAIL: over budget')
+    if forbidden or median_ms > args.budget_ms:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+import inspect
+import json
+import platform
+import statistics
+import subprocess
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable
+
+
+def percentile(sorted_values: list[float], percent: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(percent / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def summarize(name: str, backend: str, timings: list[float]) -> dict:
+    timings = sorted(timings)
+    total = sum(timings)
+    return {
+        'name': name,
+        'backend': backend,
+        'iterations': len(timings),
+        'ops_per_second': len(timings) / total if total else 0.0,
+        'mean_us': statistics.fmean(timings) * 1e6,
+        'p50_us': percentile(timings, 50) * 1e6,
+        'p95_us': percentile(timings, 95) * 1e6,
+        'p99_us': percentile(timings, 99) * 1e6,
+        'max_us': timings[-1] * 1e6,
+    }
+
+
+async def measure(
+        name: str,
+        func: Callable[[], Any],
+        iterations: int,
+        warmup: int = 10,
+        backend: str = '-',
+) -> dict:
+    """ func IS CALLED WITHOUT ARGUMENTS, COROUTINE FUNCTIONS ARE AWAITED """
+    is_async = inspect.iscoroutinefunction(func)
+    for _ in range(warmup):
+        result = func()
+        if is_async:
+            await result
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        result = func()
+        if is_async:
+            await result
+        timings.append(time.perf_counter() - start)
+    return summarize(name, backend, timings)
+
+
+def get_environment() -> dict:
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', 'HEAD'],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'commit': commit,
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+    }
+
+
+def write_results(path: str, results: list[dict]) -> None:
+    with open(path, 'w') as file:
+        json.dump({'environment': get_environment(), 'results': results}, file, indent=2)
+
+
+def print_results(results: list[dict]) -> None:
+    print(f'{"benchmark":<40} {"backend":<8} {"ops/s":>12} {"p50 us":>10} {"p95 us":>10} {"p99 us":>10}')
+    for result in results:
+        print(
+            f'{result["name"]:<40} {result["backend"]:<8} {result["ops_per_second"]:>12.1f} '
+            f'{result["p50_us"]:>10.1f} {result["p95_us"]:>10.1f} {result["p99_us"]:>10.1f}',
+        )
@@ -0,0 +1,152 @@
+"""
+OFFLINE STAND-INS: SQLite VIA aiosqlite FOR sqldb AND fakeredis FOR cache
+"""
+import os
+import tempfile
+from itertools import count
+
+import fakeredis
+import jwt
+from sqlalchemy import ForeignKey, Integer, String
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
+
+from benchmarks.runner import measure
+from fastapi_jwt.auth.jwt import decode_jwt, generate_jwt
+from fastapi_jwt.managers.users import UserManager
+from fastapi_jwt.models.jwt import RefreshToken
+from fastapi_jwt.repositories.jwt.cache import JWTRepository as CacheJWTRepository
+from fastapi_jwt.repositories.jwt.sqldb import JWTRepository as SQLJWTRepository
+from fastapi_jwt.services.jwt import JWTService
+
+
+SECRET = 'benchmark-secret-key-of-sufficient-length'
+
+
+class Base(DeclarativeBase):
+    pass
+
+
+class BenchmarkAccountTable(Base):
+    __tablename__ = 'account'
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    email: Mapped[str] = mapped_column(String(100), nullable=False)
+
+
+class BenchmarkRefreshTokenTable(Base, RefreshToken):
+    user_id: Mapped[int] = mapped_column(Integer, ForeignKey('account.id'), nullable=False)
+
+
+class BenchmarkJWTRepository(SQLJWTRepository):
+    model = BenchmarkRefreshTokenTable
+
+
+async def bench_token_functions(iterations: int) -> list[dict]:
+    token = generate_jwt({'sub': '1'}, 60, SECRET, 'HS256')
+    return [
+        await measure(
+            'generate_jwt',
+            lambda: generate_jwt({'sub': '1'}, 60, SECRET, 'HS256'),
+            iterations,
+        ),
+        await measure(
+            'decode_jwt(no verify_signature)',
+            lambda: decode_jwt(token, SECRET, 'HS256', verify_signature=False),
+            iterations,
+        ),
+        await measure(
+            'decode_jwt(verify_signature)',
+            lambda: decode_jwt(token, SECRET, 'HS256'),
+            iterations,
+        ),
+        await measure(
+            'jwt.decode(verify_signature)',
+            lambda: jwt.decode(token, SECRET, algorithms=['HS256']),
+            iterations,
+        ),
+    ]
+
+
+async def bench_password(iterations: int) -> list[dict]:
+    password_hash = UserManager.make_password('benchmark')
+    return [
+        await measure(
+            'UserManager.check_password',
+            lambda: UserManager.check_password('benchmark', password_hash),
+            iterations,
+            warmup=1,
+        ),
+    ]
+
+
+async def bench_service(backend: str, jwt_service: JWTService, iterations: int) -> list[dict]:
+    user_ids = count(1)
+
+    async def create_auth_tokens():
+        return await jwt_service.create_auth_tokens(next(user_ids) % 100 + 1)
+
+    refresh_tokens = [
+        (await jwt_service.create_auth_tokens(i % 100 + 1))['refresh_token']
+        for i in range(iterations * 2 + 20)
+    ]
+
+    async def refresh_auth_tokens():
+        await jwt_service.refresh_auth_tokens(refresh_tokens.pop())
+
+    async def delete_refresh_token():
+        await jwt_service.delete_refresh_token(refresh_tokens.pop())
+
+    async def create_auth_tokens_many():
+        return await jwt_service.create_auth_tokens_many(list(range(1, 101)))
+
+    return [
+        await measure('JWTService.create_auth_tokens', create_auth_tokens, iterations, backend=backend),
+        await measure(
+            'JWTService.create_auth_tokens_many(100)',
+            create_auth_tokens_many,
+            max(1, iterations // 100),
+            warmup=1,
+            backend=backend,
+        ),
+        await measure('JWTService.refresh_auth_tokens', refresh_auth_tokens, iterations, backend=backend),
+        await measure('JWTService.delete_refresh_token', delete_refresh_token, iterations, backend=backend),
+    ]
+
+
+async def bench_sqldb(iterations: int) -> list[dict]:
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_async_engine(f'sqlite+aiosqlite:///{os.path.join(directory, "bench.db")}')
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+            await conn.execute(
+                BenchmarkAccountTable.__table__.insert(),
+                [{'id': i, 'email': f'user{i}@example.com'} for i in range(1, 101)],
+            )
+        session_factory = async_sessionmaker(engine, expire_on_commit=False)
+        jwt_service = JWTService(
+            BenchmarkJWTRepository(session_factory),
+            jwt_access_secret_key=SECRET,
+            jwt_refresh_secret_key=SECRET,
+        )
+        try:
+            return await bench_service('sqldb', jwt_service, iterations)
+        finally:
+            await engine.dispose()
+
+
+async def bench_cache(iterations: int) -> list[dict]:
+    jwt_service = JWTService(
+        CacheJWTRepository(fakeredis.FakeAsyncRedis()),
+        jwt_access_secret_key=SECRET,
+        jwt_refresh_secret_key=SECRET,
+    )
+    return await bench_service('cache', jwt_service, iterations)
+
+
+BENCHMARKS = {
+    'tokens': bench_token_functions,
+    'password': bench_password,
+    'sqldb': bench_sqldb,
+    'cache': bench_cache,
+}
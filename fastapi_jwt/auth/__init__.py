@@ -1 +1,25 @@
-from fastapi_jwt.auth.auth import get_current_user_info
\ No newline at end of file
+""" NAMES ARE IMPORTED ON FIRST ACCESS, SO fastapi_jwt.auth.* MODULES CAN BE IMPORTED WITHOUT MANAGERS """
+import importlib
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from fastapi_jwt.auth.auth import get_current_user_info
+    from fastapi_jwt.auth.cache import AccessTokenCache
+    from fastapi_jwt.auth.keys import JWTKeySet
+    from fastapi_jwt.auth.revocation import RevocationList
+
+
+_EXPORTS = {
+    'get_current_user_info': 'fastapi_jwt.auth.auth',
+    'AccessTokenCache': 'fastapi_jwt.auth.cache',
+    'JWTKeySet': 'fastapi_jwt.auth.keys',
+    'RevocationList': 'fastapi_jwt.auth.revocation',
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name: str):
+    if name not in _EXPORTS:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+    return getattr(importlib.import_module(_EXPORTS[name]), name)
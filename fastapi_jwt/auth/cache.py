@@ -0,0 +1,58 @@
+import time
+from collections import OrderedDict
+
+from fastapi_jwt.auth.jwt import get_token_digest
+
+
+class AccessTokenCache:
+    """
+    LRU CACHE OF DECODED ACCESS TOKENS KEYED BY (KEY ID, TOKEN DIGEST)
+    ONLY PAYLOADS WITH VERIFIED SIGNATURE ARE CACHED, KEY ID IS THE "kid" OF THE KEY THAT VERIFIED IT
+    ENTRY NEVER OUTLIVES TOKEN "exp" CLAIM
+    """
+
+    def __init__(self, max_size: int = 10000, max_ttl_seconds: float | None = None):
+        self.max_size = max_size
+        self.max_ttl_seconds = max_ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[tuple[str | None, str], tuple[dict, float]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, token: str, key_id: str | None = None) -> dict | None:
+        digest = (key_id, get_token_digest(token))
+        entry = self._entries.get(digest)
+        if entry is None:
+            self.misses += 1
+            return
+        payload, expires_at = entry
+        if expires_at <= time.time():
+            del self._entries[digest]
+            self.misses += 1
+            return
+        self._entries.move_to_end(digest)
+        self.hits += 1
+        return payload
+
+    def set(self, token: str, payload: dict, key_id: str | None = None) -> None:
+        expires_at = payload.get('exp')
+        if self.max_ttl_seconds is not None:
+            max_expires_at = time.time() + self.max_ttl_seconds
+            expires_at = min(expires_at, max_expires_at) if expires_at else max_expires_at
+        if not expires_at:
+            return
+        digest = (key_id, get_token_digest(token))
+        self._entries[digest] = (payload, expires_at)
+        self._entries.move_to_end(digest)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, token: str, key_id: str | None = None) -> None:
+        self._entries.pop((key_id, get_token_digest(token)), None)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
@@ -1,43 +1,73 @@
+import hashlib
+import time
 from datetime import datetime, timedelta
 
 import jwt
 from fastapi import HTTPException
 from starlette import status
 
+from fastapi_jwt.auth.keys import JWTKeySet
+from fastapi_jwt.auth.verifier import HMAC_ALGORITHMS, get_hmac_verifier
+from fastapi_jwt.instrumentation.observer import instrument
 
+
+@instrument('generate_jwt')
 def generate_jwt(
         data: dict,
         lifetime_seconds: int,
-        secret: str,
+        secret: str | JWTKeySet,
         algorithm: str,
 ) -> str:
     payload = data.copy()
     if lifetime_seconds:
         expires_delta = datetime.utcnow() + timedelta(seconds=lifetime_seconds)
         payload['exp'] = expires_delta
+    if isinstance(secret, JWTKeySet):
+        key = secret.get_signing_key()
+        headers = {'kid': key.kid} if key.kid is not None else None
+        return jwt.encode(payload, key.signing_key, key.algorithm, headers=headers)
     return jwt.encode(payload, secret, algorithm)
 
 
+@instrument('decode_jwt')
 def decode_jwt(
         encoded_jwt: str,
-        secret: str,
+        secret: str | JWTKeySet,
         algorithm: str,
         soft: bool = False,
+        verify_signature: bool = True,
 ) -> dict:
     try:
-        decoded_token = jwt.decode(
-            encoded_jwt,
-            secret,
-            algorithms=[algorithm],
-            options={'verify_signature': False},
+        if isinstance(secret, JWTKeySet):
+            key = secret.get_verifying_key(jwt.get_unverified_header(encoded_jwt).get('kid'))
+            secret, algorithm = key.verifying_key, key.algorithm
+        if algorithm in HMAC_ALGORITHMS:
+            decoded_token = get_hmac_verifier(secret, algorithm).verify(
+                encoded_jwt,
+                verify_signature=verify_signature,
+                verify_exp=False,
+            )
+        else:
+            decoded_token = jwt.decode(
+                encoded_jwt,
+                secret,
+                algorithms=[algorithm],
+                options={'verify_signature': verify_signature, 'verify_exp': False},
+            )
+    except jwt.exceptions.PyJWTError:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail='Could not validate credentials',
+            headers={'WWW-Authenticate': 'Bearer'},
         )
-    except (jwt.exceptions.InvalidSignatureError, jwt.exceptions.DecodeError):
+    exp = decoded_token.get('exp')
+    if not isinstance(exp, (int, float)):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail='Could not validate credentials',
             headers={'WWW-Authenticate': 'Bearer'},
         )
-    if decoded_token.get('exp') < datetime.utcnow().timestamp():
+    if exp < time.time():
         if soft:
             """ FOR LOGOUT """
             return {'sub': decoded_token.get('sub')}
@@ -47,3 +77,30 @@ def decode_jwt(
             headers={'WWW-Authenticate': 'Bearer'},
         )
     return decoded_token
+
+
+def get_verifying_key_id(encoded_jwt: str, secret: str | JWTKeySet) -> str | None:
+    """ "kid" OF THE KEY THAT VERIFIES TOKEN, NONE FOR A SINGLE SECRET, UNKNOWN KEY IS REJECTED LIKE IN decode_jwt """
+    if not isinstance(secret, JWTKeySet):
+        return
+    try:
+        return secret.get_verifying_key(jwt.get_unverified_header(encoded_jwt).get('kid')).kid
+    except jwt.exceptions.PyJWTError:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail='Could not validate credentials',
+            headers={'WWW-Authenticate': 'Bearer'},
+        )
+
+
+def get_unverified_exp(encoded_jwt: str) -> int | None:
+    """ FOR MIGRATING STORED TOKENS ONLY, SIGNATURE IS NOT CHECKED, NONE WHEN TOKEN IS MALFORMED OR HAS NO exp """
+    try:
+        exp = jwt.decode(encoded_jwt, options={'verify_signature': False}).get('exp')
+    except jwt.exceptions.PyJWTError:
+        return
+    return int(exp) if isinstance(exp, (int, float)) else None
+
+
+def get_token_digest(token: str) -> str:
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
@@ -0,0 +1,74 @@
+from typing import Any, NamedTuple
+
+from jwt.algorithms import get_default_algorithms
+from jwt.exceptions import InvalidAlgorithmError, InvalidKeyError
+
+
+class PreparedKey(NamedTuple):
+    kid: str | None
+    algorithm: str
+    signing_key: Any
+    verifying_key: Any
+
+
+class JWTKeySet:
+    """
+    KEY MATERIAL IS PARSED ONCE AND KEPT AS READY PyJWT KEY OBJECTS
+    TOKENS ARE SIGNED WITH SIGNING KEY AND VERIFIED WITH KEY SELECTED BY "kid" HEADER
+    RESOURCE SERVER CAN ADD ONLY PUBLIC KEYS
+    """
+
+    def __init__(self):
+        self.keys: dict[str | None, PreparedKey] = {}
+        self.signing: PreparedKey | None = None
+
+    @classmethod
+    def from_secret(cls, secret: str, algorithm: str = 'HS256') -> 'JWTKeySet':
+        key_set = cls()
+        key_set.add_key(None, algorithm, signing_key=secret)
+        return key_set
+
+    def add_key(
+            self,
+            kid: str | None,
+            algorithm: str,
+            signing_key: Any = None,
+            verifying_key: Any = None,
+            use_for_signing: bool = True,
+    ) -> PreparedKey:
+        algorithms = get_default_algorithms()
+        if algorithm not in algorithms:
+            raise InvalidAlgorithmError(f'Algorithm {algorithm} is not supported')
+        algorithm_obj = algorithms[algorithm]
+        if signing_key is not None:
+            signing_key = algorithm_obj.prepare_key(signing_key)
+        if verifying_key is not None:
+            verifying_key = algorithm_obj.prepare_key(verifying_key)
+        elif signing_key is not None:
+            """ HMAC VERIFIES WITH THE SAME SECRET, ASYMMETRIC WITH PUBLIC PART OF PRIVATE KEY """
+            public_key = getattr(signing_key, 'public_key', None)
+            verifying_key = public_key() if public_key else signing_key
+        if verifying_key is None:
+            raise InvalidKeyError('Signing or verifying key is required')
+
+        key = PreparedKey(kid, algorithm, signing_key, verifying_key)
+        self.keys[kid] = key
+        if signing_key is not None and (use_for_signing or self.signing is None):
+            self.signing = key
+        return key
+
+    def remove_key(self, kid: str | None) -> None:
+        key = self.keys.pop(kid, None)
+        if key is not None and key is self.signing:
+            self.signing = None
+
+    def get_signing_key(self) -> PreparedKey:
+        if self.signing is None:
+            raise InvalidKeyError('No signing key')
+        return self.signing
+
+    def get_verifying_key(self, kid: str | None) -> PreparedKey:
+        key = self.keys.get(kid)
+        if key is None:
+            raise InvalidKeyError(f'Unknown key id {kid}')
+        return key
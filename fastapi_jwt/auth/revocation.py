@@ -0,0 +1,66 @@
+import heapq
+import logging
+import time
+
+
+logger = logging.getLogger(__name__)
+
+
+class RevocationList:
+    """
+    IN-MEMORY SET OF REVOKED ACCESS TOKEN "jti" CLAIMS, CHECK IS ONE DICT LOOKUP
+    ENTRY IS DROPPED WHEN TOKEN "exp" PASSES, EXPIRED TOKEN IS REJECTED BY decode_jwt ANYWAY
+    NOT EXPIRED ENTRY IS NEVER DROPPED, DROPPING IT WOULD LET REVOKED TOKEN THROUGH
+    max_size IS A SOFT LIMIT, ABOVE IT EXPIRED ENTRIES ARE PRUNED AND overflowed IS SET WHILE LIST STAYS ABOVE IT
+    """
+
+    def __init__(self, max_size: int = 100000):
+        self.max_size = max_size
+        self.overflowed = False
+        self._entries: dict[str, int] = {}
+        self._expiry_heap: list[tuple[int, str]] = []
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, jti: str | None) -> bool:
+        return jti in self._entries
+
+    def add(self, jti: str, expires_at: int) -> None:
+        expires_at = int(expires_at)
+        if expires_at <= time.time() or self._entries.get(jti, 0) >= expires_at:
+            return
+        self._entries[jti] = expires_at
+        heapq.heappush(self._expiry_heap, (expires_at, jti))
+        if len(self._entries) > self.max_size:
+            self.prune()
+            if len(self._entries) > self.max_size and not self.overflowed:
+                logger.warning('Revocation list holds %s not expired tokens, max_size is %s', len(self._entries), self.max_size)
+                self.overflowed = True
+
+    def update(self, entries: list[tuple[str, int]]) -> None:
+        for jti, expires_at in entries:
+            self.add(jti, expires_at)
+
+    def prune(self) -> int:
+        """ REMOVES EXPIRED ENTRIES, RETURNS REMOVED COUNT """
+        now = time.time()
+        removed = 0
+        while self._expiry_heap and self._expiry_heap[0][0] <= now:
+            removed += self._pop_earliest()
+        if self.overflowed and len(self._entries) <= self.max_size:
+            self.overflowed = False
+        return removed
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._expiry_heap.clear()
+        self.overflowed = False
+
+    def _pop_earliest(self) -> int:
+        expires_at, jti = heapq.heappop(self._expiry_heap)
+        if self._entries.get(jti) != expires_at:
+            """ STALE HEAP ENTRY, TOKEN WAS RE-ADDED WITH LATER exp """
+            return 0
+        del self._entries[jti]
+        return 1
@@ -0,0 +1,79 @@
+import base64
+import binascii
+import hashlib
+import hmac
+import json
+import time
+from functools import lru_cache
+
+from jwt.exceptions import (
+    DecodeError,
+    ExpiredSignatureError,
+    ImmatureSignatureError,
+    InvalidAlgorithmError,
+    InvalidSignatureError,
+)
+
+
+HMAC_ALGORITHMS = {
+    'HS256': hashlib.sha256,
+    'HS384': hashlib.sha384,
+    'HS512': hashlib.sha512,
+}
+
+
+def base64url_decode(value: str) -> bytes:
+    return base64.urlsafe_b64decode(value + '=' * (-len(value) % 4))
+
+
+class HMACVerifier:
+    """
+    FAST PATH FOR ONE CONFIGURED HMAC ALGORITHM
+    KEY IS HASHED INTO HMAC STATE ONCE, EVERY VERIFICATION ONLY COPIES IT
+    TOKEN IS SPLIT ONCE, SIGNATURE IS CHECKED BEFORE PAYLOAD IS PARSED
+    """
+
+    def __init__(self, secret: str | bytes, algorithm: str = 'HS256', leeway: float = 0):
+        if algorithm not in HMAC_ALGORITHMS:
+            raise InvalidAlgorithmError(f'Algorithm {algorithm} is not HMAC')
+        if isinstance(secret, str):
+            secret = secret.encode('utf-8')
+        self.algorithm = algorithm
+        self.leeway = leeway
+        self._hmac = hmac.new(secret, digestmod=HMAC_ALGORITHMS[algorithm])
+
+    def verify(self, token: str, verify_signature: bool = True, verify_exp: bool = True) -> dict:
+        if not isinstance(token, str):
+            raise DecodeError('Invalid token type')
+        signing_input, _, signature = token.rpartition('.')
+        header_segment, _, payload_segment = signing_input.partition('.')
+        if not header_segment or not payload_segment or '.' in payload_segment:
+            raise DecodeError('Not enough segments')
+        try:
+            header = json.loads(base64url_decode(header_segment))
+            if not isinstance(header, dict) or header.get('alg') != self.algorithm:
+                raise InvalidAlgorithmError('The specified alg value is not allowed')
+            if verify_signature:
+                mac = self._hmac.copy()
+                mac.update(signing_input.encode('ascii'))
+                if not hmac.compare_digest(mac.digest(), base64url_decode(signature)):
+                    raise InvalidSignatureError('Signature verification failed')
+            payload = json.loads(base64url_decode(payload_segment))
+        except (ValueError, binascii.Error, UnicodeError):
+            raise DecodeError('Invalid token')
+        if not isinstance(payload, dict):
+            raise DecodeError('Invalid payload')
+
+        now = time.time()
+        nbf = payload.get('nbf')
+        if nbf is not None and nbf > now + self.leeway:
+            raise ImmatureSignatureError('The token is not yet valid (nbf)')
+        exp = payload.get('exp')
+        if verify_exp and exp is not None and exp <= now - self.leeway:
+            raise ExpiredSignatureError('Signature has expired')
+        return payload
+
+
+@lru_cache(maxsize=32)
+def get_hmac_verifier(secret: str | bytes, algorithm: str) -> HMACVerifier:
+    return HMACVerifier(secret, algorithm)
@@ -4,3 +4,9 @@ class FailGetAttribute(Exception):
     def __init__(self, username_field: str, model):
         message = f'No field "{username_field}" in model {model}'
         super().__init__(message)
+
+
+class RevocationNotConfigured(Exception):
+    def __init__(self):
+        message = 'Access token revocation requires JWTService(revocation_repo=...)'
+        super().__init__(message)
@@ -0,0 +1,10 @@
+from fastapi_jwt.instrumentation.observer import (
+    MetricsObserver,
+    Observer,
+    StageSnapshot,
+    get_observer,
+    instrument,
+    record,
+    set_observer,
+)
+from fastapi_jwt.instrumentation.prometheus import PROMETHEUS_CONTENT_TYPE, render_prometheus
@@ -0,0 +1,135 @@
+import functools
+import inspect
+import threading
+from bisect import bisect_left
+from time import perf_counter
+from typing import Callable, NamedTuple
+
+from starlette.exceptions import HTTPException
+
+
+class Observer:
+
+    def observe(self, stage: str, duration: float, outcome: str) -> None:
+        raise NotImplementedError
+
+
+_observer: Observer | None = None
+
+
+def set_observer(observer: Observer | None) -> None:
+    global _observer
+    _observer = observer
+
+
+def get_observer() -> Observer | None:
+    return _observer
+
+
+HTTP_EXCEPTION_OUTCOMES = {
+    'Token expired': 'expired',
+    'Could not validate credentials': 'invalid',
+    'Credentials are not valid': 'invalid_credentials',
+}
+
+
+def get_outcome(exc: BaseException) -> str:
+    if isinstance(exc, HTTPException):
+        return HTTP_EXCEPTION_OUTCOMES.get(exc.detail, f'http_{exc.status_code}')
+    return 'error'
+
+
+def record(stage: str, outcome: str, duration: float = 0.0) -> None:
+    observer = _observer
+    if observer is not None:
+        observer.observe(stage, duration, outcome)
+
+
+def instrument(stage: str) -> Callable:
+    """ WITHOUT OBSERVER WRAPPER ONLY READS ONE GLOBAL AND CALLS FUNCTION """
+
+    def decorator(func: Callable) -> Callable:
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                observer = _observer
+                if observer is None:
+                    return await func(*args, **kwargs)
+                start = perf_counter()
+                try:
+                    result = await func(*args, **kwargs)
+                except BaseException as exc:
+                    observer.observe(stage, perf_counter() - start, get_outcome(exc))
+                    raise
+                observer.observe(stage, perf_counter() - start, 'ok')
+                return result
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            observer = _observer
+            if observer is None:
+                return func(*args, **kwargs)
+            start = perf_counter()
+            try:
+                result = func(*args, **kwargs)
+            except BaseException as exc:
+                observer.observe(stage, perf_counter() - start, get_outcome(exc))
+                raise
+            observer.observe(stage, perf_counter() - start, 'ok')
+            return result
+        return wrapper
+
+    return decorator
+
+
+DEFAULT_BUCKETS = (
+    0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5,
+)
+
+
+class StageMetrics:
+    __slots__ = ('count', 'total', 'bucket_counts')
+
+    def __init__(self, bucket_count: int):
+        self.count = 0
+        self.total = 0.0
+        self.bucket_counts = [0] * (bucket_count + 1)
+
+
+class StageSnapshot(NamedTuple):
+    stage: str
+    outcome: str
+    count: int
+    total: float
+    bucket_counts: list[int]
+
+
+class MetricsObserver(Observer):
+    """ AGGREGATES COUNT, TOTAL DURATION AND HISTOGRAM PER (stage, outcome) """
+
+    def __init__(self, buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.metrics: dict[tuple[str, str], StageMetrics] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, stage: str, duration: float, outcome: str) -> None:
+        with self._lock:
+            metrics = self.metrics.get((stage, outcome))
+            if metrics is None:
+                metrics = self.metrics[(stage, outcome)] = StageMetrics(len(self.buckets))
+            metrics.count += 1
+            metrics.total += duration
+            metrics.bucket_counts[bisect_left(self.buckets, duration)] += 1
+
+    def reset(self) -> None:
+        with self._lock:
+            self.metrics.clear()
+
+    def snapshot(self) -> list[StageSnapshot]:
+        """ CONSISTENT COPY SORTED BY (stage, outcome), bucket_counts ARE NOT CUMULATIVE, LAST ONE IS ABOVE ALL BUCKETS """
+        with self._lock:
+            return sorted(
+                StageSnapshot(stage, outcome, metrics.count, metrics.total, list(metrics.bucket_counts))
+                for (stage, outcome), metrics in self.metrics.items()
+            )
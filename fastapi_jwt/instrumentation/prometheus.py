@@ -0,0 +1,26 @@
+from fastapi_jwt.instrumentation.observer import MetricsObserver
+
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def escape_label(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def render_prometheus(observer: MetricsObserver, namespace: str = 'fastapi_jwt') -> str:
+    name = f'{namespace}_stage_duration_seconds'
+    lines = [
+        f'# HELP {name} Duration of fastapi_jwt auth stages.',
+        f'# TYPE {name} histogram',
+    ]
+    for stage, outcome, count, total, bucket_counts in observer.snapshot():
+        labels = f'stage="{escape_label(stage)}",outcome="{escape_label(outcome)}"'
+        cumulative = 0
+        for bound, bucket_count in zip(observer.buckets, bucket_counts):
+            cumulative += bucket_count
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {count}')
+        lines.append(f'{name}_sum{{{labels}}} {total}')
+        lines.append(f'{name}_count{{{labels}}} {count}')
+    return '\n'.join(lines) + '\n'
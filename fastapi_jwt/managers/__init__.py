@@ -1 +1,8 @@
+from fastapi_jwt.managers.executors import PasswordHashingExecutor
+from fastapi_jwt.managers.hashers import (
+    PBKDF2PasswordHasher,
+    PasswordHasher,
+    ScryptPasswordHasher,
+    calibrate_password_hasher,
+)
 from fastapi_jwt.managers.users import UserManager
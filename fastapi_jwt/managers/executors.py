@@ -0,0 +1,47 @@
+import asyncio
+import weakref
+from concurrent.futures import Executor
+from typing import Any, Callable
+
+from starlette import status
+from starlette.exceptions import HTTPException
+
+
+class PasswordHashingExecutor:
+    """
+    RUNS CPU BOUND PASSWORD HASHING OUTSIDE THE EVENT LOOP
+    executor=None MEANS THE LOOP DEFAULT THREAD POOL, ProcessPoolExecutor IS ALSO ACCEPTED
+    """
+
+    def __init__(
+            self,
+            executor: Executor | None = None,
+            max_concurrency: int = 4,
+            max_queue_size: int = 128,
+    ):
+        self.executor = executor
+        self.max_concurrency = max_concurrency
+        self.max_queue_size = max_queue_size
+        self.pending = 0
+        self._semaphores = weakref.WeakKeyDictionary()
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self._semaphores[loop] = asyncio.Semaphore(self.max_concurrency)
+        return semaphore
+
+    async def run(self, func: Callable, *args) -> Any:
+        if self.pending >= self.max_concurrency + self.max_queue_size:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail='Too many authentication requests',
+            )
+        self.pending += 1
+        try:
+            async with self._get_semaphore():
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(self.executor, func, *args)
+        finally:
+            self.pending -= 1
@@ -0,0 +1,186 @@
+"""
+SELF-DESCRIBING PASSWORD HASH FORMAT:
+pbkdf2_sha256$<iterations>$<salt>$<hash>
+scrypt$<n>$<r>$<p>$<salt>$<hash>
+SALT AND HASH ARE BASE64 WITHOUT PADDING
+OLD FORMAT (64 HEX HASH + 64 HEX SALT) IS STILL VERIFIED AS pbkdf2_sha256 WITH 100000 ITERATIONS
+"""
+import base64
+import hashlib
+import hmac
+import os
+import time
+
+
+""" hashlib.scrypt REJECTS maxmem ABOVE INT_MAX """
+SCRYPT_MAX_MEMORY = 2 ** 31 - 1
+""" STORED PARAMS ABOVE THESE ARE REJECTED, SO A TAMPERED ROW CANNOT PIN A WORKER FOR MINUTES """
+PBKDF2_MAX_ITERATIONS = 10_000_000
+SCRYPT_MAX_WORK = 2 ** 26
+
+
+def b64encode(value: bytes) -> str:
+    return base64.b64encode(value).decode('ascii').rstrip('=')
+
+
+def b64decode(value: str) -> bytes:
+    return base64.b64decode(value + '=' * (-len(value) % 4))
+
+
+class PasswordHasher:
+    algorithm = None
+    salt_size = 16
+
+    @property
+    def params(self) -> tuple:
+        raise NotImplementedError
+
+    def hash(self, password: str, salt: bytes) -> bytes:
+        raise NotImplementedError
+
+    def encode(self, password: str) -> str:
+        salt = os.urandom(self.salt_size)
+        params = '$'.join(str(param) for param in self.params[1:])
+        return f'{self.algorithm}${params}${b64encode(salt)}${b64encode(self.hash(password, salt))}'
+
+    @classmethod
+    def decode(cls, encoded: str) -> tuple['PasswordHasher', bytes, bytes]:
+        """ RETURNS (hasher with stored params, salt, hash) """
+        raise NotImplementedError
+
+    @classmethod
+    def calibrate(cls, target_seconds: float = 0.1) -> 'PasswordHasher':
+        raise NotImplementedError
+
+
+class PBKDF2PasswordHasher(PasswordHasher):
+    algorithm = 'pbkdf2_sha256'
+
+    def __init__(self, iterations: int = 100000):
+        self.iterations = iterations
+
+    @property
+    def params(self) -> tuple:
+        return self.algorithm, self.iterations
+
+    def hash(self, password: str, salt: bytes) -> bytes:
+        return hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), salt, self.iterations)
+
+    @classmethod
+    def decode(cls, encoded: str) -> tuple[PasswordHasher, bytes, bytes]:
+        _, iterations, salt, password_hash = encoded.split('$')
+        if not 0 < int(iterations) <= PBKDF2_MAX_ITERATIONS:
+            raise ValueError(f'PBKDF2 iterations {iterations} are out of range')
+        return cls(int(iterations)), b64decode(salt), b64decode(password_hash)
+
+    @classmethod
+    def calibrate(cls, target_seconds: float = 0.1, sample_iterations: int = 20000) -> 'PBKDF2PasswordHasher':
+        """ PBKDF2 COST IS LINEAR IN ITERATIONS, SO ONE MEASURED SAMPLE IS SCALED """
+        sample = cls(sample_iterations)
+        salt = os.urandom(cls.salt_size)
+        elapsed = min(measure(sample, salt) for _ in range(3))
+        iterations = int(sample_iterations * target_seconds / elapsed)
+        return cls(min(max(10000, round(iterations, -3)), PBKDF2_MAX_ITERATIONS))
+
+
+class ScryptPasswordHasher(PasswordHasher):
+    algorithm = 'scrypt'
+
+    def __init__(self, n: int = 2 ** 14, r: int = 8, p: int = 1):
+        self.n = n
+        self.r = r
+        self.p = p
+
+    @property
+    def params(self) -> tuple:
+        return self.algorithm, self.n, self.r, self.p
+
+    def hash(self, password: str, salt: bytes) -> bytes:
+        return hashlib.scrypt(
+            password.encode('utf-8'),
+            salt=salt,
+            n=self.n,
+            r=self.r,
+            p=self.p,
+            maxmem=min(self.memory, SCRYPT_MAX_MEMORY),
+            dklen=32,
+        )
+
+    @property
+    def memory(self) -> int:
+        """ BYTES OPENSSL ALLOCATES: 128 * r * p FOR B AND 128 * r * (n + 2) FOR V """
+        return 128 * self.r * (self.n + self.p + 2)
+
+    @classmethod
+    def decode(cls, encoded: str) -> tuple[PasswordHasher, bytes, bytes]:
+        _, n, r, p, salt, password_hash = encoded.split('$')
+        hasher = cls(int(n), int(r), int(p))
+        if hasher.n * hasher.r * hasher.p > SCRYPT_MAX_WORK:
+            raise ValueError(f'scrypt params n={n}, r={r}, p={p} are too expensive')
+        return hasher, b64decode(salt), b64decode(password_hash)
+
+    @classmethod
+    def calibrate(cls, target_seconds: float = 0.1, r: int = 8, p: int = 1, max_n: int = 2 ** 20) -> 'ScryptPasswordHasher':
+        """
+        SCRYPT n MUST BE POWER OF TWO, IT IS DOUBLED UNTIL TARGET IS REACHED
+        n STOPS BELOW max_n, BELOW WHAT FITS INTO SCRYPT_MAX_MEMORY AND WITHIN SCRYPT_MAX_WORK FOR GIVEN r AND p
+        """
+        salt = os.urandom(cls.salt_size)
+        n = 2 ** 10
+        while (
+                n * 2 <= max_n
+                and cls(n * 2, r, p).memory <= SCRYPT_MAX_MEMORY
+                and n * 2 * r * p <= SCRYPT_MAX_WORK
+                and measure(cls(n, r, p), salt) < target_seconds
+        ):
+            n *= 2
+        return cls(n, r, p)
+
+
+HASHERS = {
+    PBKDF2PasswordHasher.algorithm: PBKDF2PasswordHasher,
+    ScryptPasswordHasher.algorithm: ScryptPasswordHasher,
+}
+
+
+def measure(hasher: PasswordHasher, salt: bytes) -> float:
+    start = time.perf_counter()
+    hasher.hash('calibration password', salt)
+    return time.perf_counter() - start
+
+
+def is_legacy_password(encoded: str) -> bool:
+    return '$' not in encoded and len(encoded) == 128
+
+
+def decode_password(encoded: str) -> tuple[PasswordHasher, bytes, bytes]:
+    if is_legacy_password(encoded):
+        """ first 64 characters is password, last 64 is salt """
+        return PBKDF2PasswordHasher(100000), bytes.fromhex(encoded[64:]), bytes.fromhex(encoded[:64])
+    return HASHERS[encoded.split('$', 1)[0]].decode(encoded)
+
+
+def verify_password(password: str, encoded: str) -> bool:
+    """
+    STORED PARAMS ARE NOT TRUSTED, HASH WITH INVALID OR TOO EXPENSIVE PARAMS DOES NOT MATCH
+    TOO EXPENSIVE: PBKDF2 ITERATIONS ABOVE PBKDF2_MAX_ITERATIONS, SCRYPT n * r * p ABOVE SCRYPT_MAX_WORK OR MEMORY ABOVE SCRYPT_MAX_MEMORY
+    """
+    try:
+        hasher, salt, password_hash = decode_password(encoded)
+        return hmac.compare_digest(hasher.hash(password, salt), password_hash)
+    except (KeyError, ValueError, MemoryError):
+        return False
+
+
+def needs_rehash(encoded: str, hasher: PasswordHasher) -> bool:
+    if is_legacy_password(encoded):
+        return True
+    try:
+        stored_hasher, _, _ = decode_password(encoded)
+    except (KeyError, ValueError):
+        return False
+    return stored_hasher.params != hasher.params
+
+
+def calibrate_password_hasher(algorithm: str = PBKDF2PasswordHasher.algorithm, target_seconds: float = 0.1) -> PasswordHasher:
+    return HASHERS[algorithm].calibrate(target_seconds)
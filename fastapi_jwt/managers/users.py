@@ -1,57 +1,112 @@
-import hashlib
 import os
 
 from starlette import status
 from starlette.exceptions import HTTPException
 
-from fastapi_jwt.auth.jwt import decode_jwt
+from fastapi_jwt.auth.cache import AccessTokenCache
+from fastapi_jwt.auth.jwt import decode_jwt, get_verifying_key_id
+from fastapi_jwt.auth.keys import JWTKeySet
+from fastapi_jwt.auth.revocation import RevocationList
+from fastapi_jwt.instrumentation.observer import instrument
+from fastapi_jwt.managers.executors import PasswordHashingExecutor
+from fastapi_jwt.managers.hashers import PasswordHasher, PBKDF2PasswordHasher, needs_rehash, verify_password
 
 
 class UserManager:
+    password_executor = PasswordHashingExecutor()
+    password_hasher: PasswordHasher = PBKDF2PasswordHasher()
+    _dummy_passwords: dict[tuple, str] = {}
+    access_token_cache: AccessTokenCache | None = None
+    jwt_access_keys: JWTKeySet | None = None
+    revocation_list: RevocationList | None = None
+    verify_signature: bool = True
 
     @staticmethod
     def get_user_info_from_access_token(
             access_token: str,
-            jwt_access_secret_key: str = 'JWT',
+            jwt_access_secret_key: str | JWTKeySet | None = None,
             algorithm: str = 'HS256',
     ) -> dict:
-        access_token_data = decode_jwt(
-            encoded_jwt=access_token,
-            secret=jwt_access_secret_key,
-            algorithm=algorithm,
-        )
+        if jwt_access_secret_key is None:
+            jwt_access_secret_key = UserManager.jwt_access_keys or 'JWT'
+        cache = UserManager.access_token_cache
+        if not UserManager.verify_signature:
+            """ UNVERIFIED PAYLOAD MUST NOT BE SERVED FROM CACHE AS A VERIFIED ONE """
+            cache = None
+        access_token_data = key_id = None
+        if cache is not None and access_token:
+            key_id = get_verifying_key_id(access_token, jwt_access_secret_key)
+            access_token_data = cache.get(access_token, key_id)
+        if access_token_data is None:
+            access_token_data = decode_jwt(
+                encoded_jwt=access_token,
+                secret=jwt_access_secret_key,
+                algorithm=algorithm,
+                verify_signature=UserManager.verify_signature,
+            )
+            if cache is not None:
+                cache.set(access_token, access_token_data, key_id)
+        revocation_list = UserManager.revocation_list
+        if revocation_list is not None and access_token_data.get('jti') in revocation_list:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail='Token has been revoked',
+                headers={'WWW-Authenticate': 'Bearer'},
+            )
         return {
             'user_id': int(access_token_data.get('sub')),
         }
 
     @staticmethod
-    def make_password(value: str) -> str:
+    def validate_password(value: str) -> None:
         if len(value) < 4:
             raise HTTPException(
                 status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
                 detail='Length password must be >= 4',
             )
-        salt = os.urandom(32)
-        password_hash = hashlib.pbkdf2_hmac(
-            'sha256',
-            value.encode('utf-8'),
-            salt,
-            100000,
-        )
-        """ first 64 characters is password, last 64 is salt """
-        hashed_password = '%s%s' % (password_hash.hex(), salt.hex())
-        return hashed_password
+
+    @staticmethod
+    def make_password(value: str) -> str:
+        UserManager.validate_password(value)
+        return UserManager.password_hasher.encode(value)
 
     @staticmethod
     def check_password(input_password: str, password_from_db: str) -> bool:
-        salt_from_db = bytes.fromhex(password_from_db[-64:])
-        user_input_password_hash = hashlib.pbkdf2_hmac(
-            'sha256',
-            input_password.encode('utf-8'),
-            salt_from_db,
-            100000,
+        return verify_password(input_password, password_from_db)
+
+    @staticmethod
+    def get_dummy_password() -> str:
+        hasher = UserManager.password_hasher
+        dummy_password = UserManager._dummy_passwords.get(hasher.params)
+        if dummy_password is None:
+            dummy_password = UserManager._dummy_passwords[hasher.params] = hasher.encode(os.urandom(16).hex())
+        return dummy_password
+
+    @staticmethod
+    def needs_rehash(password_from_db: str) -> bool:
+        return needs_rehash(password_from_db, UserManager.password_hasher)
+
+    @classmethod
+    async def aget_dummy_password(cls) -> str:
+        """ FIRST CALL PER HASHER HASHES IN PASSWORD EXECUTOR, NOT ON THE EVENT LOOP """
+        hasher = cls.password_hasher
+        dummy_password = cls._dummy_passwords.get(hasher.params)
+        if dummy_password is None:
+            dummy_password = await cls.password_executor.run(hasher.encode, os.urandom(16).hex())
+            dummy_password = cls._dummy_passwords.setdefault(hasher.params, dummy_password)
+        return dummy_password
+
+    @classmethod
+    async def amake_password(cls, value: str) -> str:
+        """ HASHER IS PASSED EXPLICITLY, SO PROCESS POOL WORKERS USE CONFIGURED POLICY """
+        cls.validate_password(value)
+        return await cls.password_executor.run(cls.password_hasher.encode, value)
+
+    @classmethod
+    @instrument('check_password')
+    async def acheck_password(cls, input_password: str, password_from_db: str) -> bool:
+        return await cls.password_executor.run(
+            verify_password,
+            input_password,
+            password_from_db,
         )
-        user_input_full_hashed_password = f'{user_input_password_hash.hex()}{salt_from_db.hex()}'
-        if user_input_full_hashed_password == password_from_db:
-            return True
-        return False
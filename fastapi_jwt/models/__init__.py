@@ -1 +1,3 @@
 from fastapi_jwt.models.jwt import RefreshToken
+from fastapi_jwt.models.jwt import RefreshTokenGrace
+from fastapi_jwt.models.jwt import RevokedAccessToken
@@ -1,9 +1,38 @@
-from sqlalchemy import Integer, String
-from sqlalchemy.orm import Mapped, mapped_column
+from datetime import datetime
+
+from sqlalchemy import DateTime, Index, Integer, String, Text
+from sqlalchemy.orm import Mapped, declared_attr, mapped_column
 
 
 class RefreshToken:
     __tablename__ = 'refresh_token'
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
-    token: Mapped[str] = mapped_column(String(200), nullable=False)
+    token_digest: Mapped[str] = mapped_column(String(64), nullable=False, unique=True)
+    expires_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True, index=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, default=datetime.utcnow)
+
+    @declared_attr.directive
+    def __table_args__(cls) -> tuple:
+        """ ALSO SERVES LOOKUPS BY user_id ONLY """
+        return (
+            Index(f'ix_{cls.__tablename__}_user_id_created_at', 'user_id', 'created_at', 'id'),
+        )
+
+
+class RefreshTokenGrace:
+    """ ROTATED TOKEN DIGEST -> OWNER AND SEALED REPLACEMENT TOKEN FOR GRACE WINDOW, SEE seal_replacement_token """
+    __tablename__ = 'refresh_token_grace'
+
+    token_digest: Mapped[str] = mapped_column(String(64), primary_key=True)
+    user_id: Mapped[int] = mapped_column(Integer, nullable=False)
+    sealed_token: Mapped[str] = mapped_column(Text, nullable=False)
+    expires_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, index=True)
+
+
+class RevokedAccessToken:
+    __tablename__ = 'revoked_access_token'
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    jti: Mapped[str] = mapped_column(String(64), nullable=False, unique=True)
+    expires_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, index=True)
@@ -0,0 +1,37 @@
+import asyncio
+import inspect
+from typing import Any, Callable
+
+from redis.asyncio import ConnectionPool, Redis
+from redis.client import Redis as SyncRedis
+
+
+class RedisRepository:
+    """ ACCEPTS redis.asyncio CLIENT, SYNC CLIENT CALLS ARE OFFLOADED TO A THREAD SO THEY DO NOT BLOCK THE LOOP """
+
+    def __init__(self, redis: Redis | SyncRedis):
+        self.redis = redis
+        self.is_async = inspect.iscoroutinefunction(redis.execute_command)
+
+    @classmethod
+    def from_url(
+            cls,
+            url: str,
+            max_connections: int = 50,
+            socket_timeout: float | None = 5,
+            socket_connect_timeout: float | None = 5,
+            **kwargs,
+    ):
+        pool = ConnectionPool.from_url(
+            url,
+            max_connections=max_connections,
+            socket_timeout=socket_timeout,
+            socket_connect_timeout=socket_connect_timeout,
+            **kwargs,
+        )
+        return cls(Redis(connection_pool=pool))
+
+    async def execute(self, func: Callable, *args, **kwargs) -> Any:
+        if self.is_async:
+            return await func(*args, **kwargs)
+        return await asyncio.to_thread(func, *args, **kwargs)
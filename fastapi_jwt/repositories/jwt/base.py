@@ -1,12 +1,208 @@
+import base64
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import AsyncIterable, AsyncIterator, Callable, Iterable, NamedTuple
+
+from fastapi_jwt.auth.jwt import get_token_digest
+
+
+class RefreshTokenRotation(NamedTuple):
+    owner_id: int | None
+    """ SET WHEN OLD TOKEN WAS ALREADY ROTATED WITHIN GRACE WINDOW, NEW TOKEN IS NOT SAVED THEN """
+    replacement_token: str | None = None
+
+
+class SessionInfo(NamedTuple):
+    """ METADATA OF ONE STORED REFRESH TOKEN, THE TOKEN ITSELF IS NEVER STORED, TIMES ARE NAIVE UTC """
+    token_digest: str
+    created_at: datetime
+    expires_at: datetime | None
+
+
+def get_grace_keystream(old_token: str, size: int) -> bytes:
+    """ DIFFERENT FROM get_token_digest, SO STORED DIGEST OF OLD TOKEN DOES NOT REVEAL THE KEY """
+    return hashlib.shake_256(b'refresh_token_grace:' + old_token.encode('utf-8')).digest(size)
+
+
+def seal_replacement_token(old_token: str, replacement_token: str) -> str:
+    """
+    SHARED STORES KEEP REPLACEMENT TOKEN ENCRYPTED WITH A KEY DERIVED FROM THE OLD TOKEN
+    STORE ITSELF HOLDS ONLY sha256(old token), SO ITS CONTENT ALONE DOES NOT REVEAL A USABLE TOKEN
+    WHOEVER PRESENTS THE OLD TOKEN WITHIN GRACE WINDOW STILL GETS THE REPLACEMENT, THAT IS WHAT GRACE MEANS
+    OLD TOKEN IS ROTATED ONCE, SO EVERY KEY IS USED FOR ONE RECORD ONLY
+    """
+    data = replacement_token.encode('utf-8')
+    sealed = int.from_bytes(data, 'big') ^ int.from_bytes(get_grace_keystream(old_token, len(data)), 'big')
+    return base64.urlsafe_b64encode(sealed.to_bytes(len(data), 'big')).decode('ascii')
+
+
+def open_replacement_token(old_token: str, sealed_token: str) -> str:
+    data = base64.urlsafe_b64decode(sealed_token)
+    opened = int.from_bytes(data, 'big') ^ int.from_bytes(get_grace_keystream(old_token, len(data)), 'big')
+    return opened.to_bytes(len(data), 'big').decode('utf-8')
+
+
+class RotationGraceCache:
+    """
+    OLD TOKEN DIGEST -> (OWNER ID, REPLACEMENT TOKEN) FOR A FEW SECONDS AFTER ROTATION
+    KEPT IN PROCESS MEMORY, SO IT COVERS ONLY ROTATIONS MADE BY THIS PROCESS
+    REPLACEMENT TOKEN IS KEPT IN PLAIN TEXT, LIKE TOKENS OF REQUESTS IN FLIGHT, IT IS NEVER WRITTEN OUT OF THE PROCESS
+    """
+
+    def __init__(self):
+        self._entries: OrderedDict[str, tuple[int, str, float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def set(self, digest: str, owner_id: int, replacement_token: str, grace_seconds: float) -> None:
+        now = time.time()
+        with self._lock:
+            """ GRACE IS THE SAME FOR ALL ENTRIES, SO OLDEST ENTRIES EXPIRE FIRST """
+            while self._entries and next(iter(self._entries.values()))[2] <= now:
+                self._entries.popitem(last=False)
+            self._entries[digest] = (owner_id, replacement_token, now + grace_seconds)
+
+    def get(self, digest: str) -> RefreshTokenRotation | None:
+        with self._lock:
+            entry = self._entries.get(digest)
+        if entry is None or entry[2] <= time.time():
+            return
+        return RefreshTokenRotation(entry[0], entry[1])
+
+
+async def iter_chunks(items: Iterable | AsyncIterable, chunk_size: int) -> AsyncIterator[list]:
+    chunk = []
+    if isinstance(items, AsyncIterable):
+        async for item in items:
+            chunk.append(item)
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+    else:
+        for item in items:
+            chunk.append(item)
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+    if chunk:
+        yield chunk
 
 
 class JWTBaseRepository:
 
-    async def save_refresh_token(self, user_id: int, token: str) -> None:
+    async def save_refresh_token(
+            self,
+            user_id: int,
+            token: str,
+            lifetime_seconds: int | None = None,
+            max_sessions: int | None = None,
+    ) -> None:
         raise NotImplementedError
 
+    async def save_refresh_tokens(
+            self,
+            tokens: list[tuple[int, str]],
+            lifetime_seconds: int | None = None,
+            max_sessions: int | None = None,
+    ) -> None:
+        """
+        tokens: [(user_id, token), ...], BACKENDS OVERRIDE IT WITH ONE ROUND TRIP
+        max_sessions: OLDEST TOKENS OF USER ABOVE THIS NUMBER ARE DELETED IN THE SAME WRITE
+        """
+        for user_id, token in tokens:
+            await self.save_refresh_token(user_id, token, lifetime_seconds, max_sessions)
+
     async def delete_refresh_token(self, token: str) -> int | None:
         raise NotImplementedError
 
     async def delete_all_user_refresh_tokens(self, user_id) -> None:
         raise NotImplementedError
+
+    def iter_user_sessions(self, user_id: int, page_size: int = 100) -> AsyncIterator[SessionInfo]:
+        """ ACTIVE SESSIONS OF USER, OLDEST FIRST, READ page_size AT A TIME """
+        raise NotImplementedError
+
+    async def delete_all_refresh_tokens_for_users(
+            self,
+            user_ids: Iterable[int] | AsyncIterable[int],
+            chunk_size: int = 1000,
+            progress: Callable[[int, int], None] | None = None,
+    ) -> int:
+        """
+        REVOKES ALL SESSIONS OF MANY USERS, user_ids ARE CONSUMED IN CHUNKS SO INPUT MAY BE A STREAM
+        progress(USERS DONE, TOKENS DELETED) IS CALLED AFTER EVERY CHUNK, RETURNS TOKENS DELETED
+        """
+        users_done = 0
+        deleted = 0
+        async for chunk in iter_chunks(user_ids, chunk_size):
+            deleted += await self.delete_refresh_tokens_for_users_batch(chunk)
+            users_done += len(chunk)
+            if progress is not None:
+                progress(users_done, deleted)
+        return deleted
+
+    async def delete_refresh_tokens_for_users_batch(self, user_ids: list[int]) -> int:
+        """ ONE ROUND TRIP FOR THE WHOLE CHUNK IN BACKENDS, THIS FALLBACK DOES NOT KNOW DELETED COUNT """
+        for user_id in user_ids:
+            await self.delete_all_user_refresh_tokens(user_id)
+        return 0
+
+    async def rotate_refresh_token(
+            self,
+            old_token: str,
+            new_token: str,
+            user_id: int | None,
+            lifetime_seconds: int | None = None,
+    ) -> int | None:
+        """
+        DELETE OLD TOKEN AND SAVE NEW ONE, RETURNING OWNER ID OF OLD TOKEN
+        IF OLD TOKEN DOES NOT EXIST ALL USER TOKENS ARE DELETED BEFORE SAVING NEW ONE
+        user_id=None (OPAQUE TOKENS): NEW TOKEN GETS OWNER OF OLD ONE, NOTHING IS SAVED IF OLD TOKEN DOES NOT EXIST
+        THIS FALLBACK IS NOT ATOMIC, BACKENDS OVERRIDE IT
+        """
+        owner_id = await self.delete_refresh_token(old_token)
+        if user_id is None:
+            if not owner_id:
+                return
+            user_id = owner_id
+        elif not owner_id:
+            await self.delete_all_user_refresh_tokens(user_id)
+        await self.save_refresh_token(user_id, new_token, lifetime_seconds)
+        return owner_id
+
+    @property
+    def rotation_grace_cache(self) -> RotationGraceCache:
+        if '_rotation_grace_cache' not in self.__dict__:
+            self._rotation_grace_cache = RotationGraceCache()
+        return self._rotation_grace_cache
+
+    async def rotate_refresh_token_with_grace(
+            self,
+            old_token: str,
+            new_token: str,
+            user_id: int | None,
+            lifetime_seconds: int | None = None,
+            grace_seconds: float = 10,
+    ) -> RefreshTokenRotation:
+        """
+        SAME AS rotate_refresh_token, BUT OLD TOKEN ROTATED LESS THAN grace_seconds AGO
+        RETURNS ITS REPLACEMENT INSTEAD OF DELETING ALL USER TOKENS
+        THIS FALLBACK KEEPS GRACE WINDOW IN PROCESS MEMORY, BACKENDS MAY SHARE IT BETWEEN PROCESSES
+        """
+        digest = get_token_digest(old_token)
+        rotation = self.rotation_grace_cache.get(digest)
+        if rotation is not None:
+            return rotation
+        owner_id = await self.rotate_refresh_token(old_token, new_token, user_id, lifetime_seconds)
+        if owner_id:
+            self.rotation_grace_cache.set(digest, owner_id, new_token, grace_seconds)
+        return RefreshTokenRotation(owner_id)
+
+    async def get_rotation(self, token: str) -> RefreshTokenRotation | None:
+        """ ROTATION OF token MADE WITHIN GRACE WINDOW, IF ANY """
+        return self.rotation_grace_cache.get(get_token_digest(token))
+
+    async def delete_expired_refresh_tokens(self, limit: int) -> int:
+        raise NotImplementedError
@@ -1,24 +1,387 @@
-from redis.client import Redis
+import math
+import time
+from datetime import datetime
+from typing import Any, AsyncIterator
 
-from fastapi_jwt.repositories.jwt.base import JWTBaseRepository
+from redis.asyncio import Redis
+from redis.asyncio.client import Pipeline
+from redis.client import Pipeline as SyncPipeline, Redis as SyncRedis
+from redis.commands.core import AsyncScript, Script
 
+from fastapi_jwt.auth.jwt import get_token_digest, get_unverified_exp
+from fastapi_jwt.instrumentation.observer import instrument
+from fastapi_jwt.repositories.cache import RedisRepository
+from fastapi_jwt.repositories.jwt.base import (
+    JWTBaseRepository,
+    RefreshTokenRotation,
+    SessionInfo,
+    open_replacement_token,
+    seal_replacement_token,
+)
 
-class JWTRepository(JWTBaseRepository):
 
-    def __init__(self, redis: Redis):
-        self.redis = redis
+SAVE_REFRESH_TOKEN_SCRIPT = """
+local lifetime = tonumber(ARGV[4])
+if lifetime then
+    redis.call('SET', KEYS[1], ARGV[1], 'EX', lifetime)
+else
+    redis.call('SET', KEYS[1], ARGV[1])
+end
+redis.call('ZADD', KEYS[2], ARGV[3], ARGV[2])
+if lifetime then
+    redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', tonumber(ARGV[3]) - lifetime)
+    redis.call('EXPIRE', KEYS[2], lifetime)
+end
+local excess = redis.call('ZCARD', KEYS[2]) - tonumber(ARGV[5])
+if excess > 0 then
+    local oldest = redis.call('ZPOPMIN', KEYS[2], excess)
+    for i = 1, #oldest, 2 do
+        redis.call('DEL', ARGV[6] .. oldest[i])
+    end
+end
+return excess
+"""
 
-    async def save_refresh_token(self, user_id: int, token: str) -> None:
-        self.redis.set(f'{user_id},{token}', 1)
+DELETE_REFRESH_TOKEN_SCRIPT = """
+local user_id = redis.call('GET', KEYS[1])
+if not user_id then
+    return nil
+end
+redis.call('DEL', KEYS[1])
+redis.call('ZREM', KEYS[2] or (ARGV[1] .. user_id), ARGV[2])
+return user_id
+"""
 
+DELETE_ALL_USER_REFRESH_TOKENS_SCRIPT = """
+local digests = redis.call('ZRANGE', KEYS[1], 0, -1)
+for _, digest in ipairs(digests) do
+    redis.call('DEL', ARGV[1] .. digest)
+end
+redis.call('DEL', KEYS[1])
+return #digests
+"""
+
+ROTATE_REFRESH_TOKEN_SCRIPT = """
+local owner_id = redis.call('GET', KEYS[1])
+local grace = tonumber(ARGV[8])
+if not owner_id and grace then
+    local rotation = redis.call('GET', KEYS[3])
+    if rotation then
+        local separator = string.find(rotation, ':', 1, true)
+        return {string.sub(rotation, 1, separator - 1), string.sub(rotation, separator + 1)}
+    end
+end
+local user_id = ARGV[5]
+if user_id == '' then
+    if not owner_id then
+        return {false, false}
+    end
+    user_id = owner_id
+end
+local user_key = KEYS[4] or (ARGV[2] .. user_id)
+if owner_id then
+    redis.call('DEL', KEYS[1])
+    redis.call('ZREM', owner_id == user_id and user_key or (ARGV[2] .. owner_id), ARGV[3])
+else
+    local digests = redis.call('ZRANGE', user_key, 0, -1)
+    for _, digest in ipairs(digests) do
+        redis.call('DEL', ARGV[1] .. digest)
+    end
+    redis.call('DEL', user_key)
+end
+local lifetime = tonumber(ARGV[7])
+if lifetime then
+    redis.call('SET', KEYS[2], user_id, 'EX', lifetime)
+    redis.call('ZREMRANGEBYSCORE', user_key, '-inf', tonumber(ARGV[6]) - lifetime)
+else
+    redis.call('SET', KEYS[2], user_id)
+end
+redis.call('ZADD', user_key, ARGV[6], ARGV[4])
+if lifetime then
+    redis.call('EXPIRE', user_key, lifetime)
+end
+if owner_id and grace then
+    redis.call('SET', KEYS[3], owner_id .. ':' .. ARGV[9], 'EX', grace)
+end
+return {owner_id, false}
+"""
+
+
+class JWTRepository(RedisRepository, JWTBaseRepository):
+    """
+    KEY LAYOUT:
+    {token_key_prefix}{sha256(token)} -> user_id, EXPIRES WITH THE TOKEN
+    {user_key_prefix}{user_id} -> sorted set of token digests scored by issue time
+    {grace_key_prefix}{sha256(old token)} -> "{user_id}:{sealed new token}" FOR GRACE WINDOW AFTER ROTATION
+    NEW TOKEN IS SEALED WITH THE OLD ONE, SEE seal_replacement_token
+
+    SEE RedisRepository FOR ACCEPTED CLIENTS
+    """
+    token_key_prefix = 'refresh_token:'
+    user_key_prefix = 'user_refresh_tokens:'
+    grace_key_prefix = 'refresh_token_grace:'
+
+    def __init__(self, redis: Redis | SyncRedis):
+        super().__init__(redis)
+        self._save_refresh_token = redis.register_script(SAVE_REFRESH_TOKEN_SCRIPT)
+        self._delete_refresh_token = redis.register_script(DELETE_REFRESH_TOKEN_SCRIPT)
+        self._delete_all_user_refresh_tokens = redis.register_script(
+            DELETE_ALL_USER_REFRESH_TOKENS_SCRIPT,
+        )
+        self._rotate_refresh_token = redis.register_script(ROTATE_REFRESH_TOKEN_SCRIPT)
+
+    async def queue_script(self, pipeline: Any, script: Script | AsyncScript, keys: list, args: list) -> None:
+        """
+        Pipeline LOADS REGISTERED SCRIPTS BEFORE EXECUTING, CLUSTER PIPELINES DO NOT
+        AND THEIR EVALSHA FAILS WITH NOSCRIPT ON NODES THAT HAVE NOT SEEN THE SCRIPT, SO THEY GET SCRIPT BODY
+        """
+        if isinstance(pipeline, (Pipeline, SyncPipeline)):
+            queued = script(keys=keys, args=args, client=pipeline)
+            if self.is_async:
+                """ ASYNC SCRIPT CALL ONLY QUEUES COMMAND IN PIPELINE WHEN AWAITED """
+                await queued
+            return
+        pipeline.eval(script.script, len(keys), *keys, *args)
+
+    def get_token_key_prefix(self, user_id: int | None = None) -> str:
+        return self.token_key_prefix
+
+    def get_token_key(self, digest: str, user_id: int | None = None) -> str:
+        return f'{self.get_token_key_prefix(user_id)}{digest}'
+
+    def get_user_key(self, user_id: int) -> str:
+        return f'{self.user_key_prefix}{user_id}'
+
+    def get_grace_key(self, digest: str, user_id: int | None = None) -> str:
+        return f'{self.grace_key_prefix}{digest}'
+
+    def get_token_user_id(self, token: str) -> int | None:
+        """ USER ID IS NOT PART OF KEY IN THIS LAYOUT, SCRIPTS READ IT FROM TOKEN KEY """
+        return
+
+    async def save_refresh_token(
+            self,
+            user_id: int,
+            token: str,
+            lifetime_seconds: int | None = None,
+            max_sessions: int | None = None,
+    ) -> None:
+        await self.save_refresh_tokens([(user_id, token)], lifetime_seconds, max_sessions)
+
+    @instrument('jwt_repository.save_refresh_tokens')
+    async def save_refresh_tokens(
+            self,
+            tokens: list[tuple[int, str]],
+            lifetime_seconds: int | None = None,
+            max_sessions: int | None = None,
+    ) -> None:
+        now = time.time()
+        pipeline = self.redis.pipeline()
+        for index, (user_id, token) in enumerate(tokens):
+            digest = get_token_digest(token)
+            """ TOKENS OF ONE CALL GET INCREASING SCORES, ON EQUAL SCORES ZPOPMIN WOULD EVICT BY DIGEST ORDER """
+            score = now + index * 1e-6
+            if max_sessions:
+                """ CAP NEEDS COUNT AFTER INSERT, SO INSERT AND EVICTION RUN IN ONE SCRIPT """
+                await self.queue_script(
+                    pipeline,
+                    self._save_refresh_token,
+                    keys=[self.get_token_key(digest, user_id), self.get_user_key(user_id)],
+                    args=[user_id, digest, score, lifetime_seconds or '', max_sessions, self.get_token_key_prefix(user_id)],
+                )
+                continue
+            user_key = self.get_user_key(user_id)
+            pipeline.set(self.get_token_key(digest, user_id), user_id, ex=lifetime_seconds)
+            pipeline.zadd(user_key, {digest: score})
+            if lifetime_seconds:
+                """ DROP INDEX ENTRIES OF TOKENS THAT REDIS HAS ALREADY EXPIRED """
+                pipeline.zremrangebyscore(user_key, '-inf', now - lifetime_seconds)
+                pipeline.expire(user_key, lifetime_seconds)
+        await self.execute(pipeline.execute)
+
+    @instrument('jwt_repository.delete_refresh_token')
     async def delete_refresh_token(self, token: str) -> int | None:
-        key = self.redis.keys(f'*,{token}*')
-        if len(key) == 0:
+        digest = get_token_digest(token)
+        user_id = self.get_token_user_id(token)
+        keys = [self.get_token_key(digest, user_id)]
+        if user_id is not None:
+            keys.append(self.get_user_key(user_id))
+        user_id = await self.execute(
+            self._delete_refresh_token,
+            keys=keys,
+            args=[self.user_key_prefix, digest],
+        )
+        if user_id is None:
             return
-        self.redis.delete(key[0])
-        return int(key[0].decode('utf-8').split(',')[0])
+        return int(user_id)
 
+    @instrument('jwt_repository.delete_all_user_refresh_tokens')
     async def delete_all_user_refresh_tokens(self, user_id: int) -> None:
-        user_tokens = self.redis.keys(f'*{user_id},*')
-        for token in user_tokens:
-            self.redis.delete(token)
+        await self.execute(
+            self._delete_all_user_refresh_tokens,
+            keys=[self.get_user_key(user_id)],
+            args=[self.get_token_key_prefix(user_id)],
+        )
+
+    async def iter_user_sessions(self, user_id: int, page_size: int = 100) -> AsyncIterator[SessionInfo]:
+        """
+        READS USER INDEX BY ISSUE TIME page_size AT A TIME, EXPIRY COMES FROM TOKEN KEY TTL
+        DIGESTS ALREADY YIELDED WITH THE BOUNDARY SCORE ARE SKIPPED ON THE NEXT PAGE
+        """
+        user_key = self.get_user_key(user_id)
+        min_score = '-inf'
+        boundary_digests = set()
+        while True:
+            members = await self.execute(
+                self.redis.zrangebyscore,
+                user_key,
+                min_score,
+                '+inf',
+                start=0,
+                num=page_size + len(boundary_digests),
+                withscores=True,
+            )
+            page = [
+                (digest.decode('utf-8') if isinstance(digest, bytes) else digest, score)
+                for digest, score in members
+            ]
+            page = [(digest, score) for digest, score in page if digest not in boundary_digests]
+            pipeline = self.redis.pipeline()
+            for digest, _ in page:
+                pipeline.pttl(self.get_token_key(digest, user_id))
+            ttls = await self.execute(pipeline.execute) if page else []
+            now = time.time()
+            for (digest, score), ttl in zip(page, ttls):
+                if ttl == -2:
+                    """ TOKEN KEY EXPIRED, INDEX ENTRY IS STALE """
+                    continue
+                yield SessionInfo(
+                    digest,
+                    datetime.utcfromtimestamp(score),
+                    datetime.utcfromtimestamp(now + ttl / 1000) if ttl >= 0 else None,
+                )
+            if len(members) < page_size + len(boundary_digests):
+                return
+            last_score = page[-1][1]
+            if min_score != last_score:
+                boundary_digests = set()
+            boundary_digests.update(digest for digest, score in page if score == last_score)
+            min_score = last_score
+
+    @instrument('jwt_repository.delete_refresh_tokens_for_users_batch')
+    async def delete_refresh_tokens_for_users_batch(self, user_ids: list[int]) -> int:
+        """ ONE PIPELINE, SCRIPT DELETES TOKENS LISTED IN EACH USER INDEX """
+        pipeline = self.redis.pipeline()
+        for user_id in user_ids:
+            await self.queue_script(
+                pipeline,
+                self._delete_all_user_refresh_tokens,
+                keys=[self.get_user_key(user_id)],
+                args=[self.get_token_key_prefix(user_id)],
+            )
+        return sum(await self.execute(pipeline.execute))
+
+    @instrument('jwt_repository.rotate_refresh_token')
+    async def rotate_refresh_token(
+            self,
+            old_token: str,
+            new_token: str,
+            user_id: int | None,
+            lifetime_seconds: int | None = None,
+    ) -> int | None:
+        rotation = await self.rotate_refresh_token_with_grace(old_token, new_token, user_id, lifetime_seconds, 0)
+        return rotation.owner_id
+
+    @instrument('jwt_repository.rotate_refresh_token_with_grace')
+    async def rotate_refresh_token_with_grace(
+            self,
+            old_token: str,
+            new_token: str,
+            user_id: int | None,
+            lifetime_seconds: int | None = None,
+            grace_seconds: float = 10,
+    ) -> RefreshTokenRotation:
+        """
+        USER KEY IS RESOLVED INSIDE THE SCRIPT WHEN user_id IS NONE (OPAQUE TOKENS)
+        GRACE KEY IS CHECKED AND WRITTEN IN THE SAME SCRIPT, SO IT IS SHARED BY ALL PROCESSES
+        """
+        old_digest = get_token_digest(old_token)
+        new_digest = get_token_digest(new_token)
+        keys = [
+            self.get_token_key(old_digest, user_id),
+            self.get_token_key(new_digest, user_id),
+            self.get_grace_key(old_digest, user_id),
+        ]
+        if user_id is not None:
+            keys.append(self.get_user_key(user_id))
+        owner_id, replacement_token = await self.execute(
+            self._rotate_refresh_token,
+            keys=keys,
+            args=[
+                self.get_token_key_prefix(user_id),
+                self.user_key_prefix,
+                old_digest,
+                new_digest,
+                '' if user_id is None else user_id,
+                time.time(),
+                lifetime_seconds or '',
+                math.ceil(grace_seconds) or '',
+                seal_replacement_token(old_token, new_token) if grace_seconds else '',
+            ],
+        )
+        if owner_id is None:
+            return RefreshTokenRotation(None)
+        if replacement_token:
+            replacement_token = open_replacement_token(
+                old_token,
+                replacement_token.decode('ascii') if isinstance(replacement_token, bytes) else replacement_token,
+            )
+        return RefreshTokenRotation(int(owner_id), replacement_token)
+
+    async def get_rotation(self, token: str) -> RefreshTokenRotation | None:
+        grace_key = self.get_grace_key(get_token_digest(token), self.get_token_user_id(token))
+        rotation = await self.execute(self.redis.get, grace_key)
+        if rotation is None:
+            return
+        owner_id, _, sealed_token = (rotation.decode('ascii') if isinstance(rotation, bytes) else rotation).partition(':')
+        return RefreshTokenRotation(int(owner_id), open_replacement_token(token, sealed_token))
+
+    async def delete_expired_refresh_tokens(self, limit: int) -> int:
+        """ REDIS EXPIRES TOKENS NATIVELY """
+        return 0
+
+    async def migrate_legacy_keys(self, batch_size: int = 1000) -> int:
+        """ MOVES OLD "{user_id},{token}" KEYS TO THE INDEXED LAYOUT, RETURNS MIGRATED COUNT """
+        migrated = 0
+        cursor = None
+        while cursor != 0:
+            cursor, keys = await self.execute(self.redis.scan, cursor or 0, match='*,*', count=batch_size)
+            migrated += await self.migrate_legacy_keys_batch(keys)
+        return migrated
+
+    async def migrate_legacy_keys_batch(self, keys: list) -> int:
+        """ MIGRATED KEY EXPIRES WITH TOKEN "exp", ALREADY EXPIRED TOKENS ARE DELETED INSTEAD """
+        pipeline = self.redis.pipeline()
+        now = time.time()
+        deleted = 0
+        migrated = 0
+        for key in keys:
+            user_id, _, token = (key.decode('utf-8') if isinstance(key, bytes) else key).partition(',')
+            if not user_id.isdigit():
+                continue
+            pipeline.delete(key)
+            deleted += 1
+            exp = get_unverified_exp(token)
+            if exp is not None and exp <= now:
+                continue
+            digest = get_token_digest(token)
+            pipeline.set(
+                self.get_token_key(digest, int(user_id)),
+                user_id,
+                ex=math.ceil(exp - now) if exp is not None else None,
+            )
+            pipeline.zadd(self.get_user_key(int(user_id)), {digest: now})
+            migrated += 1
+        if deleted:
+            await self.execute(pipeline.execute)
+        return migrated
@@ -0,0 +1,99 @@
+import asyncio
+from collections import Counter
+from itertools import islice
+from typing import Iterable
+
+import jwt
+from redis.asyncio.cluster import RedisCluster
+from redis.cluster import RedisCluster as SyncRedisCluster
+from redis.crc import key_slot
+
+from fastapi_jwt.repositories.jwt.base import RefreshTokenRotation, iter_chunks
+from fastapi_jwt.repositories.jwt.cache import JWTRepository
+
+
+class ClusterJWTRepository(JWTRepository):
+    """
+    REDIS CLUSTER LAYOUT, ALL KEYS OF ONE USER SHARE "{user_id}" HASH TAG AND LIVE IN ONE SLOT:
+    {token_key_prefix}{user_id}:{sha256(token)} -> user_id
+    {user_key_prefix}{user_id} -> sorted set of token digests scored by issue time
+    {grace_key_prefix}{user_id}:{sha256(old token)} -> "{user_id}:{sealed new token}"
+    SO EVERY SCRIPT AND PER-USER PIPELINE RUNS ON ONE NODE
+
+    USER ID OF A TOKEN IS READ FROM ITS UNVERIFIED "sub" CLAIM, ONLY TO FIND THE SLOT
+    OPAQUE REFRESH TOKENS HAVE NO USER ID, SO THEY ARE NOT SUPPORTED
+    """
+
+    def __init__(self, redis: RedisCluster | SyncRedisCluster):
+        super().__init__(redis)
+
+    @classmethod
+    def from_url(
+            cls,
+            url: str,
+            max_connections: int = 50,
+            socket_timeout: float | None = 5,
+            socket_connect_timeout: float | None = 5,
+            **kwargs,
+    ) -> 'ClusterJWTRepository':
+        """ max_connections IS PER NODE """
+        return cls(
+            RedisCluster.from_url(
+                url,
+                max_connections=max_connections,
+                socket_timeout=socket_timeout,
+                socket_connect_timeout=socket_connect_timeout,
+                **kwargs,
+            ),
+        )
+
+    def get_token_key_prefix(self, user_id: int | None = None) -> str:
+        if user_id is None:
+            raise ValueError('Cluster key layout needs user id, opaque refresh tokens are not supported')
+        return f'{self.token_key_prefix}{{{user_id}}}:'
+
+    def get_user_key(self, user_id: int) -> str:
+        return f'{self.user_key_prefix}{{{user_id}}}'
+
+    def get_grace_key(self, digest: str, user_id: int | None = None) -> str:
+        return f'{self.grace_key_prefix}{{{user_id}}}:{digest}'
+
+    def get_token_user_id(self, token: str) -> int | None:
+        try:
+            return int(jwt.decode(token, options={'verify_signature': False, 'verify_exp': False})['sub'])
+        except (jwt.exceptions.PyJWTError, KeyError, TypeError, ValueError):
+            return
+
+    async def delete_refresh_token(self, token: str) -> int | None:
+        """ TOKEN WITHOUT USER ID CAN NOT EXIST IN THIS LAYOUT """
+        if self.get_token_user_id(token) is None:
+            return
+        return await super().delete_refresh_token(token)
+
+    async def get_rotation(self, token: str) -> RefreshTokenRotation | None:
+        if self.get_token_user_id(token) is None:
+            return
+        return await super().get_rotation(token)
+
+    async def migrate_legacy_keys(self, batch_size: int = 1000) -> int:
+        """ SCAN CURSOR IS PER NODE, scan_iter WALKS ALL PRIMARIES, MIGRATED KEYS LAND IN THE SLOT OF THEIR USER """
+        keys = self.redis.scan_iter(match='*,*', count=batch_size)
+        migrated = 0
+        if self.is_async:
+            async for chunk in iter_chunks(keys, batch_size):
+                migrated += await self.migrate_legacy_keys_batch(chunk)
+            return migrated
+        while chunk := await asyncio.to_thread(lambda: list(islice(keys, batch_size))):
+            migrated += await self.migrate_legacy_keys_batch(chunk)
+        return migrated
+
+    def get_user_slot(self, user_id: int) -> int:
+        return key_slot(self.get_user_key(user_id).encode('utf-8'))
+
+    def get_slot_distribution(self, user_ids: Iterable[int]) -> Counter:
+        """ slot -> NUMBER OF GIVEN USERS IN IT, COMPUTED LOCALLY """
+        return Counter(self.get_user_slot(user_id) for user_id in user_ids)
+
+    async def count_keys_in_slots(self, slots: Iterable[int]) -> dict[int, int]:
+        """ slot -> NUMBER OF KEYS STORED IN IT, ASKED FROM NODES THAT OWN THE SLOTS """
+        return {slot: await self.execute(self.redis.cluster_countkeysinslot, slot) for slot in slots}
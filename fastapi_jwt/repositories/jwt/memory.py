@@ -0,0 +1,224 @@
+import asyncio
+import heapq
+import json
+import threading
+import time
+from datetime import datetime
+from typing import AsyncIterator
+
+from fastapi_jwt.auth.jwt import get_token_digest
+from fastapi_jwt.instrumentation.observer import instrument
+from fastapi_jwt.repositories.jwt.base import JWTBaseRepository, SessionInfo
+
+
+class JWTRepository(JWTBaseRepository):
+    """
+    IN-PROCESS STORAGE FOR SINGLE NODE DEPLOYMENTS AND TESTS
+    TOKENS: digest -> (user_id, created_at, expires_at), SHARDED BY DIGEST
+    INDEX: user_id -> {digest: created_at}, SHARDED BY USER
+    EVERY OPERATION HOLDS AT MOST ONE SHARD LOCK AT A TIME, SO IT IS SAFE FOR THREADS AND ASYNCIO
+    EXPIRED TOKENS ARE DROPPED LAZILY, WHEN A SHARD IS FULL ITS OLDEST TOKENS ARE EVICTED
+    """
+
+    def __init__(self, max_tokens: int = 1_000_000, shard_count: int = 64):
+        self.shard_count = shard_count
+        self.max_tokens_per_shard = max(1, max_tokens // shard_count)
+        self._token_shards = [({}, threading.Lock()) for _ in range(shard_count)]
+        self._user_shards = [({}, threading.Lock()) for _ in range(shard_count)]
+
+    def __len__(self) -> int:
+        return sum(len(tokens) for tokens, _ in self._token_shards)
+
+    def _get_token_shard(self, digest: str) -> tuple[dict, threading.Lock]:
+        return self._token_shards[int(digest[:8], 16) % self.shard_count]
+
+    def _get_user_shard(self, user_id: int) -> tuple[dict, threading.Lock]:
+        return self._user_shards[hash(user_id) % self.shard_count]
+
+    def _add(
+            self,
+            user_id: int,
+            digest: str,
+            lifetime_seconds: int | None,
+            created_at: float | None = None,
+            expires_at: float | None = None,
+            max_sessions: int | None = None,
+    ) -> None:
+        created_at = created_at or time.time()
+        if lifetime_seconds:
+            expires_at = created_at + lifetime_seconds
+        evicted = []
+        tokens, lock = self._get_token_shard(digest)
+        with lock:
+            tokens[digest] = (user_id, created_at, expires_at)
+            while len(tokens) > self.max_tokens_per_shard:
+                evicted_digest = next(iter(tokens))
+                evicted.append((tokens.pop(evicted_digest)[0], evicted_digest))
+        users, lock = self._get_user_shard(user_id)
+        with lock:
+            user_tokens = users.setdefault(user_id, {})
+            user_tokens[digest] = created_at
+            if max_sessions and len(user_tokens) > max_sessions:
+                oldest = heapq.nsmallest(len(user_tokens) - max_sessions, user_tokens, key=user_tokens.get)
+                for oldest_digest in oldest:
+                    del user_tokens[oldest_digest]
+            else:
+                oldest = []
+        for evicted_user_id, evicted_digest in evicted:
+            self._unindex(evicted_user_id, evicted_digest)
+        for oldest_digest in oldest:
+            tokens, lock = self._get_token_shard(oldest_digest)
+            with lock:
+                tokens.pop(oldest_digest, None)
+
+    def _pop(self, digest: str) -> tuple | None:
+        tokens, lock = self._get_token_shard(digest)
+        with lock:
+            entry = tokens.pop(digest, None)
+        if entry is None:
+            return
+        self._unindex(entry[0], digest)
+        expires_at = entry[2]
+        if expires_at is not None and expires_at <= time.time():
+            return
+        return entry
+
+    def _unindex(self, user_id: int, digest: str) -> None:
+        users, lock = self._get_user_shard(user_id)
+        with lock:
+            user_tokens = users.get(user_id)
+            if user_tokens is None:
+                return
+            user_tokens.pop(digest, None)
+            if not user_tokens:
+                del users[user_id]
+
+    def _pop_user(self, user_id: int) -> dict:
+        users, lock = self._get_user_shard(user_id)
+        with lock:
+            return users.pop(user_id, {})
+
+    async def save_refresh_token(
+            self,
+            user_id: int,
+            token: str,
+            lifetime_seconds: int | None = None,
+            max_sessions: int | None = None,
+    ) -> None:
+        self._add(user_id, get_token_digest(token), lifetime_seconds, max_sessions=max_sessions)
+
+    @instrument('jwt_repository.save_refresh_tokens')
+    async def save_refresh_tokens(
+            self,
+            tokens: list[tuple[int, str]],
+            lifetime_seconds: int | None = None,
+            max_sessions: int | None = None,
+    ) -> None:
+        for user_id, token in tokens:
+            self._add(user_id, get_token_digest(token), lifetime_seconds, max_sessions=max_sessions)
+
+    @instrument('jwt_repository.delete_refresh_token')
+    async def delete_refresh_token(self, token: str) -> int | None:
+        entry = self._pop(get_token_digest(token))
+        if entry is None:
+            return
+        return entry[0]
+
+    @instrument('jwt_repository.delete_all_user_refresh_tokens')
+    async def delete_all_user_refresh_tokens(self, user_id: int) -> None:
+        self._delete_user_tokens(user_id)
+
+    async def iter_user_sessions(self, user_id: int, page_size: int = 100) -> AsyncIterator[SessionInfo]:
+        """ INDEX IS COPIED UNDER LOCK, page_size ONLY LIMITS WORK BETWEEN AWAITS """
+        users, lock = self._get_user_shard(user_id)
+        with lock:
+            user_tokens = sorted(users.get(user_id, {}).items(), key=lambda item: item[1])
+        for start in range(0, len(user_tokens), page_size):
+            now = time.time()
+            for digest, _ in user_tokens[start:start + page_size]:
+                tokens, lock = self._get_token_shard(digest)
+                with lock:
+                    entry = tokens.get(digest)
+                if entry is None or (entry[2] is not None and entry[2] <= now):
+                    continue
+                _, created_at, expires_at = entry
+                yield SessionInfo(
+                    digest,
+                    datetime.utcfromtimestamp(created_at),
+                    datetime.utcfromtimestamp(expires_at) if expires_at is not None else None,
+                )
+            await asyncio.sleep(0)
+
+    @instrument('jwt_repository.delete_refresh_tokens_for_users_batch')
+    async def delete_refresh_tokens_for_users_batch(self, user_ids: list[int]) -> int:
+        return sum(self._delete_user_tokens(user_id) for user_id in user_ids)
+
+    def _delete_user_tokens(self, user_id: int) -> int:
+        deleted = 0
+        for digest in self._pop_user(user_id):
+            tokens, lock = self._get_token_shard(digest)
+            with lock:
+                deleted += tokens.pop(digest, None) is not None
+        return deleted
+
+    @instrument('jwt_repository.rotate_refresh_token')
+    async def rotate_refresh_token(
+            self,
+            old_token: str,
+            new_token: str,
+            user_id: int | None,
+            lifetime_seconds: int | None = None,
+    ) -> int | None:
+        """ POP UNDER SHARD LOCK GUARANTEES THAT ONLY ONE CONCURRENT ROTATION CONSUMES OLD TOKEN """
+        owner_id = await self.delete_refresh_token(old_token)
+        if user_id is None:
+            if owner_id is None:
+                return
+            user_id = owner_id
+        elif owner_id is None:
+            await self.delete_all_user_refresh_tokens(user_id)
+        self._add(user_id, get_token_digest(new_token), lifetime_seconds)
+        return owner_id
+
+    async def delete_expired_refresh_tokens(self, limit: int) -> int:
+        now = time.time()
+        expired = []
+        for tokens, lock in self._token_shards:
+            with lock:
+                for digest, (user_id, _, expires_at) in list(tokens.items()):
+                    if len(expired) >= limit:
+                        break
+                    if expires_at is not None and expires_at <= now:
+                        del tokens[digest]
+                        expired.append((user_id, digest))
+            if len(expired) >= limit:
+                break
+        for user_id, digest in expired:
+            self._unindex(user_id, digest)
+        return len(expired)
+
+    def dump(self) -> dict:
+        now = time.time()
+        snapshot = []
+        for tokens, lock in self._token_shards:
+            with lock:
+                snapshot.extend(
+                    [digest, user_id, created_at, expires_at]
+                    for digest, (user_id, created_at, expires_at) in tokens.items()
+                    if expires_at is None or expires_at > now
+                )
+        return {'version': 1, 'tokens': snapshot}
+
+    def load(self, snapshot: dict) -> None:
+        now = time.time()
+        for digest, user_id, created_at, expires_at in snapshot['tokens']:
+            if expires_at is None or expires_at > now:
+                self._add(user_id, digest, None, created_at=created_at, expires_at=expires_at)
+
+    def dump_to_file(self, path: str) -> None:
+        with open(path, 'w') as file:
+            json.dump(self.dump(), file)
+
+    def load_from_file(self, path: str) -> None:
+        with open(path) as file:
+            self.load(json.load(file))
@@ -1,31 +1,375 @@
-from sqlalchemy import insert, delete
+from datetime import datetime, timedelta
+from typing import AsyncIterator
+
+from sqlalchemy import and_, bindparam, column, delete, exists, func, insert, or_, select, table, update
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from fastapi_jwt.repositories.jwt.base import JWTBaseRepository
+from fastapi_jwt.auth.jwt import get_token_digest, get_unverified_exp
+from fastapi_jwt.instrumentation.observer import instrument
+from fastapi_jwt.repositories.jwt.base import (
+    JWTBaseRepository,
+    RefreshTokenRotation,
+    SessionInfo,
+    open_replacement_token,
+    seal_replacement_token,
+)
+from fastapi_jwt.repositories.sqldb import SQLRepository
 
 
-class JWTRepository(JWTBaseRepository):
+class JWTRepository(SQLRepository, JWTBaseRepository):
+    """
+    grace_model: RefreshTokenGrace TABLE, SHARES ROTATION GRACE WINDOW BETWEEN PROCESSES
+    WITHOUT IT GRACE WINDOW IS KEPT IN PROCESS MEMORY, SEE JWTBaseRepository.rotate_refresh_token_with_grace
+    """
     model = None
+    grace_model = None
+    """ KEEPS EVICTION STATEMENT UNDER 32767 BIND PARAMETERS OF asyncpg """
+    evict_users_per_statement = 10000
+
+    @staticmethod
+    def get_expires_at(lifetime_seconds: int | None) -> datetime | None:
+        if not lifetime_seconds:
+            return
+        return datetime.utcnow() + timedelta(seconds=lifetime_seconds)
 
-    def __init__(self, session: AsyncSession):
-        self.session = session
+    async def save_refresh_token(
+            self,
+            user_id: int,
+            token: str,
+            lifetime_seconds: int | None = None,
+            max_sessions: int | None = None,
+    ) -> None:
+        await self.save_refresh_tokens([(user_id, token)], lifetime_seconds, max_sessions)
 
-    async def save_refresh_token(self, user_id: int, token: str) -> None:
-        stmt = insert(self.model).values(user_id=user_id, token=token)
-        await self.session.execute(stmt)
-        await self.session.commit()
+    @instrument('jwt_repository.save_refresh_tokens')
+    async def save_refresh_tokens(
+            self,
+            tokens: list[tuple[int, str]],
+            lifetime_seconds: int | None = None,
+            max_sessions: int | None = None,
+    ) -> None:
+        if not tokens:
+            return
+        expires_at = self.get_expires_at(lifetime_seconds)
+        """ TOKENS OF ONE CALL GET INCREASING created_at, SO EVICTION ORDER DOES NOT DEPEND ON id ALONE """
+        created_at = datetime.utcnow()
+        rows = [
+            {
+                'user_id': user_id,
+                'token_digest': get_token_digest(token),
+                'expires_at': expires_at,
+                'created_at': created_at + timedelta(microseconds=index),
+            }
+            for index, (user_id, token) in enumerate(tokens)
+        ]
+        async with self.get_session() as session:
+            """
+            EXECUTEMANY, SQLALCHEMY SPLITS ROWS INTO INSERTS OF insertmanyvalues_page_size ROWS
+            ONE MULTI-ROW VALUES WOULD HIT 32767 BIND PARAMETERS LIMIT OF asyncpg AT ABOUT 8000 TOKENS
+            """
+            await session.execute(insert(self.model), rows)
+            if max_sessions:
+                user_ids = list(dict.fromkeys(user_id for user_id, _ in tokens))
+                for start in range(0, len(user_ids), self.evict_users_per_statement):
+                    chunk = user_ids[start:start + self.evict_users_per_statement]
+                    await session.execute(self.get_evict_oldest_sessions_stmt(chunk, max_sessions))
+            await session.commit()
+
+    def get_evict_oldest_sessions_stmt(self, user_ids: list[int], max_sessions: int):
+        """ ONE STATEMENT FOR ALL user_ids, ROWS RANKED PER USER AFTER THE NEWEST max_sessions ARE DELETED """
+        ranked = (
+            select(
+                self.model.id,
+                func.row_number().over(
+                    partition_by=self.model.user_id,
+                    order_by=(self.model.created_at.desc(), self.model.id.desc()),
+                ).label('position'),
+            )
+            .where(self.model.user_id.in_(user_ids))
+            .subquery()
+        )
+        oldest_ids = select(ranked.c.id).where(ranked.c.position > max_sessions)
+        return delete(self.model).where(self.model.id.in_(oldest_ids))
 
+    @instrument('jwt_repository.delete_refresh_token')
     async def delete_refresh_token(self, token: str) -> int | None:
         stmt = (
             delete(self.model)
-            .where(self.model.token == token)
-            .returning(self.model.id)
+            .where(self.model.token_digest == get_token_digest(token))
+            .returning(self.model.user_id)
         )
-        result = await self.session.execute(stmt)
-        await self.session.commit()
+        async with self.get_session() as session:
+            result = await session.execute(stmt)
+            await session.commit()
         return result.scalar()
 
+    @instrument('jwt_repository.delete_all_user_refresh_tokens')
     async def delete_all_user_refresh_tokens(self, user_id: int) -> None:
         stmt = delete(self.model).where(self.model.user_id == user_id)
-        await self.session.execute(stmt)
-        await self.session.commit()
+        async with self.get_session() as session:
+            await session.execute(stmt)
+            await session.commit()
+
+    async def iter_user_sessions(self, user_id: int, page_size: int = 100) -> AsyncIterator[SessionInfo]:
+        """ KEYSET PAGINATION OVER (created_at, id), EVERY PAGE IS ONE INDEXED QUERY """
+        model = self.model
+        query = (
+            select(model.id, model.token_digest, model.created_at, model.expires_at)
+            .where(
+                model.user_id == user_id,
+                or_(model.expires_at.is_(None), model.expires_at > datetime.utcnow()),
+            )
+            .order_by(model.created_at, model.id)
+            .limit(page_size)
+        )
+        last_row = None
+        while True:
+            page_query = query
+            if last_row is not None:
+                page_query = query.where(
+                    or_(
+                        model.created_at > last_row.created_at,
+                        and_(model.created_at == last_row.created_at, model.id > last_row.id),
+                    ),
+                )
+            async with self.get_session() as session:
+                rows = (await session.execute(page_query)).all()
+            for row in rows:
+                yield SessionInfo(row.token_digest, row.created_at, row.expires_at)
+            if len(rows) < page_size:
+                return
+            last_row = rows[-1]
+
+    @instrument('jwt_repository.delete_refresh_tokens_for_users_batch')
+    async def delete_refresh_tokens_for_users_batch(self, user_ids: list[int]) -> int:
+        stmt = delete(self.model).where(self.model.user_id.in_(user_ids))
+        async with self.get_session() as session:
+            result = await session.execute(stmt)
+            await session.commit()
+        return result.rowcount
+
+    @instrument('jwt_repository.rotate_refresh_token')
+    async def rotate_refresh_token(
+            self,
+            old_token: str,
+            new_token: str,
+            user_id: int | None,
+            lifetime_seconds: int | None = None,
+    ) -> int | None:
+        delete_old_token = (
+            delete(self.model)
+            .where(self.model.token_digest == get_token_digest(old_token))
+            .returning(self.model.user_id)
+        )
+        if user_id is None:
+            return await self.rotate_opaque_refresh_token(delete_old_token, new_token, lifetime_seconds)
+        delete_all_user_tokens = delete(self.model).where(self.model.user_id == user_id)
+        insert_new_token = insert(self.model).values(
+            user_id=user_id,
+            token_digest=get_token_digest(new_token),
+            expires_at=self.get_expires_at(lifetime_seconds),
+        )
+        async with self.get_session() as session:
+            if session.get_bind(self.model).dialect.name == 'postgresql':
+                """ ONE STATEMENT: WRITABLE CTEs SHARE ONE SNAPSHOT SO NEW ROW IS NOT WIPED """
+                deleted = delete_old_token.cte('deleted')
+                wiped = (
+                    delete_all_user_tokens
+                    .where(~exists(select(deleted.c.user_id)))
+                    .returning(self.model.id)
+                    .cte('wiped')
+                )
+                inserted = insert_new_token.returning(self.model.id).cte('inserted')
+                stmt = select(deleted.c.user_id).add_cte(wiped, inserted)
+                result = await session.execute(stmt)
+                owner_id = result.scalar()
+            else:
+                result = await session.execute(delete_old_token)
+                owner_id = result.scalar()
+                if owner_id is None:
+                    await session.execute(delete_all_user_tokens)
+                await session.execute(insert_new_token)
+            await session.commit()
+        return owner_id
+
+    async def rotate_opaque_refresh_token(self, delete_old_token, new_token: str, lifetime_seconds: int | None) -> int | None:
+        """ OWNER AND EXPIRY COME FROM THE DELETED ROW, NOTHING IS SAVED IF IT IS MISSING OR EXPIRED """
+        async with self.get_session() as session:
+            result = await session.execute(delete_old_token.returning(self.model.expires_at))
+            row = result.first()
+            owner_id = None
+            if row is not None and (row.expires_at is None or row.expires_at > datetime.utcnow()):
+                owner_id = row.user_id
+                await session.execute(
+                    insert(self.model).values(
+                        user_id=owner_id,
+                        token_digest=get_token_digest(new_token),
+                        expires_at=self.get_expires_at(lifetime_seconds),
+                    ),
+                )
+            await session.commit()
+        return owner_id
+
+    @instrument('jwt_repository.rotate_refresh_token_with_grace')
+    async def rotate_refresh_token_with_grace(
+            self,
+            old_token: str,
+            new_token: str,
+            user_id: int | None,
+            lifetime_seconds: int | None = None,
+            grace_seconds: float = 10,
+    ) -> RefreshTokenRotation:
+        """
+        ROTATION AND ITS GRACE ROW ARE WRITTEN IN ONE TRANSACTION
+        GRACE ROW IS READ ONLY AFTER OLD TOKEN DELETE FOUND NOTHING: CONCURRENT ROTATION OF THE SAME TOKEN
+        HOLDS THE ROW LOCK UNTIL IT COMMITS, SO UNDER READ COMMITTED ITS GRACE ROW IS VISIBLE BY THEN
+        """
+        if self.grace_model is None:
+            return await super().rotate_refresh_token_with_grace(
+                old_token,
+                new_token,
+                user_id,
+                lifetime_seconds,
+                grace_seconds,
+            )
+        old_digest = get_token_digest(old_token)
+        now = datetime.utcnow()
+        delete_old_token = (
+            delete(self.model)
+            .where(self.model.token_digest == old_digest)
+            .returning(self.model.user_id, self.model.expires_at)
+        )
+        insert_new_token = insert(self.model).values(
+            token_digest=get_token_digest(new_token),
+            expires_at=self.get_expires_at(lifetime_seconds),
+        )
+        async with self.get_session() as session:
+            row = (await session.execute(delete_old_token)).first()
+            if row is not None and user_id is None and row.expires_at is not None and row.expires_at <= now:
+                """ EXPIRED OPAQUE TOKEN IS UNKNOWN, IT HAS NO OTHER OWNER CHECK """
+                row = None
+            if row is None:
+                rotation = await self.get_session_rotation(session, old_token, now)
+                if rotation is None and user_id is not None:
+                    await session.execute(delete(self.model).where(self.model.user_id == user_id))
+                    await session.execute(insert_new_token.values(user_id=user_id))
+                await session.commit()
+                return rotation or RefreshTokenRotation(None)
+            await session.execute(insert_new_token.values(user_id=row.user_id if user_id is None else user_id))
+            await session.execute(
+                insert(self.grace_model).values(
+                    token_digest=old_digest,
+                    user_id=row.user_id,
+                    sealed_token=seal_replacement_token(old_token, new_token),
+                    expires_at=now + timedelta(seconds=grace_seconds),
+                ),
+            )
+            await session.commit()
+        return RefreshTokenRotation(row.user_id)
+
+    async def get_rotation(self, token: str) -> RefreshTokenRotation | None:
+        if self.grace_model is None:
+            return await super().get_rotation(token)
+        async with self.get_session() as session:
+            return await self.get_session_rotation(session, token, datetime.utcnow())
+
+    async def get_session_rotation(self, session: AsyncSession, token: str, now: datetime) -> RefreshTokenRotation | None:
+        query = (
+            select(self.grace_model.user_id, self.grace_model.sealed_token)
+            .where(
+                self.grace_model.token_digest == get_token_digest(token),
+                self.grace_model.expires_at > now,
+            )
+        )
+        row = (await session.execute(query)).first()
+        if row is None:
+            return
+        return RefreshTokenRotation(row.user_id, open_replacement_token(token, row.sealed_token))
+
+    async def delete_expired_refresh_tokens(self, limit: int) -> int:
+        expired_ids = (
+            select(self.model.id)
+            .where(self.model.expires_at < datetime.utcnow())
+            .limit(limit)
+        )
+        stmt = delete(self.model).where(self.model.id.in_(expired_ids.scalar_subquery()))
+        async with self.get_session() as session:
+            result = await session.execute(stmt)
+            deleted = result.rowcount
+            if self.grace_model is not None:
+                expired_digests = (
+                    select(self.grace_model.token_digest)
+                    .where(self.grace_model.expires_at < datetime.utcnow())
+                    .limit(limit)
+                )
+                result = await session.execute(
+                    delete(self.grace_model)
+                    .where(self.grace_model.token_digest.in_(expired_digests.scalar_subquery())),
+                )
+                deleted += result.rowcount
+            await session.commit()
+        return deleted
+
+    async def migrate_legacy_tokens(self, token_column: str = 'token', batch_size: int = 1000) -> int:
+        """
+        FILLS token_digest FROM THE OLD RAW TOKEN COLUMN AND MISSING expires_at FROM TOKEN "exp", RETURNS MIGRATED COUNT
+        ADD token_digest AS NULLABLE, RUN THIS, THEN DROP THE OLD COLUMN AND MAKE token_digest NOT NULL
+        OLD TOKENS CARRIED ONLY sub AND exp, SO TWO LOGINS IN ONE SECOND STORED THE SAME TOKEN TWICE
+        ONLY ONE ROW PER DIGEST IS KEPT, DUPLICATES ARE DELETED AND NOT COUNTED
+        """
+        legacy_table = table(
+            self.model.__tablename__,
+            column('id'),
+            column('token_digest'),
+            column('expires_at'),
+            column(token_column),
+        )
+        query = (
+            select(legacy_table.c.id, legacy_table.c[token_column])
+            .where(legacy_table.c.token_digest.is_(None))
+            .order_by(legacy_table.c.id)
+            .limit(batch_size)
+        )
+        stmt = (
+            update(legacy_table)
+            .where(legacy_table.c.id == bindparam('row_id'))
+            .values(
+                token_digest=bindparam('digest'),
+                expires_at=func.coalesce(legacy_table.c.expires_at, bindparam('token_expires_at')),
+            )
+        )
+        migrated = 0
+        async with self.get_session() as session:
+            while rows := (await session.execute(query)).all():
+                digests = {}
+                for row_id, token in rows:
+                    digests.setdefault(get_token_digest(token), (row_id, token))
+                existing = await session.scalars(
+                    select(legacy_table.c.token_digest).where(legacy_table.c.token_digest.in_(list(digests))),
+                )
+                for digest in existing:
+                    del digests[digest]
+                kept_ids = {row_id for row_id, _ in digests.values()}
+                duplicate_ids = [row_id for row_id, _ in rows if row_id not in kept_ids]
+                if duplicate_ids:
+                    await session.execute(delete(legacy_table).where(legacy_table.c.id.in_(duplicate_ids)))
+                if digests:
+                    await session.execute(
+                        stmt,
+                        [
+                            {
+                                'row_id': row_id,
+                                'digest': digest,
+                                'token_expires_at': self.get_legacy_expires_at(token),
+                            }
+                            for digest, (row_id, token) in digests.items()
+                        ],
+                    )
+                await session.commit()
+                migrated += len(digests)
+        return migrated
+
+    @staticmethod
+    def get_legacy_expires_at(token: str) -> datetime | None:
+        exp = get_unverified_exp(token)
+        return datetime.utcfromtimestamp(exp) if exp is not None else None
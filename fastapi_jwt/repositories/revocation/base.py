@@ -0,0 +1,18 @@
+from typing import Any
+
+
+class RevocationBaseRepository:
+
+    async def revoke(self, jti: str, expires_at: int) -> None:
+        """ expires_at IS TOKEN "exp" CLAIM, UNIX TIMESTAMP """
+        raise NotImplementedError
+
+    async def fetch_revoked(self, cursor: Any = None, limit: int = 1000) -> tuple[list[tuple[str, int]], Any]:
+        """
+        RETURNS ([(jti, expires_at), ...], NEXT CURSOR) OF REVOCATIONS MADE AFTER cursor
+        cursor=None STARTS FROM THE OLDEST NOT EXPIRED REVOCATION, PAGE IS SHORTER THAN limit WHEN CAUGHT UP
+        """
+        raise NotImplementedError
+
+    async def delete_expired_revocations(self, limit: int) -> int:
+        raise NotImplementedError
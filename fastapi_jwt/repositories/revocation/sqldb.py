@@ -0,0 +1,76 @@
+import calendar
+from datetime import datetime
+from typing import NamedTuple
+
+from sqlalchemy import delete, exists, insert, literal, select
+
+from fastapi_jwt.instrumentation.observer import instrument
+from fastapi_jwt.repositories.revocation.base import RevocationBaseRepository
+from fastapi_jwt.repositories.sqldb import SQLRepository
+
+
+class RevocationCursor(NamedTuple):
+    last_id: int
+    recent_ids: frozenset[int]
+
+
+class RevocationRepository(SQLRepository, RevocationBaseRepository):
+    """
+    INCREMENTAL SYNC READS ROWS WITH id GREATER THAN CURSOR AND RE-READS LAST cursor_overlap ids
+    CONCURRENT TRANSACTIONS MAY COMMIT OUT OF id ORDER, SO A LOWER id CAN APPEAR AFTER A HIGHER ONE WAS FETCHED
+    CURSOR REMEMBERS ids ALREADY FETCHED IN THAT WINDOW, SO THEY ARE NOT RETURNED AGAIN
+    """
+    model = None
+    cursor_overlap = 500
+
+    @instrument('revocation_repository.revoke')
+    async def revoke(self, jti: str, expires_at: int) -> None:
+        """ REVOKING THE SAME TOKEN TWICE IS A NO-OP """
+        stmt = insert(self.model).from_select(
+            ['jti', 'expires_at'],
+            select(literal(jti), literal(datetime.utcfromtimestamp(expires_at)))
+            .where(~exists().where(self.model.jti == jti)),
+        )
+        async with self.get_session() as session:
+            await session.execute(stmt)
+            await session.commit()
+
+    @instrument('revocation_repository.fetch_revoked')
+    async def fetch_revoked(
+            self,
+            cursor: RevocationCursor | None = None,
+            limit: int = 1000,
+    ) -> tuple[list[tuple[str, int]], RevocationCursor | None]:
+        query = (
+            select(self.model.id, self.model.jti, self.model.expires_at)
+            .where(self.model.expires_at > datetime.utcnow())
+            .order_by(self.model.id)
+            .limit(limit)
+        )
+        if cursor is not None:
+            query = query.where(self.model.id > cursor.last_id - self.cursor_overlap)
+            if cursor.recent_ids:
+                query = query.where(self.model.id.not_in(cursor.recent_ids))
+        async with self.get_session() as session:
+            rows = (await session.execute(query)).all()
+        entries = [(jti, calendar.timegm(expires_at.utctimetuple())) for _, jti, expires_at in rows]
+        if not rows:
+            return entries, cursor
+        last_id = max(rows[-1].id, cursor.last_id if cursor is not None else 0)
+        recent_ids = {row.id for row in rows} | (cursor.recent_ids if cursor is not None else set())
+        return entries, RevocationCursor(
+            last_id,
+            frozenset(row_id for row_id in recent_ids if row_id > last_id - self.cursor_overlap),
+        )
+
+    async def delete_expired_revocations(self, limit: int) -> int:
+        expired_ids = (
+            select(self.model.id)
+            .where(self.model.expires_at < datetime.utcnow())
+            .limit(limit)
+        )
+        stmt = delete(self.model).where(self.model.id.in_(expired_ids.scalar_subquery()))
+        async with self.get_session() as session:
+            result = await session.execute(stmt)
+            await session.commit()
+        return result.rowcount
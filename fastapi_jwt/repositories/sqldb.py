@@ -0,0 +1,30 @@
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable
+
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker
+
+
+class SQLRepository:
+    """
+    ACCEPTS async_sessionmaker OR AsyncEngine, EVERY OPERATION CHECKS OUT ITS OWN POOLED SESSION
+    SO ONE REPOSITORY INSTANCE CAN BE SHARED BY CONCURRENT REQUESTS
+    AsyncSession IS STILL ACCEPTED, BUT THEN REPOSITORY MUST NOT BE SHARED BETWEEN REQUESTS
+    """
+
+    def __init__(self, session: AsyncSession | async_sessionmaker | AsyncEngine | Callable[[], AsyncSession]):
+        if isinstance(session, AsyncEngine):
+            session = async_sessionmaker(session, expire_on_commit=False)
+        if isinstance(session, AsyncSession):
+            self.session = session
+            self.session_factory = None
+        else:
+            self.session = None
+            self.session_factory = session
+
+    @asynccontextmanager
+    async def get_session(self) -> AsyncIterator[AsyncSession]:
+        if self.session_factory is None:
+            yield self.session
+            return
+        async with self.session_factory() as session:
+            yield session
@@ -1,19 +1,24 @@
-from sqlalchemy import select
-from sqlalchemy.ext.asyncio import AsyncSession
+from typing import AsyncIterator
+
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker
 from sqlalchemy.orm import load_only
 
 from fastapi_jwt.exceptions.jwt import FailGetAttribute
+from fastapi_jwt.instrumentation.observer import instrument
+from fastapi_jwt.repositories.sqldb import SQLRepository
 
 
-class UserRepository:
+class UserRepository(SQLRepository):
     model = None
 
-    def __init__(self, session: AsyncSession, username_field: str):
-        self.session = session
+    def __init__(self, session: AsyncSession | async_sessionmaker | AsyncEngine, username_field: str):
+        super().__init__(session)
         self.username_field = getattr(self.model, username_field, None)
         if not self.username_field:
             raise FailGetAttribute(username_field, self.model)
 
+    @instrument('user_repository.get_info_for_authenticate')
     async def get_info_for_authenticate(self, username_field: str):
         query = (
             select(self.model)
@@ -26,5 +31,19 @@ class UserRepository:
                 ),
             )
         )
-        result = await self.session.execute(query)
-        return result.scalar()
+        async with self.get_session() as session:
+            result = await session.execute(query)
+            return result.scalar()
+
+    async def iter_usernames(self, batch_size: int = 10000) -> AsyncIterator[str]:
+        query = select(self.username_field).execution_options(yield_per=batch_size)
+        async with self.get_session() as session:
+            result = await session.stream_scalars(query)
+            async for username in result:
+                yield username
+
+    async def update_password(self, user_id: int, password: str) -> None:
+        stmt = update(self.model).where(self.model.id == user_id).values(password=password)
+        async with self.get_session() as session:
+            await session.execute(stmt)
+            await session.commit()
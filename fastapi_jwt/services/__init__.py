@@ -1,2 +1,27 @@
-from fastapi_jwt.services.jwt import JWTService
-from fastapi_jwt.services.users import UserService
+""" NAMES ARE IMPORTED ON FIRST ACCESS, SO BACKEND LIBRARIES ARE LOADED ONLY BY SERVICES THAT USE THEM """
+import importlib
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from fastapi_jwt.services.claims import ClaimsProvider
+    from fastapi_jwt.services.jwt import JWTService
+    from fastapi_jwt.services.purger import RefreshTokenPurger
+    from fastapi_jwt.services.revocation import RevocationListSyncer
+    from fastapi_jwt.services.users import UserService
+
+
+_EXPORTS = {
+    'JWTService': 'fastapi_jwt.services.jwt',
+    'UserService': 'fastapi_jwt.services.users',
+    'RefreshTokenPurger': 'fastapi_jwt.services.purger',
+    'RevocationListSyncer': 'fastapi_jwt.services.revocation',
+    'ClaimsProvider': 'fastapi_jwt.services.claims',
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name: str):
+    if name not in _EXPORTS:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+    return getattr(importlib.import_module(_EXPORTS[name]), name)
@@ -0,0 +1,24 @@
+import asyncio
+
+
+class BackgroundService:
+    """ RUNS run() AS ONE asyncio TASK, start IS IDEMPOTENT, stop CANCELS THE TASK AND WAITS FOR IT """
+    _task: asyncio.Task | None = None
+
+    async def run(self) -> None:
+        raise NotImplementedError
+
+    def start(self) -> asyncio.Task:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run())
+        return self._task
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
@@ -0,0 +1,102 @@
+import asyncio
+import time
+from collections import OrderedDict
+
+
+class ClaimsProvider:
+    """
+    EXTRA ACCESS TOKEN CLAIMS, E.G. ROLES OR PERMISSIONS, OVERRIDE load_claims
+    CLAIMS ARE CACHED FOR ttl_SECONDS, CALL invalidate WHEN THEY CHANGE
+    CONCURRENT get_claims CALLS ARE COLLECTED AND LOADED WITH ONE load_claims CALL PER max_batch_size USERS
+    """
+
+    def __init__(self, ttl_seconds: float = 60, max_size: int = 10000, max_batch_size: int = 500):
+        self.ttl_seconds = ttl_seconds
+        self.max_size = max_size
+        self.max_batch_size = max_batch_size
+        self._cache: OrderedDict[int, tuple[dict, float]] = OrderedDict()
+        self._futures: dict[int, asyncio.Future] = {}
+        self._pending: list[int] = []
+        self._tasks: set[asyncio.Task] = set()
+        self._generation = 0
+
+    async def load_claims(self, user_ids: list[int]) -> dict[int, dict]:
+        """ ONE QUERY FOR ALL user_ids, USERS MISSING IN RESULT GET NO EXTRA CLAIMS """
+        raise NotImplementedError
+
+    async def get_claims(self, user_id: int) -> dict:
+        return (await self.get_many_claims([user_id]))[user_id]
+
+    async def get_many_claims(self, user_ids: list[int]) -> dict[int, dict]:
+        claims = {}
+        waiting = {}
+        for user_id in user_ids:
+            cached = self._get_cached(user_id)
+            if cached is not None:
+                claims[user_id] = cached
+                continue
+            future = self._futures.get(user_id)
+            if future is None:
+                future = self._futures[user_id] = asyncio.get_running_loop().create_future()
+                if not self._pending:
+                    """ DISPATCH AFTER OTHER READY TASKS HAD A CHANCE TO ADD THEIR USERS """
+                    asyncio.get_running_loop().call_soon(self._dispatch)
+                self._pending.append(user_id)
+            waiting[user_id] = future
+        for user_id, future in waiting.items():
+            claims[user_id] = await asyncio.shield(future)
+        return claims
+
+    def invalidate(self, user_id: int | None = None) -> None:
+        """ user_id=None DROPS ALL CACHED CLAIMS """
+        self._generation += 1
+        if user_id is None:
+            self._cache.clear()
+        else:
+            self._cache.pop(user_id, None)
+
+    def _get_cached(self, user_id: int) -> dict | None:
+        entry = self._cache.get(user_id)
+        if entry is None:
+            return
+        claims, expires_at = entry
+        if expires_at <= time.monotonic():
+            del self._cache[user_id]
+            return
+        return claims
+
+    def _dispatch(self) -> None:
+        pending, self._pending = self._pending, []
+        for start in range(0, len(pending), self.max_batch_size):
+            """ LOOP KEEPS ONLY WEAK REFERENCES TO TASKS """
+            task = asyncio.ensure_future(self._load_batch(pending[start:start + self.max_batch_size]))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _load_batch(self, user_ids: list[int]) -> None:
+        generation = self._generation
+        futures = {user_id: self._futures[user_id] for user_id in user_ids}
+        try:
+            loaded = await self.load_claims(user_ids)
+            expires_at = time.monotonic() + self.ttl_seconds
+            for user_id, future in futures.items():
+                claims = loaded.get(user_id) or {}
+                if self.ttl_seconds and generation == self._generation:
+                    """ CLAIMS LOADED BEFORE invalidate CALL MAY BE STALE, THEY ARE NOT CACHED """
+                    self._cache[user_id] = (claims, expires_at)
+                    self._cache.move_to_end(user_id)
+                if not future.done():
+                    future.set_result(claims)
+            while len(self._cache) > self.max_size:
+                self._cache.popitem(last=False)
+        except Exception as exc:
+            for future in futures.values():
+                if not future.done():
+                    future.set_exception(exc)
+        finally:
+            """ CANCELLED LOAD ALSO RELEASES ITS FUTURES, OTHERWISE LATER CALLS FOR THESE USERS WOULD WAIT FOREVER """
+            for user_id, future in futures.items():
+                if self._futures.get(user_id) is future:
+                    del self._futures[user_id]
+                if not future.done():
+                    future.cancel()
@@ -1,5 +1,17 @@
+import asyncio
+import secrets
+
+from fastapi import HTTPException
+from starlette import status
+
 from fastapi_jwt.auth.jwt import generate_jwt, decode_jwt
-from fastapi_jwt.repositories.jwt.base import JWTBaseRepository
+from fastapi_jwt.auth.keys import JWTKeySet
+from fastapi_jwt.auth.revocation import RevocationList
+from fastapi_jwt.exceptions.jwt import RevocationNotConfigured
+from fastapi_jwt.instrumentation.observer import instrument, record
+from fastapi_jwt.repositories.jwt.base import JWTBaseRepository, RefreshTokenRotation
+from fastapi_jwt.repositories.revocation.base import RevocationBaseRepository
+from fastapi_jwt.services.claims import ClaimsProvider
 
 
 class JWTService:
@@ -11,38 +23,104 @@ class JWTService:
             jwt_access_token_lifetime_seconds: int = 60 * 60 * 24 * 7,
             jwt_refresh_token_lifetime_seconds: int = 60 * 60,
             algorithm: str = 'HS256',
+            jwt_access_keys: JWTKeySet | None = None,
+            jwt_refresh_keys: JWTKeySet | None = None,
+            verify_signature: bool = True,
+            revocation_repo: RevocationBaseRepository | None = None,
+            revocation_list: RevocationList | None = None,
+            opaque_refresh_tokens: bool = False,
+            refresh_token_grace_seconds: float = 0,
+            claims_provider: ClaimsProvider | None = None,
+            max_sessions_per_user: int | None = None,
     ):
-        self.JWT_ACCESS_SECRET_KEY = jwt_access_secret_key
-        self.JWT_REFRESH_SECRET_KEY = jwt_refresh_secret_key
+        """
+        KEY SETS ARE PREPARED ONCE, PASS THEM FOR ASYMMETRIC ALGORITHMS AND KEY ROTATION
+        opaque_refresh_tokens: REFRESH TOKEN IS RANDOM STRING INSTEAD OF JWT, REPOSITORY IS THE ONLY SOURCE OF TRUTH
+        refresh_token_grace_seconds: REFRESH OF JUST ROTATED TOKEN RETURNS THE SAME NEW TOKEN INSTEAD OF LOGGING USER OUT
+        GRACE WINDOW IS SHARED BY ALL PROCESSES WITH REDIS AND WITH SQL grace_model, OTHER REPOSITORIES KEEP IT IN PROCESS MEMORY
+        claims_provider: CACHED AND BATCH LOADED EXTRA CLAIMS, REPLACES add_extra_info_to_access_token
+        max_sessions_per_user: NEW LOGIN EVICTS OLDEST REFRESH TOKENS OF USER ABOVE THIS NUMBER
+        """
+        self.JWT_ACCESS_SECRET_KEY = jwt_access_keys or JWTKeySet.from_secret(jwt_access_secret_key, algorithm)
+        self.JWT_REFRESH_SECRET_KEY = jwt_refresh_keys or JWTKeySet.from_secret(jwt_refresh_secret_key, algorithm)
         self.ALGORITHM = algorithm
+        self.VERIFY_SIGNATURE = verify_signature
+        self.OPAQUE_REFRESH_TOKENS = opaque_refresh_tokens
+        self.REFRESH_TOKEN_GRACE_SECONDS = refresh_token_grace_seconds
         self.JWT_ACCESS_TOKEN_LIFETIME_SECONDS = jwt_access_token_lifetime_seconds
         self.JWT_REFRESH_TOKEN_LIFETIME_SECONDS = jwt_refresh_token_lifetime_seconds
+        self.MAX_SESSIONS_PER_USER = max_sessions_per_user
         self.jwt_repo = jwt_repo
+        self.revocation_repo = revocation_repo
+        self.revocation_list = revocation_list
+        self.claims_provider = claims_provider
+        self._refreshes_in_flight: dict[str, asyncio.Future] = {}
 
+    @instrument('jwt_service.create_auth_tokens')
     async def create_auth_tokens(self, user_id: int):
+        """
+        SIGNING NEVER SUSPENDS, SO gather OVERLAPS NOTHING UNLESS ACCESS TOKEN CREATION AWAITS I/O
+        (claims_provider OR OVERRIDDEN add_extra_info_to_access_token), THEN IT RUNS WHILE REFRESH TOKEN IS SAVED
+        """
+        access_token, refresh_token = await asyncio.gather(
+            self.create_access_token(user_id),
+            self.create_refresh_token(user_id),
+        )
         return {
-            'access_token': await self.create_access_token(user_id),
-            'refresh_token': await self.create_refresh_token(user_id),
+            'access_token': access_token,
+            'refresh_token': refresh_token,
         }
 
+    @instrument('jwt_service.create_auth_tokens_many')
+    async def create_auth_tokens_many(self, user_ids: list[int]) -> list[dict]:
+        """ ALL REFRESH TOKENS ARE SAVED WITH ONE REPOSITORY CALL, CLAIMS PROVIDER LOADS ALL CLAIMS WITH ONE CALL """
+        refresh_tokens = [self.generate_refresh_token(user_id) for user_id in user_ids]
+        access_tokens, _ = await asyncio.gather(
+            asyncio.gather(*[self.create_access_token(user_id) for user_id in user_ids]),
+            self.jwt_repo.save_refresh_tokens(
+                list(zip(user_ids, refresh_tokens)),
+                self.JWT_REFRESH_TOKEN_LIFETIME_SECONDS,
+                self.MAX_SESSIONS_PER_USER,
+            ),
+        )
+        return [
+            {'access_token': access_token, 'refresh_token': refresh_token}
+            for access_token, refresh_token in zip(access_tokens, refresh_tokens)
+        ]
+
     async def add_extra_info_to_access_token(self, user_id: int) -> dict:
         pass
 
-    async def create_refresh_token(self, user_id: int) -> str:
-        to_encode = {'sub': str(user_id)}
-        encoded_jwt = generate_jwt(
+    def generate_refresh_token(self, user_id: int) -> str:
+        """ jti MAKES EVERY REFRESH TOKEN UNIQUE, EVEN IF ISSUED IN THE SAME SECOND """
+        if self.OPAQUE_REFRESH_TOKENS:
+            return secrets.token_urlsafe(32)
+        to_encode = {'sub': str(user_id), 'jti': secrets.token_hex(16)}
+        return generate_jwt(
             data=to_encode,
             lifetime_seconds=self.JWT_REFRESH_TOKEN_LIFETIME_SECONDS,
             secret=self.JWT_REFRESH_SECRET_KEY,
             algorithm=self.ALGORITHM,
         )
-        await self.jwt_repo.save_refresh_token(user_id, encoded_jwt)
+
+    async def create_refresh_token(self, user_id: int) -> str:
+        encoded_jwt = self.generate_refresh_token(user_id)
+        await self.jwt_repo.save_refresh_token(
+            user_id,
+            encoded_jwt,
+            self.JWT_REFRESH_TOKEN_LIFETIME_SECONDS,
+            self.MAX_SESSIONS_PER_USER,
+        )
         return encoded_jwt
 
     async def create_access_token(self, user_id: int) -> str:
-        to_encode = {'sub': str(user_id)}
+        """ jti IDENTIFIES ACCESS TOKEN IN REVOCATION LIST """
+        to_encode = {'sub': str(user_id), 'jti': secrets.token_hex(16)}
 
-        extra_data = await self.add_extra_info_to_access_token(user_id)
+        if self.claims_provider is not None:
+            extra_data = await self.claims_provider.get_claims(user_id)
+        else:
+            extra_data = await self.add_extra_info_to_access_token(user_id)
         if extra_data:
             to_encode.update(extra_data)
 
@@ -53,23 +131,99 @@ class JWTService:
             algorithm=self.ALGORITHM,
         )
 
+    @instrument('jwt_service.refresh_auth_tokens')
     async def refresh_auth_tokens(self, refresh_token: str):
+        """
+        CONCURRENT REFRESHES OF THE SAME TOKEN IN THIS PROCESS, E.G. FROM SEVERAL BROWSER TABS,
+        SHARE ONE ROTATION INSTEAD OF LOOKING LIKE TOKEN REUSE
+        """
+        task = self._refreshes_in_flight.get(refresh_token)
+        if task is None:
+            task = asyncio.ensure_future(self.rotate_auth_tokens(refresh_token))
+            self._refreshes_in_flight[refresh_token] = task
+            task.add_done_callback(lambda _: self._refreshes_in_flight.pop(refresh_token, None))
+        tokens = await asyncio.shield(task)
+        return dict(tokens)
+
+    async def rotate_auth_tokens(self, refresh_token: str):
+        if self.OPAQUE_REFRESH_TOKENS:
+            return await self.rotate_opaque_auth_tokens(refresh_token)
         refresh_token_data = decode_jwt(
             encoded_jwt=refresh_token,
             secret=self.JWT_REFRESH_SECRET_KEY,
             algorithm=self.ALGORITHM,
+            verify_signature=self.VERIFY_SIGNATURE,
         )
-        await self.delete_user_tokens_if_not_exist(refresh_token, refresh_token_data)
+        user_id = int(refresh_token_data.get('sub'))
+        """
+        DELETE OLD TOKEN AND SAVE NEW ONE IN ONE ATOMIC STEP
+        IF OLD TOKEN WAS DELETED EARLY, MOST LIKELY BY HACKER, ALL USER TOKENS ARE DELETED TOO
+        UNLESS IT WAS ROTATED WITHIN GRACE WINDOW, THEN THE SAME NEW TOKEN IS RETURNED AGAIN
+        """
+        rotation = await self.rotate_refresh_token(refresh_token, user_id)
+        return {
+            'access_token': await self.create_access_token(user_id),
+            'refresh_token': rotation.replacement_token,
+        }
 
-        tokens = await self.create_auth_tokens(int(refresh_token_data.get('sub')))
-        return tokens
+    async def rotate_opaque_auth_tokens(self, refresh_token: str):
+        """
+        OWNER IS KNOWN ONLY FROM REPOSITORY, SO UNKNOWN OR EXPIRED TOKEN IS REJECTED
+        REUSE OF ALREADY ROTATED TOKEN CAN NOT BE TRACED TO USER, ITS TOKENS ARE KEPT
+        """
+        rotation = refresh_token and await self.rotate_refresh_token(refresh_token, None)
+        if not rotation or not rotation.owner_id:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail='Could not validate credentials',
+                headers={'WWW-Authenticate': 'Bearer'},
+            )
+        return {
+            'access_token': await self.create_access_token(rotation.owner_id),
+            'refresh_token': rotation.replacement_token,
+        }
+
+    async def rotate_refresh_token(self, refresh_token: str, user_id: int | None) -> RefreshTokenRotation:
+        """ RETURNS OWNER OF OLD TOKEN AND TOKEN THAT REPLACES IT """
+        new_refresh_token = self.generate_refresh_token(user_id)
+        if self.REFRESH_TOKEN_GRACE_SECONDS:
+            rotation = await self.jwt_repo.rotate_refresh_token_with_grace(
+                refresh_token,
+                new_refresh_token,
+                user_id,
+                self.JWT_REFRESH_TOKEN_LIFETIME_SECONDS,
+                self.REFRESH_TOKEN_GRACE_SECONDS,
+            )
+        else:
+            rotation = RefreshTokenRotation(
+                await self.jwt_repo.rotate_refresh_token(
+                    refresh_token,
+                    new_refresh_token,
+                    user_id,
+                    self.JWT_REFRESH_TOKEN_LIFETIME_SECONDS,
+                ),
+            )
+        if rotation.replacement_token:
+            record('refresh_token_check', 'grace')
+            return rotation
+        if rotation.owner_id:
+            record('refresh_token_check', 'ok')
+        else:
+            record('refresh_token_check', 'unknown' if user_id is None else 'reuse_detected')
+        return RefreshTokenRotation(rotation.owner_id, new_refresh_token)
 
+    @instrument('jwt_service.delete_refresh_token')
     async def delete_refresh_token(self, refresh_token: str) -> None:
+        if self.OPAQUE_REFRESH_TOKENS:
+            if refresh_token and not await self.jwt_repo.delete_refresh_token(refresh_token):
+                await self.delete_rotated_refresh_token(refresh_token)
+            return
         refresh_token_data = decode_jwt(
             encoded_jwt=refresh_token,
             secret=self.JWT_REFRESH_SECRET_KEY,
             algorithm=self.ALGORITHM,
             soft=True,
+            verify_signature=self.VERIFY_SIGNATURE,
         )
         await self.delete_user_tokens_if_not_exist(refresh_token, refresh_token_data)
 
@@ -78,6 +232,41 @@ class JWTService:
         """
         DELETE TOKEN AND RETURNING ID
         IF ID IS NONE THAT MEANS ID WAS DELETED EARLY, MOST LIKELY BY HACKER
+        UNLESS IT WAS ROTATED WITHIN GRACE WINDOW, THEN ITS REPLACEMENT IS DELETED INSTEAD
         """
+        if not deleted_id and await self.delete_rotated_refresh_token(token):
+            return
+        record('refresh_token_check', 'ok' if deleted_id else 'reuse_detected')
         if not deleted_id:
             await self.jwt_repo.delete_all_user_refresh_tokens(int(token_data.get('sub')))
+
+    async def delete_rotated_refresh_token(self, token: str) -> bool:
+        """ LOGOUT WITH TOKEN ROTATED WITHIN GRACE WINDOW ENDS THE SESSION THAT CONTINUES WITH ITS REPLACEMENT """
+        if not self.REFRESH_TOKEN_GRACE_SECONDS:
+            return False
+        rotation = await self.jwt_repo.get_rotation(token)
+        if rotation is None:
+            return False
+        record('refresh_token_check', 'grace')
+        await self.jwt_repo.delete_refresh_token(rotation.replacement_token)
+        return True
+
+    @instrument('jwt_service.revoke_access_token')
+    async def revoke_access_token(self, access_token: str) -> None:
+        """ OTHER INSTANCES SEE REVOCATION AFTER THEIR NEXT RevocationListSyncer RUN """
+        if self.revocation_repo is None:
+            raise RevocationNotConfigured()
+        access_token_data = decode_jwt(
+            encoded_jwt=access_token,
+            secret=self.JWT_ACCESS_SECRET_KEY,
+            algorithm=self.ALGORITHM,
+            soft=True,
+            verify_signature=self.VERIFY_SIGNATURE,
+        )
+        jti = access_token_data.get('jti')
+        if jti is None:
+            """ TOKEN IS EXPIRED ALREADY OR WAS ISSUED WITHOUT jti """
+            return
+        await self.revocation_repo.revoke(jti, access_token_data['exp'])
+        if self.revocation_list is not None:
+            self.revocation_list.add(jti, access_token_data['exp'])
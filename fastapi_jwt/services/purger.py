@@ -0,0 +1,42 @@
+import asyncio
+import logging
+
+from fastapi_jwt.repositories.jwt.base import JWTBaseRepository
+from fastapi_jwt.services.background import BackgroundService
+
+
+logger = logging.getLogger(__name__)
+
+
+class RefreshTokenPurger(BackgroundService):
+    """
+    PERIODICALLY DELETES EXPIRED REFRESH TOKENS IN BOUNDED BATCHES
+    EACH BATCH IS A SEPARATE SHORT TRANSACTION
+    """
+
+    def __init__(
+            self,
+            jwt_repo: JWTBaseRepository,
+            interval_seconds: float = 60,
+            batch_size: int = 1000,
+    ):
+        self.jwt_repo = jwt_repo
+        self.interval_seconds = interval_seconds
+        self.batch_size = batch_size
+
+    async def purge(self) -> int:
+        purged = 0
+        while True:
+            deleted = await self.jwt_repo.delete_expired_refresh_tokens(self.batch_size)
+            purged += deleted
+            if deleted < self.batch_size:
+                return purged
+            await asyncio.sleep(0)
+
+    async def run(self) -> None:
+        while True:
+            try:
+                await self.purge()
+            except Exception:
+                logger.exception('Failed to purge expired refresh tokens')
+            await asyncio.sleep(self.interval_seconds)
@@ -0,0 +1,73 @@
+import asyncio
+import logging
+
+from fastapi_jwt.auth.revocation import RevocationList
+from fastapi_jwt.repositories.revocation.base import RevocationBaseRepository
+from fastapi_jwt.services.background import BackgroundService
+
+
+logger = logging.getLogger(__name__)
+
+
+class RevocationListSyncer(BackgroundService):
+    """
+    KEEPS IN-MEMORY RevocationList IN SYNC WITH REPOSITORY
+    EVERY RUN FETCHES ONLY REVOCATIONS MADE SINCE THE PREVIOUS ONE
+    EVERY full_sync_every RUNS THE LIST IS RELOADED FROM SCRATCH AFTER ALL EXPIRED ROWS ARE PURGED
+    """
+
+    def __init__(
+            self,
+            revocation_repo: RevocationBaseRepository,
+            revocation_list: RevocationList,
+            interval_seconds: float = 5,
+            batch_size: int = 1000,
+            full_sync_every: int = 120,
+    ):
+        self.revocation_repo = revocation_repo
+        self.revocation_list = revocation_list
+        self.interval_seconds = interval_seconds
+        self.batch_size = batch_size
+        self.full_sync_every = full_sync_every
+        self.cursor = None
+        self._runs = 0
+
+    async def sync(self) -> int:
+        """ RETURNS FETCHED COUNT """
+        fetched = 0
+        while True:
+            entries, self.cursor = await self.revocation_repo.fetch_revoked(self.cursor, self.batch_size)
+            self.revocation_list.update(entries)
+            fetched += len(entries)
+            if len(entries) < self.batch_size:
+                break
+            await asyncio.sleep(0)
+        self.revocation_list.prune()
+        return fetched
+
+    async def purge(self) -> int:
+        """ DELETES EXPIRED REVOCATIONS BATCH BY BATCH UNTIL NONE ARE LEFT, RETURNS DELETED COUNT """
+        purged = 0
+        while True:
+            deleted = await self.revocation_repo.delete_expired_revocations(self.batch_size)
+            purged += deleted
+            if deleted < self.batch_size:
+                return purged
+            await asyncio.sleep(0)
+
+    async def full_sync(self) -> int:
+        await self.purge()
+        self.cursor = None
+        return await self.sync()
+
+    async def run(self) -> None:
+        while True:
+            try:
+                if self._runs % self.full_sync_every == 0:
+                    await self.full_sync()
+                else:
+                    await self.sync()
+            except Exception:
+                logger.exception('Failed to sync revoked access tokens')
+            self._runs += 1
+            await asyncio.sleep(self.interval_seconds)
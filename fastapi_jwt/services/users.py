@@ -1,27 +1,71 @@
+import logging
+from typing import TYPE_CHECKING
+
 from fastapi import HTTPException
 from starlette import status
 
+from fastapi_jwt.instrumentation.observer import instrument, record
 from fastapi_jwt.managers.users import UserManager
-from fastapi_jwt.repositories.users import UserRepository
+from fastapi_jwt.utils.bloom import BloomFilter
+
+if TYPE_CHECKING:
+    """ SQLALCHEMY IS LOADED BY THE REPOSITORY PASSED IN, NOT BY THIS MODULE """
+    from fastapi_jwt.repositories.users import UserRepository
+
+logger = logging.getLogger(__name__)
 
 
 class UserService:
-    def __init__(self, user_repo: UserRepository):
+    def __init__(self, user_repo: 'UserRepository', username_filter: BloomFilter | None = None):
+        """
+        username_filter REJECTS UNKNOWN USERNAMES WITHOUT DATABASE QUERY, FILL IT WITH load_username_filter
+        UNTIL LOADING FINISHES FILTER IS BYPASSED, HALF LOADED FILTER WOULD REJECT EXISTING USERS
+        """
         self.user_repo = user_repo
+        self.username_filter = username_filter
+        self.username_filter_loaded = False
+
+    async def load_username_filter(self, batch_size: int = 10000) -> None:
+        if self.username_filter is None:
+            return
+        async for username in self.user_repo.iter_usernames(batch_size):
+            self.username_filter.add(username)
+        self.username_filter_loaded = True
+
+    def add_username(self, username: str) -> None:
+        """ CALL IT WHEN USER IS CREATED """
+        if self.username_filter is not None:
+            self.username_filter.add(username)
 
+    @instrument('user_service.authenticate')
     async def authenticate(
             self,
             username_field: str,
             input_password: str,
             **kwargs,
     ) -> int:
-        user = await self.user_repo.get_info_for_authenticate(username_field)
-        if not user or not UserManager.check_password(
+        user = None
+        use_filter = self.username_filter is not None and self.username_filter_loaded
+        if not use_filter or username_field in self.username_filter:
+            user = await self.user_repo.get_info_for_authenticate(username_field)
+            if use_filter:
+                record('username_filter', 'passed' if user else 'false_positive')
+        else:
+            record('username_filter', 'rejected')
+        """ UNKNOWN USER IS CHECKED AGAINST DUMMY HASH, SO RESPONSE TIME DOES NOT REVEAL IT """
+        password_from_db = user.password if user else await UserManager.aget_dummy_password()
+        if not await UserManager.acheck_password(
                 input_password=input_password,
-                password_from_db=user.password,
-        ):
+                password_from_db=password_from_db,
+        ) or not user:
             raise HTTPException(
                 status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
                 detail='Credentials are not valid',
             )
+        if UserManager.needs_rehash(user.password):
+            """ STORED HASH USES OLD FORMAT OR OLD COST, PLAIN PASSWORD IS KNOWN ONLY NOW, LOGIN DOES NOT DEPEND ON IT """
+            try:
+                await self.user_repo.update_password(user.id, await UserManager.amake_password(input_password))
+            except Exception:
+                logger.exception('Failed to rehash password of user %s', user.id)
         return user.id
@@ -0,0 +1 @@
+from fastapi_jwt.utils.bloom import BloomFilter
@@ -13,5 +13,9 @@ setup(
     long_description_content_type='text/markdown',
     url='https://github.com/MercyClassic/fastapi_jwt',
     author='MercyClassic',
-    requires=['PyJWT'],  # SQLAlchemy/redis
+    requires=['PyJWT'],
+    extras_require={
+        'sqlalchemy': ['SQLAlchemy>=2.0.16', 'asyncpg>=0.28.0'],
+        'redis': ['redis>=4.6.0'],
+    },
 )
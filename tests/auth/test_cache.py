@@ -0,0 +1,86 @@
+import time
+
+import pytest
+from fastapi import HTTPException
+
+from fastapi_jwt.auth.cache import AccessTokenCache
+from fastapi_jwt.auth.jwt import generate_jwt
+from fastapi_jwt.auth.keys import JWTKeySet
+from fastapi_jwt.managers.users import UserManager
+
+
+class AccessTokenCacheTests:
+    def test_entries_are_keyed_by_key_id(self):
+        cache = AccessTokenCache()
+        payload = {'sub': '1', 'exp': time.time() + 60}
+        cache.set('token', payload, 'k1')
+        assert cache.get('token', 'k1') == payload
+        assert cache.get('token', 'k2') is None
+        assert cache.get('token') is None
+        cache.invalidate('token', 'k1')
+        assert cache.get('token', 'k1') is None
+
+    def test_entry_never_outlives_exp(self):
+        cache = AccessTokenCache(max_ttl_seconds=60)
+        cache.set('expired', {'sub': '1', 'exp': time.time() - 1})
+        cache.set('without exp', {'sub': '1'})
+        assert cache.get('expired') is None
+        assert cache.get('without exp') == {'sub': '1'}
+
+    def test_lru_eviction(self):
+        cache = AccessTokenCache(max_size=2)
+        for token in ('a', 'b'):
+            cache.set(token, {'sub': token, 'exp': time.time() + 60})
+        cache.get('a')
+        cache.set('c', {'sub': 'c', 'exp': time.time() + 60})
+        assert len(cache) == 2
+        assert cache.get('b') is None and cache.get('a') is not None
+
+
+class UserManagerCacheTests:
+    @pytest.fixture(autouse=True)
+    def cache(self, monkeypatch) -> AccessTokenCache:
+        cache = AccessTokenCache()
+        monkeypatch.setattr(UserManager, 'access_token_cache', cache)
+        return cache
+
+    @pytest.fixture
+    def keys(self, monkeypatch) -> JWTKeySet:
+        keys = JWTKeySet()
+        keys.add_key('old', 'HS256', signing_key='old secret ' * 4)
+        keys.add_key('new', 'HS256', signing_key='new secret ' * 4)
+        monkeypatch.setattr(UserManager, 'jwt_access_keys', keys)
+        return keys
+
+    def test_verified_token_is_cached_with_its_key_id(self, cache: AccessTokenCache, keys: JWTKeySet):
+        token = generate_jwt({'sub': '1'}, 60, keys, 'HS256')
+        assert UserManager.get_user_info_from_access_token(token) == {'user_id': 1}
+        assert cache.get(token, 'new') is not None
+        assert cache.get(token) is None
+        assert UserManager.get_user_info_from_access_token(token) == {'user_id': 1}
+        assert cache.hits == 2
+
+    def test_removed_key_rejects_cached_token(self, keys: JWTKeySet):
+        keys.signing = keys.keys['old']
+        token = generate_jwt({'sub': '1'}, 60, keys, 'HS256')
+        assert UserManager.get_user_info_from_access_token(token) == {'user_id': 1}
+        keys.remove_key('old')
+        with pytest.raises(HTTPException) as exc_info:
+            UserManager.get_user_info_from_access_token(token)
+        assert exc_info.value.status_code == 401
+
+    def test_forged_token_is_not_cached(self, cache: AccessTokenCache):
+        token = generate_jwt({'sub': '1'}, 60, 'not the secret', 'HS256')
+        for _ in range(2):
+            with pytest.raises(HTTPException):
+                UserManager.get_user_info_from_access_token(token)
+        assert len(cache) == 0
+
+    def test_unverified_token_is_not_cached(self, cache: AccessTokenCache, monkeypatch):
+        monkeypatch.setattr(UserManager, 'verify_signature', False)
+        token = generate_jwt({'sub': '1'}, 60, 'not the secret', 'HS256')
+        assert UserManager.get_user_info_from_access_token(token) == {'user_id': 1}
+        assert len(cache) == 0
+        monkeypatch.setattr(UserManager, 'verify_signature', True)
+        with pytest.raises(HTTPException):
+            UserManager.get_user_info_from_access_token(token)
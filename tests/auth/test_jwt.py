@@ -0,0 +1,93 @@
+import time
+
+import jwt
+import pytest
+from fastapi import HTTPException
+from jwt.exceptions import DecodeError, ExpiredSignatureError, InvalidAlgorithmError, InvalidSignatureError
+
+from fastapi_jwt.auth.jwt import decode_jwt, generate_jwt
+from fastapi_jwt.auth.verifier import HMACVerifier
+
+
+class HMACVerifierTests:
+    @staticmethod
+    def make_token(payload: dict, secret: str = 'JWT', algorithm: str = 'HS256') -> str:
+        return jwt.encode(payload, secret, algorithm)
+
+    def test_valid_token(self):
+        token = self.make_token({'sub': '1', 'exp': time.time() + 60})
+        assert HMACVerifier('JWT').verify(token)['sub'] == '1'
+
+    def test_tampered_signature(self):
+        token = self.make_token({'sub': '1', 'exp': time.time() + 60})
+        signing_input, _, signature = token.rpartition('.')
+        tampered = f"{signing_input}.{signature[:-2]}{'AA' if signature[-2:] != 'AA' else 'BB'}"
+        with pytest.raises(InvalidSignatureError):
+            HMACVerifier('JWT').verify(tampered)
+
+    def test_tampered_payload(self):
+        token = self.make_token({'sub': '1', 'exp': time.time() + 60})
+        forged = self.make_token({'sub': '2', 'exp': time.time() + 60})
+        header, _, signature = token.split('.')
+        with pytest.raises(InvalidSignatureError):
+            HMACVerifier('JWT').verify(f'{header}.{forged.split(".")[1]}.{signature}')
+
+    def test_wrong_secret(self):
+        token = self.make_token({'sub': '1', 'exp': time.time() + 60}, secret='other')
+        with pytest.raises(InvalidSignatureError):
+            HMACVerifier('JWT').verify(token)
+
+    @pytest.mark.parametrize('algorithm', ['HS384', 'HS512'])
+    def test_wrong_algorithm(self, algorithm: str):
+        token = self.make_token({'sub': '1', 'exp': time.time() + 60}, algorithm=algorithm)
+        with pytest.raises(InvalidAlgorithmError):
+            HMACVerifier('JWT').verify(token)
+
+    def test_none_algorithm(self):
+        token = jwt.encode({'sub': '1', 'exp': time.time() + 60}, None, 'none')
+        with pytest.raises(InvalidAlgorithmError):
+            HMACVerifier('JWT').verify(token)
+        with pytest.raises(InvalidAlgorithmError):
+            HMACVerifier('JWT').verify(token, verify_signature=False)
+
+    def test_expired_token(self):
+        token = self.make_token({'sub': '1', 'exp': time.time() - 1})
+        with pytest.raises(ExpiredSignatureError):
+            HMACVerifier('JWT').verify(token)
+        assert HMACVerifier('JWT').verify(token, verify_exp=False)['sub'] == '1'
+
+    @pytest.mark.parametrize('token', ['', 'abc', 'a.b', 'a.b.c.d', '!!.??.**'])
+    def test_malformed_token(self, token: str):
+        with pytest.raises(DecodeError):
+            HMACVerifier('JWT').verify(token)
+
+
+class DecodeJWTTests:
+    def test_signature_is_verified_by_default(self):
+        token = generate_jwt({'sub': '1'}, 60, 'other', 'HS256')
+        with pytest.raises(HTTPException) as exc_info:
+            decode_jwt(token, 'JWT', 'HS256')
+        assert exc_info.value.status_code == 401
+        assert decode_jwt(token, 'JWT', 'HS256', verify_signature=False)['sub'] == '1'
+
+    def test_none_algorithm(self):
+        token = jwt.encode({'sub': '1', 'exp': time.time() + 60}, None, 'none')
+        with pytest.raises(HTTPException) as exc_info:
+            decode_jwt(token, 'JWT', 'HS256')
+        assert exc_info.value.status_code == 401
+
+    def test_expired_token(self):
+        token = jwt.encode({'sub': '1', 'exp': time.time() - 1}, 'JWT', 'HS256')
+        with pytest.raises(HTTPException) as exc_info:
+            decode_jwt(token, 'JWT', 'HS256')
+        assert exc_info.value.detail == 'Token expired'
+        assert decode_jwt(token, 'JWT', 'HS256', soft=True) == {'sub': '1'}
+
+    @pytest.mark.parametrize('exp', [None, 'tomorrow'])
+    @pytest.mark.parametrize('soft', [False, True])
+    def test_missing_exp(self, exp: str | None, soft: bool):
+        payload = {'sub': '1'} if exp is None else {'sub': '1', 'exp': exp}
+        token = jwt.encode(payload, 'JWT', 'HS256')
+        with pytest.raises(HTTPException) as exc_info:
+            decode_jwt(token, 'JWT', 'HS256', soft=soft, verify_signature=False)
+        assert exc_info.value.status_code == 401
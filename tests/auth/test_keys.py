@@ -0,0 +1,72 @@
+import jwt
+import pytest
+from cryptography.hazmat.primitives.asymmetric import ec
+from fastapi import HTTPException
+from jwt.exceptions import InvalidAlgorithmError, InvalidKeyError
+
+from fastapi_jwt.auth.jwt import decode_jwt, generate_jwt
+from fastapi_jwt.auth.keys import JWTKeySet
+
+
+class JWTKeySetTests:
+    @pytest.fixture
+    def keys(self) -> JWTKeySet:
+        keys = JWTKeySet()
+        keys.add_key('hmac', 'HS256', signing_key='secret ' * 8)
+        return keys
+
+    def test_token_is_verified_by_its_kid(self, keys: JWTKeySet):
+        token = generate_jwt({'sub': '1'}, 60, keys, 'HS256')
+        assert jwt.get_unverified_header(token)['kid'] == 'hmac'
+        assert decode_jwt(token, keys, 'HS256')['sub'] == '1'
+
+    @pytest.mark.parametrize('headers', [{'kid': 'unknown'}, None])
+    def test_unknown_kid_is_rejected(self, keys: JWTKeySet, headers: dict | None):
+        """ SAME SECRET UNDER A KID THAT IS NOT IN THE SET, OR WITHOUT KID AT ALL """
+        token = jwt.encode({'sub': '1', 'exp': 2 ** 40}, 'secret ' * 8, 'HS256', headers=headers)
+        with pytest.raises(InvalidKeyError):
+            keys.get_verifying_key(jwt.get_unverified_header(token).get('kid'))
+        with pytest.raises(HTTPException) as exc_info:
+            decode_jwt(token, keys, 'HS256')
+        assert exc_info.value.status_code == 401
+
+    def test_removed_key_is_rejected(self, keys: JWTKeySet):
+        token = generate_jwt({'sub': '1'}, 60, keys, 'HS256')
+        keys.remove_key('hmac')
+        assert keys.signing is None
+        with pytest.raises(HTTPException):
+            decode_jwt(token, keys, 'HS256')
+        with pytest.raises(InvalidKeyError):
+            generate_jwt({'sub': '1'}, 60, keys, 'HS256')
+
+    def test_rotation_keeps_old_tokens_valid(self, keys: JWTKeySet):
+        old_token = generate_jwt({'sub': '1'}, 60, keys, 'HS256')
+        private_key = ec.generate_private_key(ec.SECP256R1())
+        keys.add_key('ec', 'ES256', signing_key=private_key)
+        new_token = generate_jwt({'sub': '2'}, 60, keys, 'HS256')
+        assert jwt.get_unverified_header(new_token) == {'alg': 'ES256', 'kid': 'ec', 'typ': 'JWT'}
+        assert decode_jwt(old_token, keys, 'HS256')['sub'] == '1'
+        assert decode_jwt(new_token, keys, 'HS256')['sub'] == '2'
+
+    def test_public_key_only(self):
+        private_key = ec.generate_private_key(ec.SECP256R1())
+        issuer = JWTKeySet()
+        issuer.add_key('ec', 'ES256', signing_key=private_key)
+        resource_server = JWTKeySet()
+        resource_server.add_key('ec', 'ES256', verifying_key=private_key.public_key())
+        assert resource_server.signing is None
+
+        token = generate_jwt({'sub': '1'}, 60, issuer, 'ES256')
+        assert decode_jwt(token, resource_server, 'ES256')['sub'] == '1'
+
+    def test_algorithm_comes_from_key_not_header(self, keys: JWTKeySet):
+        forged = jwt.encode({'sub': '1', 'exp': 2 ** 40}, 'secret ' * 8, 'HS512', headers={'kid': 'hmac'})
+        with pytest.raises(HTTPException):
+            decode_jwt(forged, keys, 'HS512')
+
+    def test_invalid_keys(self, keys: JWTKeySet):
+        with pytest.raises(InvalidAlgorithmError):
+            keys.add_key('bad', 'XX256', signing_key='secret')
+        with pytest.raises(InvalidKeyError):
+            keys.add_key('empty', 'HS256')
+        assert set(keys.keys) == {'hmac'}
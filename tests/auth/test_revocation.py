@@ -0,0 +1,58 @@
+import pytest
+
+from fastapi_jwt.auth import revocation
+from fastapi_jwt.auth.revocation import RevocationList
+
+
+class RevocationListTests:
+    @pytest.fixture(autouse=True)
+    def clock(self, monkeypatch) -> list[float]:
+        clock = [1000.0]
+        monkeypatch.setattr(revocation.time, 'time', lambda: clock[0])
+        return clock
+
+    def test_add(self):
+        revocation_list = RevocationList()
+        revocation_list.add('a', 1060)
+        revocation_list.add('expired', 999)
+        assert 'a' in revocation_list
+        assert 'expired' not in revocation_list
+        assert None not in revocation_list
+        assert len(revocation_list) == 1
+
+    def test_prune(self, clock: list[float]):
+        revocation_list = RevocationList()
+        revocation_list.update([('a', 1060), ('b', 1002), ('c', 1001)])
+        """ RE-ADDED WITH LATER exp, STALE HEAP ENTRY MUST NOT DROP IT """
+        revocation_list.add('b', 1120)
+        clock[0] = 1010
+        assert revocation_list.prune() == 1
+        assert 'a' in revocation_list and 'b' in revocation_list and 'c' not in revocation_list
+
+    def test_overflow_never_drops_not_expired_entries(self):
+        revocation_list = RevocationList(max_size=2)
+        for index in range(5):
+            revocation_list.add(f'jti{index}', 1010 + index)
+        assert revocation_list.overflowed
+        assert all(f'jti{index}' in revocation_list for index in range(5))
+
+    def test_overflow_prunes_expired_entries(self, clock: list[float]):
+        revocation_list = RevocationList(max_size=2)
+        revocation_list.update([('a', 1060), ('b', 1005)])
+        clock[0] = 1010
+        revocation_list.add('c', 1060)
+        assert not revocation_list.overflowed
+        assert 'a' in revocation_list and 'c' in revocation_list and 'b' not in revocation_list
+
+    def test_overflow_is_reset(self, clock: list[float]):
+        revocation_list = RevocationList(max_size=1)
+        revocation_list.update([('a', 1060), ('b', 1005)])
+        assert revocation_list.overflowed
+        clock[0] = 1010
+        revocation_list.prune()
+        assert not revocation_list.overflowed
+        revocation_list.add('c', 1060)
+        assert revocation_list.overflowed
+        revocation_list.clear()
+        assert not revocation_list.overflowed
+        assert len(revocation_list) == 0
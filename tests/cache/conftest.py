@@ -0,0 +1,2 @@
+""" CACHE TESTS KEEP USERS IN POSTGRES, SO THEY SHARE SQL DATABASE FIXTURES """
+from tests.sqldb.conftest import event_loop, prepare_database, session  # noqa: F401
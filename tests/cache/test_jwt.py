@@ -5,7 +5,7 @@ from sqlalchemy import insert
 from sqlalchemy.ext.asyncio import AsyncSession
 from starlette.requests import Request
 
-from fastapi_jwt.auth.jwt import decode_jwt, generate_jwt
+from fastapi_jwt.auth.jwt import decode_jwt, generate_jwt, get_token_digest
 from fastapi_jwt.exceptions.jwt import FailGetAttribute
 from fastapi_jwt.managers.users import UserManager
 from fastapi_jwt.schemas.jwt import AuthenticateSchema
@@ -13,7 +13,7 @@ from fastapi_jwt.repositories.jwt.cache import JWTRepository
 from fastapi_jwt.repositories.users import UserRepository
 from fastapi_jwt.services.jwt import JWTService
 from fastapi_jwt.services.users import UserService
-from tests.conftest import (
+from tests.sqldb.conftest import (
     TestAccountTable,
 )
 from fastapi_jwt.actions.jwt import login, refresh_access_token, logout
@@ -103,7 +103,7 @@ class JWTTests:
 
     @staticmethod
     async def assert_db_token_count(result_count: int) -> None:
-        keys = redis.keys('*')
+        keys = redis.keys(f'{JWTRepository.token_key_prefix}*')
         assert len(keys) == result_count
 
     @pytest.mark.parametrize(
@@ -147,12 +147,12 @@ class JWTTests:
         self.assert_tokens(tuple(response.values()))
         assert response.get('refresh_token') != token
 
-        keys = redis.keys('*')
-        assert keys[0].decode('utf-8').split(',')[0] != token
+        keys = redis.keys(f'{JWTRepository.token_key_prefix}*')
+        assert keys[0].decode('utf-8') != f'{JWTRepository.token_key_prefix}{get_token_digest(token)}'
 
     @staticmethod
     async def save_refresh_token_to_db(token: str):
-        redis.set(f'1,{token}', 1)
+        await JWTRepository(redis).save_refresh_token(1, token)
 
     async def test_count_refresh_token_if_it_was_hacked(self):
         await self.save_refresh_token_to_db('example token')
@@ -175,6 +175,17 @@ class JWTTests:
         await refresh_access_token(request, jwt_service)
         await self.assert_db_token_count(1)
 
+    async def test_migrate_legacy_keys(self):
+        redis.set('1,legacy token', 1)
+        redis.set('2,other legacy token', 1)
+
+        migrated = await JWTRepository(redis).migrate_legacy_keys()
+
+        assert migrated == 2
+        assert redis.keys('*,*') == []
+        await self.assert_db_token_count(2)
+        assert await JWTRepository(redis).delete_refresh_token('legacy token') == 1
+
     @pytest.mark.parametrize(
         'token, no_exception',
         [
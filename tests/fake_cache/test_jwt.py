@@ -0,0 +1,240 @@
+import asyncio
+import threading
+import time
+
+import fakeredis
+import pytest
+from redis.asyncio import Redis
+
+from fastapi_jwt.auth.jwt import generate_jwt, get_token_digest
+from fastapi_jwt.repositories.jwt.base import open_replacement_token, seal_replacement_token
+from fastapi_jwt.repositories.jwt import cache
+from fastapi_jwt.repositories.jwt.cache import JWTRepository
+from fastapi_jwt.repositories.jwt.cluster import ClusterJWTRepository
+from fastapi_jwt.services.jwt import JWTService
+
+
+def make_token(user_id: int = 1, lifetime_seconds: int = 60, **data) -> str:
+    return generate_jwt({'sub': str(user_id), **data}, lifetime_seconds, 'JWT', 'HS256')
+
+
+class JWTTests:
+    """ SAME LUA SCRIPTS AS tests/cache, RUN AGAINST fakeredis WITH SYNC AND ASYNC CLIENTS """
+
+    @pytest.fixture(params=['redis', 'redis.asyncio'])
+    def redis(self, request):
+        if request.param == 'redis':
+            return fakeredis.FakeRedis()
+        return fakeredis.FakeAsyncRedis()
+
+    @pytest.fixture(params=[JWTRepository, ClusterJWTRepository])
+    def jwt_repo(self, request, redis) -> JWTRepository:
+        return request.param(redis)
+
+    async def get_raw(self, jwt_repo: JWTRepository, key: str):
+        return await jwt_repo.execute(jwt_repo.redis.get, key)
+
+    def test_seal_replacement_token(self):
+        old_token, new_token = make_token(jti='old'), make_token(jti='new')
+        sealed = seal_replacement_token(old_token, new_token)
+        assert new_token not in sealed
+        assert ':' not in sealed
+        assert open_replacement_token(old_token, sealed) == new_token
+        assert seal_replacement_token(make_token(jti='other'), new_token) != sealed
+
+    async def test_grace_key_does_not_store_replacement_token(self, jwt_repo: JWTRepository):
+        old_token, new_token = make_token(jti='old'), make_token(jti='new')
+        await jwt_repo.save_refresh_token(1, old_token)
+        rotation = await jwt_repo.rotate_refresh_token_with_grace(old_token, new_token, 1, grace_seconds=10)
+        assert rotation.owner_id == 1 and rotation.replacement_token is None
+
+        raw = await self.get_raw(jwt_repo, jwt_repo.get_grace_key(get_token_digest(old_token), 1))
+        assert raw is not None
+        assert new_token.encode('utf-8') not in raw
+
+        rotation = await jwt_repo.rotate_refresh_token_with_grace(old_token, make_token(jti='third'), 1, grace_seconds=10)
+        assert rotation == (1, new_token)
+        assert await jwt_repo.get_rotation(old_token) == (1, new_token)
+        assert await jwt_repo.get_rotation(new_token) is None
+
+    @pytest.mark.parametrize('lifetime_seconds', [None, 60])
+    async def test_max_sessions_keeps_newest_token_of_one_call(self, jwt_repo: JWTRepository, lifetime_seconds):
+        tokens = [make_token(3, jti=jti) for jti in ('x', 'y', 'z')]
+        await jwt_repo.save_refresh_tokens([(3, token) for token in tokens], lifetime_seconds, max_sessions=1)
+        sessions = [session async for session in jwt_repo.iter_user_sessions(3)]
+        assert [session.token_digest for session in sessions] == [get_token_digest(tokens[-1])]
+        for token in tokens[:-1]:
+            assert await self.get_raw(jwt_repo, jwt_repo.get_token_key(get_token_digest(token), 3)) is None
+
+    async def test_tokens_of_one_call_keep_their_order(self, jwt_repo: JWTRepository):
+        tokens = [make_token(3, jti=str(index)) for index in range(5)]
+        await jwt_repo.save_refresh_tokens([(3, token) for token in tokens], 60)
+        sessions = [session async for session in jwt_repo.iter_user_sessions(3, page_size=2)]
+        assert [session.token_digest for session in sessions] == [get_token_digest(token) for token in tokens]
+
+    @pytest.mark.parametrize('max_sessions', [None, 5])
+    async def test_save_prunes_index_entries_of_expired_tokens(self, jwt_repo: JWTRepository, monkeypatch, max_sessions):
+        """ TOKEN SAVED TWO MINUTES AGO WITH 60 SECONDS LIFETIME, REDIS HAS EXPIRED ITS KEY, INDEX STILL LISTS IT """
+        expired_token, token = make_token(jti='expired'), make_token(jti='active')
+        monkeypatch.setattr(cache, 'time', type('Clock', (), {'time': staticmethod(lambda: time.time() - 120)}))
+        await jwt_repo.save_refresh_token(1, expired_token, 60, max_sessions)
+        monkeypatch.undo()
+        await jwt_repo.save_refresh_token(1, token, 60, max_sessions)
+        digests = await jwt_repo.execute(jwt_repo.redis.zrange, jwt_repo.get_user_key(1), 0, -1)
+        assert digests == [get_token_digest(token).encode('utf-8')]
+        assert await jwt_repo.execute(jwt_repo.redis.ttl, jwt_repo.get_user_key(1)) > 0
+        assert await jwt_repo.delete_expired_refresh_tokens(100) == 0
+
+    async def test_iter_user_sessions_skips_expired_token_keys(self, jwt_repo: JWTRepository):
+        expired_token, token = make_token(jti='expired'), make_token(jti='active')
+        await jwt_repo.save_refresh_tokens([(1, expired_token), (1, token)], 60)
+        await jwt_repo.execute(jwt_repo.redis.delete, jwt_repo.get_token_key(get_token_digest(expired_token), 1))
+        sessions = [session async for session in jwt_repo.iter_user_sessions(1)]
+        assert [session.token_digest for session in sessions] == [get_token_digest(token)]
+        assert 0 < (sessions[0].expires_at - sessions[0].created_at).total_seconds() <= 61
+
+    async def test_migrate_legacy_keys_keeps_token_expiry(self, jwt_repo: JWTRepository):
+        tokens = {
+            'active': make_token(1, 600),
+            'expired': make_token(2, -10),
+            'without exp': make_token(3, 0),
+        }
+        for user_id, token in enumerate(tokens.values(), start=1):
+            await jwt_repo.execute(jwt_repo.redis.set, f'{user_id},{token}', 1)
+        assert await jwt_repo.migrate_legacy_keys() == 2
+        assert await jwt_repo.execute(jwt_repo.redis.keys, '*,*') == []
+
+        def get_token_key(name: str, user_id: int) -> str:
+            return jwt_repo.get_token_key(get_token_digest(tokens[name]), user_id)
+
+        assert 590 < await jwt_repo.execute(jwt_repo.redis.ttl, get_token_key('active', 1)) <= 600
+        assert await jwt_repo.execute(jwt_repo.redis.exists, get_token_key('expired', 2)) == 0
+        assert await self.get_user_digests(jwt_repo, 2) == set()
+        assert await jwt_repo.execute(jwt_repo.redis.ttl, get_token_key('without exp', 3)) == -1
+
+    async def get_user_digests(self, jwt_repo, user_id: int) -> set[str]:
+        return {session.token_digest async for session in jwt_repo.iter_user_sessions(user_id)}
+
+    async def test_rotate_refresh_token_wipes_user_tokens_on_reuse(self, jwt_repo: JWTRepository):
+        await jwt_repo.save_refresh_tokens([(1, 'first'), (1, 'second')])
+        await jwt_repo.save_refresh_token(2, 'other user')
+
+        assert await jwt_repo.rotate_refresh_token('first', 'rotated', 1) == 1
+        assert await self.get_user_digests(jwt_repo, 1) == {get_token_digest('second'), get_token_digest('rotated')}
+
+        """ REUSED TOKEN WIPES ALL USER TOKENS, REPLACEMENT IS STILL SAVED """
+        assert await jwt_repo.rotate_refresh_token('first', 'after reuse', 1) is None
+        assert await self.get_user_digests(jwt_repo, 1) == {get_token_digest('after reuse')}
+        assert await self.get_user_digests(jwt_repo, 2) == {get_token_digest('other user')}
+
+        if isinstance(jwt_repo, ClusterJWTRepository):
+            return
+        assert await jwt_repo.rotate_refresh_token('first', 'opaque', None) is None
+        assert await self.get_user_digests(jwt_repo, 1) == {get_token_digest('after reuse')}
+
+
+class ClientKindTests:
+    async def run_session(self, jwt_repo: JWTRepository) -> None:
+        jwt_service = JWTService(jwt_repo)
+        tokens = await jwt_service.create_auth_tokens(1)
+        tokens = await jwt_service.refresh_auth_tokens(tokens['refresh_token'])
+        sessions = [session async for session in jwt_repo.iter_user_sessions(1)]
+        assert [session.token_digest for session in sessions] == [get_token_digest(tokens['refresh_token'])]
+        await jwt_service.delete_refresh_token(tokens['refresh_token'])
+        assert [session async for session in jwt_repo.iter_user_sessions(1)] == []
+
+    async def test_sync_client_commands_run_off_event_loop(self, monkeypatch):
+        redis = fakeredis.FakeRedis()
+        threads = set()
+        execute_command = redis.execute_command
+
+        def record_thread(*args, **kwargs):
+            threads.add(threading.get_ident())
+            return execute_command(*args, **kwargs)
+
+        monkeypatch.setattr(redis, 'execute_command', record_thread)
+        jwt_repo = JWTRepository(redis)
+        assert not jwt_repo.is_async
+        await self.run_session(jwt_repo)
+        assert threads and threading.get_ident() not in threads
+
+    async def test_async_client_is_awaited_directly(self, monkeypatch):
+        def fail(*args, **kwargs):
+            raise AssertionError('redis.asyncio client must not be offloaded to a thread')
+
+        jwt_repo = JWTRepository(fakeredis.FakeAsyncRedis())
+        assert jwt_repo.is_async
+        monkeypatch.setattr(asyncio, 'to_thread', fail)
+        await self.run_session(jwt_repo)
+
+    async def test_from_url_builds_async_client_on_pool(self):
+        jwt_repo = JWTRepository.from_url('redis://localhost:6379/0', max_connections=7, socket_timeout=2)
+        assert isinstance(jwt_repo.redis, Redis) and jwt_repo.is_async
+        pool = jwt_repo.redis.connection_pool
+        assert pool.max_connections == 7
+        assert pool.connection_kwargs['socket_timeout'] == 2
+        assert pool.connection_kwargs['socket_connect_timeout'] == 5
+        await jwt_repo.redis.aclose()
+
+
+class ClusterLikePipeline:
+    """ LIKE ClusterPipeline IT IS NOT A redis Pipeline, SO REGISTERED SCRIPTS ARE NOT LOADED BEFORE EXECUTE """
+
+    def __init__(self, pipeline):
+        self._pipeline = pipeline
+
+    def __getattr__(self, name: str):
+        return getattr(self._pipeline, name)
+
+
+class FakeClusterRedis(fakeredis.FakeRedis):
+    def pipeline(self, *args, **kwargs) -> ClusterLikePipeline:
+        return ClusterLikePipeline(super().pipeline(*args, **kwargs))
+
+
+class FakeAsyncClusterRedis(fakeredis.FakeAsyncRedis):
+    def pipeline(self, *args, **kwargs) -> ClusterLikePipeline:
+        return ClusterLikePipeline(super().pipeline(*args, **kwargs))
+
+
+class ClusterPipelineTests:
+    @pytest.fixture(params=[FakeClusterRedis, FakeAsyncClusterRedis])
+    async def jwt_repo(self, request) -> ClusterJWTRepository:
+        jwt_repo = ClusterJWTRepository(request.param())
+        """ NODES OF A FRESH CLUSTER HAVE NOT SEEN ANY SCRIPT """
+        await jwt_repo.execute(jwt_repo.redis.script_flush)
+        return jwt_repo
+
+    async def count_user_tokens(self, jwt_repo: ClusterJWTRepository, user_id: int) -> int:
+        return await jwt_repo.execute(jwt_repo.redis.zcard, jwt_repo.get_user_key(user_id))
+
+    async def test_save_refresh_tokens_with_cap(self, jwt_repo: ClusterJWTRepository):
+        tokens = [(user_id, make_token(user_id, jti=str(index))) for index in range(3) for user_id in (1, 2)]
+        await jwt_repo.save_refresh_tokens(tokens, 60, max_sessions=2)
+        assert await self.count_user_tokens(jwt_repo, 1) == 2
+        assert await self.count_user_tokens(jwt_repo, 2) == 2
+
+    async def test_delete_refresh_tokens_for_users_batch(self, jwt_repo: ClusterJWTRepository):
+        await jwt_repo.save_refresh_tokens([(1, make_token(1)), (2, make_token(2)), (3, make_token(3))], 60)
+        await jwt_repo.execute(jwt_repo.redis.script_flush)
+        assert await jwt_repo.delete_refresh_tokens_for_users_batch([1, 2]) == 2
+        assert await self.count_user_tokens(jwt_repo, 1) == 0
+        assert await self.count_user_tokens(jwt_repo, 3) == 1
+
+    async def test_migrate_legacy_keys(self, jwt_repo: ClusterJWTRepository):
+        tokens = {user_id: make_token(user_id) for user_id in range(1, 6)}
+        for user_id, token in tokens.items():
+            await jwt_repo.execute(jwt_repo.redis.set, f'{user_id},{token}', 1)
+        await jwt_repo.execute(jwt_repo.redis.set, 'unrelated,key', 1)
+        assert await jwt_repo.migrate_legacy_keys(batch_size=2) == 5
+        for user_id, token in tokens.items():
+            key = jwt_repo.get_token_key(get_token_digest(token), user_id)
+            assert key.startswith(f'refresh_token:{{{user_id}}}:')
+            assert await self.get_user_id(jwt_repo, key) == str(user_id)
+            assert await self.count_user_tokens(jwt_repo, user_id) == 1
+        assert await jwt_repo.execute(jwt_repo.redis.exists, 'unrelated,key')
+        assert await jwt_repo.migrate_legacy_keys() == 0
+
+    async def get_user_id(self, jwt_repo: ClusterJWTRepository, key: str) -> str | None:
+        value = await jwt_repo.execute(jwt_repo.redis.get, key)
+        return value.decode('utf-8') if value is not None else None
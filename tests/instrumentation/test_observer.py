@@ -0,0 +1,104 @@
+import pytest
+from starlette.exceptions import HTTPException
+
+from fastapi_jwt.instrumentation import (
+    PROMETHEUS_CONTENT_TYPE,
+    MetricsObserver,
+    StageSnapshot,
+    get_observer,
+    instrument,
+    record,
+    render_prometheus,
+    set_observer,
+)
+
+
+@instrument('sync_stage')
+def sync_stage(error: BaseException | None = None) -> str:
+    if error is not None:
+        raise error
+    return 'sync'
+
+
+@instrument('async_stage')
+async def async_stage(error: BaseException | None = None) -> str:
+    if error is not None:
+        raise error
+    return 'async'
+
+
+class ObserverTests:
+    @pytest.fixture(autouse=True)
+    def observer(self) -> MetricsObserver:
+        observer = MetricsObserver(buckets=(0.5, 1.0))
+        set_observer(observer)
+        yield observer
+        set_observer(None)
+
+    def get_counts(self, observer: MetricsObserver) -> dict[tuple[str, str], int]:
+        return {(item.stage, item.outcome): item.count for item in observer.snapshot()}
+
+    def test_without_observer_nothing_is_recorded(self, observer: MetricsObserver):
+        set_observer(None)
+        assert get_observer() is None
+        assert sync_stage() == 'sync'
+        record('manual', 'ok')
+        assert observer.snapshot() == []
+
+    async def test_outcomes(self, observer: MetricsObserver):
+        assert sync_stage() == 'sync'
+        assert await async_stage() == 'async'
+        errors = [
+            HTTPException(401, 'Token expired'),
+            HTTPException(401, 'Could not validate credentials'),
+            HTTPException(503, 'Too many authentication requests'),
+            ValueError(),
+        ]
+        for error in errors:
+            with pytest.raises(type(error)):
+                sync_stage(error)
+            with pytest.raises(type(error)):
+                await async_stage(error)
+
+        outcomes = {'ok': 1, 'expired': 1, 'invalid': 1, 'http_503': 1, 'error': 1}
+        assert self.get_counts(observer) == {
+            **{('async_stage', outcome): count for outcome, count in outcomes.items()},
+            **{('sync_stage', outcome): count for outcome, count in outcomes.items()},
+        }
+
+    def test_snapshot_is_a_sorted_copy(self, observer: MetricsObserver):
+        record('b', 'ok', 0.25)
+        record('a', 'ok', 0.75)
+        record('a', 'ok', 2.0)
+        snapshot = observer.snapshot()
+        assert snapshot == [
+            StageSnapshot('a', 'ok', 2, 2.75, [0, 1, 1]),
+            StageSnapshot('b', 'ok', 1, 0.25, [1, 0, 0]),
+        ]
+        snapshot[0].bucket_counts[0] = 100
+        record('a', 'ok', 0.1)
+        assert snapshot[0].count == 2
+        assert observer.snapshot()[0].bucket_counts == [1, 1, 1]
+        observer.reset()
+        assert observer.snapshot() == []
+
+    def test_render_prometheus(self, observer: MetricsObserver):
+        record('decode_jwt', 'ok', 0.25)
+        record('decode_jwt', 'ok', 2.0)
+        record('login "main"', 'invalid', 0.75)
+        assert PROMETHEUS_CONTENT_TYPE.startswith('text/plain; version=0.0.4')
+        name = 'auth_stage_duration_seconds'
+        assert render_prometheus(observer, namespace='auth').splitlines() == [
+            f'# HELP {name} Duration of fastapi_jwt auth stages.',
+            f'# TYPE {name} histogram',
+            f'{name}_bucket{{stage="decode_jwt",outcome="ok",le="0.5"}} 1',
+            f'{name}_bucket{{stage="decode_jwt",outcome="ok",le="1.0"}} 1',
+            f'{name}_bucket{{stage="decode_jwt",outcome="ok",le="+Inf"}} 2',
+            f'{name}_sum{{stage="decode_jwt",outcome="ok"}} 2.25',
+            f'{name}_count{{stage="decode_jwt",outcome="ok"}} 2',
+            f'{name}_bucket{{stage="login \\"main\\"",outcome="invalid",le="0.5"}} 0',
+            f'{name}_bucket{{stage="login \\"main\\"",outcome="invalid",le="1.0"}} 1',
+            f'{name}_bucket{{stage="login \\"main\\"",outcome="invalid",le="+Inf"}} 1',
+            f'{name}_sum{{stage="login \\"main\\"",outcome="invalid"}} 0.75',
+            f'{name}_count{{stage="login \\"main\\"",outcome="invalid"}} 1',
+        ]
@@ -0,0 +1,43 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from starlette.exceptions import HTTPException
+
+from fastapi_jwt.managers.executors import PasswordHashingExecutor
+
+
+class PasswordHashingExecutorTests:
+    async def test_runs_function_in_executor(self):
+        executor = PasswordHashingExecutor()
+        assert await executor.run(threading.get_ident) != threading.get_ident()
+        assert executor.pending == 0
+
+    async def test_full_queue_is_rejected_with_503(self):
+        release = threading.Event()
+        pool = ThreadPoolExecutor(max_workers=1)
+        executor = PasswordHashingExecutor(pool, max_concurrency=1, max_queue_size=1)
+        tasks = [asyncio.create_task(executor.run(release.wait)) for _ in range(2)]
+        try:
+            await asyncio.sleep(0.05)
+            assert executor.pending == 2
+
+            with pytest.raises(HTTPException) as exc_info:
+                await executor.run(release.wait)
+            assert exc_info.value.status_code == 503
+            assert executor.pending == 2
+        finally:
+            release.set()
+            assert await asyncio.gather(*tasks) == [True, True]
+
+        assert executor.pending == 0
+        assert await executor.run(release.wait) is True
+        pool.shutdown()
+
+    async def test_failed_call_releases_slot(self):
+        executor = PasswordHashingExecutor(max_concurrency=1, max_queue_size=0)
+        with pytest.raises(ZeroDivisionError):
+            await executor.run(divmod, 1, 0)
+        assert executor.pending == 0
+        assert await executor.run(divmod, 7, 2) == (3, 1)
@@ -0,0 +1,92 @@
+import pytest
+
+from fastapi_jwt.managers.hashers import (
+    PBKDF2_MAX_ITERATIONS,
+    SCRYPT_MAX_MEMORY,
+    SCRYPT_MAX_WORK,
+    PBKDF2PasswordHasher,
+    ScryptPasswordHasher,
+    decode_password,
+    needs_rehash,
+    verify_password,
+)
+
+
+class HasherTests:
+    @pytest.mark.parametrize(
+        'hasher',
+        [PBKDF2PasswordHasher(1000), ScryptPasswordHasher(2 ** 10, 8, 1)],
+    )
+    def test_round_trip(self, hasher):
+        encoded = hasher.encode('password')
+        assert encoded.startswith(f'{hasher.algorithm}$')
+        assert verify_password('password', encoded)
+        assert not verify_password('wrong password', encoded)
+        assert decode_password(encoded)[0].params == hasher.params
+
+    def test_legacy_password(self):
+        hasher = PBKDF2PasswordHasher(100000)
+        salt = bytes(32)
+        encoded = hasher.hash('password', salt).hex() + salt.hex()
+        assert verify_password('password', encoded)
+        assert needs_rehash(encoded, hasher)
+
+    def test_needs_rehash(self):
+        encoded = ScryptPasswordHasher(2 ** 10, 8, 1).encode('password')
+        assert not needs_rehash(encoded, ScryptPasswordHasher(2 ** 10, 8, 1))
+        assert needs_rehash(encoded, ScryptPasswordHasher(2 ** 11, 8, 1))
+        assert needs_rehash(encoded, PBKDF2PasswordHasher(1000))
+        assert not needs_rehash('unknown$1$2', PBKDF2PasswordHasher(1000))
+
+    @pytest.mark.parametrize(
+        'encoded',
+        [
+            'unknown$1$2',
+            'pbkdf2_sha256$abc$AAAA$AAAA',
+            'scrypt$3$8$1$AAAA$AAAA',
+            f'scrypt${2 ** 24}$8$1$AAAA$AAAA',
+            f'pbkdf2_sha256${PBKDF2_MAX_ITERATIONS + 1}$AAAA$AAAA',
+            'pbkdf2_sha256$0$AAAA$AAAA',
+            f'scrypt$1024$8${2 ** 16}$AAAA$AAAA',
+        ],
+    )
+    def test_invalid_stored_params(self, encoded: str):
+        assert not verify_password('password', encoded)
+
+    def test_stored_params_at_limits_are_decoded(self):
+        hasher, _, _ = decode_password(f'pbkdf2_sha256${PBKDF2_MAX_ITERATIONS}$AAAA$AAAA')
+        assert hasher.iterations == PBKDF2_MAX_ITERATIONS
+        hasher, _, _ = decode_password(f'scrypt${SCRYPT_MAX_WORK // 8}$8$1$AAAA$AAAA')
+        assert hasher.n * hasher.r * hasher.p == SCRYPT_MAX_WORK
+
+    def test_scrypt_memory_limit(self):
+        assert ScryptPasswordHasher(2 ** 20, 8, 1).memory <= SCRYPT_MAX_MEMORY
+        assert ScryptPasswordHasher(2 ** 21, 8, 1).memory > SCRYPT_MAX_MEMORY
+
+    @pytest.mark.parametrize('r, max_n', [(8, 2 ** 12), (1, 2 ** 14)])
+    def test_scrypt_calibration_bounds(self, r: int, max_n: int):
+        hasher = ScryptPasswordHasher.calibrate(target_seconds=0, r=r, max_n=max_n)
+        assert hasher.n == 2 ** 10
+        hasher = ScryptPasswordHasher.calibrate(target_seconds=float('inf'), r=r, max_n=max_n)
+        assert hasher.n <= max_n
+        assert hasher.memory <= SCRYPT_MAX_MEMORY
+        assert hasher.n == max_n or ScryptPasswordHasher(hasher.n * 2, r, 1).memory > SCRYPT_MAX_MEMORY
+        assert verify_password('password', hasher.encode('password'))
+
+    def test_scrypt_calibration_memory_cap(self, monkeypatch):
+        """ HASHING WITH THE CAPPED n TAKES A GIGABYTE, SO ONLY CHOSEN PARAMS ARE CHECKED """
+        monkeypatch.setattr('fastapi_jwt.managers.hashers.measure', lambda hasher, salt: 0)
+        hasher = ScryptPasswordHasher.calibrate(target_seconds=1, r=8, max_n=2 ** 24)
+        assert hasher.n == 2 ** 20
+        assert hasher.memory <= SCRYPT_MAX_MEMORY
+
+    def test_calibration_stays_within_stored_params_limits(self, monkeypatch):
+        monkeypatch.setattr('fastapi_jwt.managers.hashers.measure', lambda hasher, salt: 1e-9)
+        assert PBKDF2PasswordHasher.calibrate(target_seconds=1).iterations == PBKDF2_MAX_ITERATIONS
+        hasher = ScryptPasswordHasher.calibrate(target_seconds=1, r=1, p=8, max_n=2 ** 30)
+        assert hasher.n * hasher.r * hasher.p == SCRYPT_MAX_WORK
+
+    def test_pbkdf2_calibration(self):
+        hasher = PBKDF2PasswordHasher.calibrate(target_seconds=0.001, sample_iterations=1000)
+        assert hasher.iterations >= 10000
+        assert verify_password('password', hasher.encode('password'))
@@ -0,0 +1,216 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+from starlette.requests import Request
+
+from fastapi_jwt.auth.jwt import decode_jwt, generate_jwt, get_token_digest
+from fastapi_jwt.repositories.jwt.base import JWTBaseRepository
+from fastapi_jwt.repositories.jwt.memory import JWTRepository
+from fastapi_jwt.services.jwt import JWTService
+from fastapi_jwt.actions.jwt import refresh_access_token, logout
+
+
+class FallbackJWTRepository(JWTRepository):
+    """ MEMORY STORAGE WITH NON ATOMIC BASE CLASS ROTATION """
+    rotate_refresh_token = JWTBaseRepository.rotate_refresh_token
+
+
+class JWTTests:
+    @pytest.fixture(autouse=True, scope='function')
+    def jwt_repo(self) -> JWTRepository:
+        return JWTRepository()
+
+    @staticmethod
+    def assert_tokens(tokens: tuple) -> None:
+        for token in tokens:
+            data = decode_jwt(
+                encoded_jwt=token,
+                secret='JWT',
+                algorithm='HS256',
+            )
+            assert data.get('sub') == '1'
+
+    @pytest.mark.parametrize(
+        'token, no_exception',
+        [
+            ('wrong token', False),
+            (None, False),
+            (
+                    generate_jwt(
+                        data={'sub': 1},
+                        lifetime_seconds=3,
+                        secret='JWT',
+                        algorithm='HS256',
+                    ), True,
+            ),
+        ]
+    )
+    async def test_refresh_access_token(
+            self,
+            token: str | None,
+            no_exception: bool,
+            jwt_repo: JWTRepository,
+    ):
+        request = Request(scope={'type': 'http', 'headers': []})
+        request.cookies['refresh_token'] = token
+        jwt_service = JWTService(jwt_repo)
+
+        if no_exception:
+            await jwt_repo.save_refresh_token(1, token)
+
+        try:
+            response = await refresh_access_token(request, jwt_service)
+        except HTTPException:
+            if no_exception:
+                assert False
+            assert True
+            return
+        self.assert_tokens(tuple(response.values()))
+        assert response.get('refresh_token') != token
+        assert len(jwt_repo) == 1
+        assert await jwt_repo.delete_refresh_token(token) is None
+
+    async def test_count_refresh_token_if_it_was_hacked(self, jwt_repo: JWTRepository):
+        await jwt_repo.save_refresh_token(1, 'example token')
+        assert len(jwt_repo) == 1
+
+        token = generate_jwt(
+            data={'sub': 1},
+            lifetime_seconds=3,
+            secret='JWT',
+            algorithm='HS256',
+        )
+        request = Request(scope={'type': 'http', 'headers': []})
+        request.cookies['refresh_token'] = token
+        jwt_service = JWTService(jwt_repo)
+
+        await refresh_access_token(request, jwt_service)
+        assert len(jwt_repo) == 1
+
+    async def test_logout(self, jwt_repo: JWTRepository):
+        token = generate_jwt(
+            data={'sub': 1},
+            lifetime_seconds=3,
+            secret='JWT',
+            algorithm='HS256',
+        )
+        request = Request(scope={'type': 'http', 'headers': []})
+        request.cookies['refresh_token'] = token
+        await jwt_repo.save_refresh_token(1, token)
+
+        await logout(request, JWTService(jwt_repo))
+
+        assert len(jwt_repo) == 0
+
+    async def test_expired_and_evicted_tokens(self):
+        jwt_repo = JWTRepository(max_tokens=4, shard_count=1)
+        await jwt_repo.save_refresh_token(1, 'expired token', lifetime_seconds=-1)
+        assert await jwt_repo.delete_refresh_token('expired token') is None
+
+        for i in range(6):
+            await jwt_repo.save_refresh_token(1, f'token {i}')
+        assert len(jwt_repo) == 4
+        assert await jwt_repo.delete_refresh_token('token 0') is None
+        assert await jwt_repo.delete_refresh_token('token 5') == 1
+
+    async def test_delete_expired_refresh_tokens(self):
+        jwt_repo = JWTRepository(shard_count=2)
+        for i in range(5):
+            await jwt_repo.save_refresh_token(1, f'expired token {i}', lifetime_seconds=-1)
+        await jwt_repo.save_refresh_token(1, 'token', lifetime_seconds=60)
+        await jwt_repo.save_refresh_token(2, 'token without expiry')
+        assert await jwt_repo.delete_expired_refresh_tokens(limit=3) == 3
+        assert await jwt_repo.delete_expired_refresh_tokens(limit=3) == 2
+        assert await jwt_repo.delete_expired_refresh_tokens(limit=3) == 0
+        assert len(jwt_repo) == 2
+        sessions = [session async for session in jwt_repo.iter_user_sessions(1)]
+        assert [session.token_digest for session in sessions] == [get_token_digest('token')]
+
+    async def test_snapshot(self, jwt_repo: JWTRepository, tmp_path):
+        await jwt_repo.save_refresh_token(1, 'token', lifetime_seconds=60)
+        jwt_repo.dump_to_file(tmp_path / 'snapshot.json')
+
+        restored_repo = JWTRepository()
+        restored_repo.load_from_file(tmp_path / 'snapshot.json')
+
+        assert await restored_repo.delete_refresh_token('token') == 1
+
+    async def test_opaque_refresh_token(self, jwt_repo: JWTRepository):
+        jwt_service = JWTService(jwt_repo, opaque_refresh_tokens=True)
+        token = (await jwt_service.create_auth_tokens(1))['refresh_token']
+        request = Request(scope={'type': 'http', 'headers': []})
+        request.cookies['refresh_token'] = token
+
+        response = await refresh_access_token(request, jwt_service)
+        assert response.get('refresh_token') != token
+        assert len(jwt_repo) == 1
+
+        with pytest.raises(HTTPException):
+            await refresh_access_token(request, jwt_service)
+        assert len(jwt_repo) == 1
+
+    async def test_concurrent_refresh_within_grace(self, jwt_repo: JWTRepository):
+        jwt_service = JWTService(jwt_repo, refresh_token_grace_seconds=5)
+        await jwt_service.create_auth_tokens(1)
+        token = (await jwt_service.create_auth_tokens(1))['refresh_token']
+
+        responses = await asyncio.gather(*[jwt_service.refresh_auth_tokens(token) for _ in range(3)])
+        assert len({response['refresh_token'] for response in responses}) == 1
+
+        response = await JWTService(jwt_repo, refresh_token_grace_seconds=5).refresh_auth_tokens(token)
+        assert response['refresh_token'] == responses[0]['refresh_token']
+        assert len(jwt_repo) == 2
+
+    async def test_delete_all_refresh_tokens_for_users(self, jwt_repo: JWTRepository):
+        for user_id in range(1, 6):
+            await jwt_repo.save_refresh_token(user_id, f'token {user_id}')
+            await jwt_repo.save_refresh_token(user_id, f'second token {user_id}')
+        progress = []
+
+        deleted = await jwt_repo.delete_all_refresh_tokens_for_users(
+            range(1, 5),
+            chunk_size=3,
+            progress=lambda users, tokens: progress.append((users, tokens)),
+        )
+
+        assert deleted == 8
+        assert progress == [(3, 6), (4, 8)]
+        assert len(jwt_repo) == 2
+
+    async def test_iter_user_sessions(self, jwt_repo: JWTRepository):
+        for i in range(5):
+            await jwt_repo.save_refresh_token(1, f'token {i}', lifetime_seconds=60)
+        await jwt_repo.save_refresh_token(1, 'expired token', lifetime_seconds=-1)
+        await jwt_repo.save_refresh_token(2, 'other user token')
+
+        sessions = [session async for session in jwt_repo.iter_user_sessions(1, page_size=2)]
+
+        assert [session.token_digest for session in sessions] == [get_token_digest(f'token {i}') for i in range(5)]
+        assert all(session.expires_at > session.created_at for session in sessions)
+
+    async def test_max_sessions_per_user(self, jwt_repo: JWTRepository):
+        jwt_service = JWTService(jwt_repo, max_sessions_per_user=2)
+        tokens = [await jwt_service.create_refresh_token(1) for _ in range(4)]
+
+        assert len(jwt_repo) == 2
+        assert await jwt_repo.delete_refresh_token(tokens[1]) is None
+        assert await jwt_repo.delete_refresh_token(tokens[3]) == 1
+
+    @pytest.mark.parametrize('repository_class', [JWTRepository, FallbackJWTRepository])
+    async def test_rotate_refresh_token_wipes_user_tokens_on_reuse(self, repository_class):
+        jwt_repo = repository_class()
+        await jwt_repo.save_refresh_tokens([(1, 'first'), (1, 'second')])
+        await jwt_repo.save_refresh_token(2, 'other user')
+
+        assert await jwt_repo.rotate_refresh_token('first', 'rotated', 1) == 1
+        assert len(jwt_repo) == 3
+
+        """ REUSED TOKEN WIPES ALL USER TOKENS, REPLACEMENT IS STILL SAVED """
+        assert await jwt_repo.rotate_refresh_token('first', 'after reuse', 1) is None
+        sessions = [session async for session in jwt_repo.iter_user_sessions(1)]
+        assert [session.token_digest for session in sessions] == [get_token_digest('after reuse')]
+        assert await jwt_repo.delete_refresh_token('other user') == 2
+
+        assert await jwt_repo.rotate_refresh_token('first', 'opaque', None) is None
+        assert len(jwt_repo) == 1
@@ -0,0 +1,186 @@
+import asyncio
+import time
+from datetime import datetime, timedelta
+
+import fakeredis
+import pytest
+from sqlalchemy import Integer, insert
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
+
+from fastapi_jwt.auth.jwt import generate_jwt
+from fastapi_jwt.auth.revocation import RevocationList
+from fastapi_jwt.exceptions.jwt import RevocationNotConfigured
+from fastapi_jwt.models.jwt import RevokedAccessToken
+from fastapi_jwt.repositories.jwt.memory import JWTRepository
+from fastapi_jwt.repositories.revocation import cache, sqldb
+from fastapi_jwt.services.jwt import JWTService
+from fastapi_jwt.services.revocation import RevocationListSyncer
+
+
+class Base(DeclarativeBase):
+    pass
+
+
+class RevokedAccessTokenTable(Base, RevokedAccessToken):
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+
+
+class OverridenRevocationRepository(sqldb.RevocationRepository):
+    model = RevokedAccessTokenTable
+
+
+class RevocationTests:
+    @pytest.fixture(params=['redis', 'redis.asyncio', 'sqldb'])
+    async def revocation_repo(self, request, tmp_path):
+        if request.param == 'redis':
+            yield cache.RevocationRepository(fakeredis.FakeRedis())
+        elif request.param == 'redis.asyncio':
+            yield cache.RevocationRepository(fakeredis.FakeAsyncRedis())
+        else:
+            engine = create_async_engine(f'sqlite+aiosqlite:///{tmp_path / "revocation.db"}')
+            async with engine.begin() as conn:
+                await conn.run_sync(Base.metadata.create_all)
+            yield OverridenRevocationRepository(engine)
+            await engine.dispose()
+
+    async def test_fetch_revoked_is_incremental(self, revocation_repo):
+        now = int(time.time())
+        await revocation_repo.revoke('a', now + 60)
+        await revocation_repo.revoke('b', now + 60)
+        entries, cursor = await revocation_repo.fetch_revoked(limit=1)
+        assert entries == [('a', now + 60)]
+        entries, cursor = await revocation_repo.fetch_revoked(cursor, limit=10)
+        assert entries == [('b', now + 60)]
+        await revocation_repo.revoke('c', now + 60)
+        entries, cursor = await revocation_repo.fetch_revoked(cursor, limit=10)
+        assert entries == [('c', now + 60)]
+        assert (await revocation_repo.fetch_revoked(cursor, limit=10))[0] == []
+
+    async def test_revoke_twice(self, revocation_repo):
+        now = int(time.time())
+        await revocation_repo.revoke('a', now + 60)
+        await revocation_repo.revoke('a', now + 60)
+        entries, _ = await revocation_repo.fetch_revoked(limit=10)
+        assert entries == [('a', now + 60)]
+
+    async def test_delete_expired_revocations(self, revocation_repo):
+        now = int(time.time())
+        await revocation_repo.revoke('expired', now - 10)
+        await revocation_repo.revoke('active', now + 60)
+        assert await revocation_repo.delete_expired_revocations(100) == 1
+        entries, _ = await revocation_repo.fetch_revoked(limit=10)
+        assert entries == [('active', now + 60)]
+
+    async def test_fetch_revoked_skips_expired(self, revocation_repo):
+        """ FULL PAGE OF EXPIRED REVOCATIONS MUST NOT LOOK LIKE CAUGHT UP """
+        now = int(time.time())
+        for index in range(3):
+            await revocation_repo.revoke(f'expired {index}', now - 10)
+        await revocation_repo.revoke('a', now + 60)
+        await revocation_repo.revoke('b', now + 60)
+        entries, cursor = await revocation_repo.fetch_revoked(limit=2)
+        assert entries == [('a', now + 60), ('b', now + 60)]
+        assert (await revocation_repo.fetch_revoked(cursor, limit=2))[0] == []
+
+    async def test_full_sync_purges_all_expired_revocations(self, revocation_repo):
+        now = int(time.time())
+        for index in range(7):
+            await revocation_repo.revoke(f'expired {index}', now - 10)
+        await revocation_repo.revoke('a', now + 60)
+        syncer = RevocationListSyncer(revocation_repo, RevocationList(), batch_size=2)
+        assert await syncer.full_sync() == 1
+        assert await revocation_repo.delete_expired_revocations(100) == 0
+        assert await syncer.purge() == 0
+
+    def test_redis_keys_share_hash_tag(self):
+        keys = cache.RevocationRepository(fakeredis.FakeRedis()).get_keys()
+        assert len(keys) == 3
+        assert all(key.startswith('{revocation}') for key in keys)
+
+    async def test_syncer(self, revocation_repo):
+        now = int(time.time())
+        revocation_list = RevocationList()
+        syncer = RevocationListSyncer(revocation_repo, revocation_list, batch_size=2)
+        for jti in ('a', 'b', 'c'):
+            await revocation_repo.revoke(jti, now + 60)
+        await revocation_repo.revoke('expired', now - 10)
+        assert await syncer.full_sync() == 3
+        assert {'a', 'b', 'c'} <= set(revocation_list._entries)
+        await revocation_repo.revoke('d', now + 60)
+        assert await syncer.sync() == 1
+        assert 'd' in revocation_list
+        assert await syncer.sync() == 0
+
+    async def test_syncer_run(self, revocation_repo):
+        revocation_list = RevocationList()
+        syncer = RevocationListSyncer(revocation_repo, revocation_list, interval_seconds=0.01)
+        syncer.start()
+        await revocation_repo.revoke('a', int(time.time()) + 60)
+        for _ in range(100):
+            if 'a' in revocation_list:
+                break
+            await asyncio.sleep(0.01)
+        await syncer.stop()
+        assert 'a' in revocation_list
+
+    async def test_revoke_access_token(self, revocation_repo):
+        revocation_list = RevocationList()
+        jwt_service = JWTService(JWTRepository(), revocation_repo=revocation_repo, revocation_list=revocation_list)
+        access_token = generate_jwt({'sub': '1', 'jti': 'a'}, 60, 'JWT', 'HS256')
+        await jwt_service.revoke_access_token(access_token)
+        assert 'a' in revocation_list
+        entries, _ = await revocation_repo.fetch_revoked(limit=10)
+        assert [jti for jti, _ in entries] == ['a']
+
+    async def test_revoke_access_token_without_repository(self):
+        jwt_service = JWTService(JWTRepository(), revocation_list=RevocationList())
+        access_token = generate_jwt({'sub': '1', 'jti': 'a'}, 60, 'JWT', 'HS256')
+        with pytest.raises(RevocationNotConfigured):
+            await jwt_service.revoke_access_token(access_token)
+
+
+class SQLRevocationCursorTests:
+    @pytest.fixture
+    async def revocation_repo(self, tmp_path) -> OverridenRevocationRepository:
+        engine = create_async_engine(f'sqlite+aiosqlite:///{tmp_path / "revocation.db"}')
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        yield OverridenRevocationRepository(engine)
+        await engine.dispose()
+
+    async def insert_row(self, revocation_repo: OverridenRevocationRepository, row_id: int, jti: str) -> None:
+        """ ROW OF A TRANSACTION THAT TOOK ITS id EARLY AND COMMITTED LATE """
+        expires_at = datetime.utcnow().replace(microsecond=0) + timedelta(seconds=60)
+        async with revocation_repo.get_session() as session:
+            await session.execute(insert(RevokedAccessTokenTable).values(id=row_id, jti=jti, expires_at=expires_at))
+            await session.commit()
+
+    async def test_row_committed_out_of_id_order_is_fetched_once(self, revocation_repo):
+        await self.insert_row(revocation_repo, 1, 'a')
+        await self.insert_row(revocation_repo, 3, 'c')
+        entries, cursor = await revocation_repo.fetch_revoked(limit=10)
+        assert [jti for jti, _ in entries] == ['a', 'c']
+
+        await self.insert_row(revocation_repo, 2, 'b')
+        await self.insert_row(revocation_repo, 4, 'd')
+        entries, cursor = await revocation_repo.fetch_revoked(cursor, limit=10)
+        assert [jti for jti, _ in entries] == ['b', 'd']
+        assert cursor.last_id == 4 and cursor.recent_ids == {1, 2, 3, 4}
+        assert await revocation_repo.fetch_revoked(cursor, limit=10) == ([], cursor)
+
+    async def test_overlap_window(self, revocation_repo, monkeypatch):
+        monkeypatch.setattr(revocation_repo, 'cursor_overlap', 3)
+        for row_id in (1, 5, 6):
+            await self.insert_row(revocation_repo, row_id, str(row_id))
+        entries, cursor = await revocation_repo.fetch_revoked(limit=2)
+        assert [jti for jti, _ in entries] == ['1', '5']
+        entries, cursor = await revocation_repo.fetch_revoked(cursor, limit=2)
+        assert [jti for jti, _ in entries] == ['6']
+        assert cursor.recent_ids == {5, 6}
+
+        """ OLDER THAN THE WINDOW, LEFT FOR THE NEXT FULL SYNC """
+        await self.insert_row(revocation_repo, 3, '3')
+        assert (await revocation_repo.fetch_revoked(cursor, limit=2))[0] == []
+        await self.insert_row(revocation_repo, 4, '4')
+        assert (await revocation_repo.fetch_revoked(cursor, limit=2))[0] == [('4', entries[0][1])]
@@ -0,0 +1,157 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from fastapi_jwt.auth.jwt import decode_jwt
+from fastapi_jwt.repositories.jwt.memory import JWTRepository
+from fastapi_jwt.services import claims
+from fastapi_jwt.services.claims import ClaimsProvider
+from fastapi_jwt.services.jwt import JWTService
+
+
+class RolesProvider(ClaimsProvider):
+    def __init__(self, roles: dict[int, str], **kwargs):
+        super().__init__(**kwargs)
+        self.roles = roles
+        self.calls: list[list[int]] = []
+        self.release: asyncio.Event | None = None
+
+    async def load_claims(self, user_ids: list[int]) -> dict[int, dict]:
+        self.calls.append(list(user_ids))
+        loaded = {user_id: {'role': self.roles[user_id]} for user_id in user_ids if user_id in self.roles}
+        if self.release is not None:
+            await self.release.wait()
+        return loaded
+
+
+class ClaimsProviderTests:
+    @pytest.fixture
+    def provider(self) -> RolesProvider:
+        return RolesProvider({1: 'admin', 2: 'user', 3: 'user'})
+
+    @staticmethod
+    async def wait_for_load(provider: RolesProvider, calls: int) -> None:
+        while len(provider.calls) < calls:
+            await asyncio.sleep(0)
+
+    async def test_same_tick_calls_share_one_load(self, provider: RolesProvider):
+        results = await asyncio.gather(
+            provider.get_claims(1),
+            provider.get_claims(2),
+            provider.get_many_claims([2, 3, 4]),
+            provider.get_claims(1),
+        )
+        assert provider.calls == [[1, 2, 3, 4]]
+        assert results == [
+            {'role': 'admin'},
+            {'role': 'user'},
+            {2: {'role': 'user'}, 3: {'role': 'user'}, 4: {}},
+            {'role': 'admin'},
+        ]
+
+        assert await provider.get_many_claims([1, 4]) == {1: {'role': 'admin'}, 4: {}}
+        assert provider.calls == [[1, 2, 3, 4]]
+
+    async def test_batches_are_split_by_max_batch_size(self):
+        provider = RolesProvider({}, max_batch_size=2)
+        await asyncio.gather(*(provider.get_claims(user_id) for user_id in range(5)))
+        assert provider.calls == [[0, 1], [2, 3], [4]]
+
+    async def test_later_tick_starts_a_new_batch(self, provider: RolesProvider):
+        provider.release = asyncio.Event()
+        first = asyncio.ensure_future(provider.get_claims(1))
+        await self.wait_for_load(provider, 1)
+        second = asyncio.ensure_future(provider.get_many_claims([1, 2]))
+        await self.wait_for_load(provider, 2)
+        provider.release.set()
+        assert await first == {'role': 'admin'}
+        assert await second == {1: {'role': 'admin'}, 2: {'role': 'user'}}
+        """ USER 1 WAS ALREADY IN FLIGHT, ONLY USER 2 IS LOADED AGAIN """
+        assert provider.calls == [[1], [2]]
+
+    async def test_invalidate_during_load_does_not_cache_stale_claims(self, provider: RolesProvider):
+        provider.release = asyncio.Event()
+        task = asyncio.ensure_future(provider.get_claims(1))
+        await self.wait_for_load(provider, 1)
+        assert provider.calls == [[1]]
+
+        provider.roles[1] = 'user'
+        provider.invalidate(1)
+        provider.release.set()
+        assert await task == {'role': 'admin'}
+
+        provider.release = None
+        assert await provider.get_claims(1) == {'role': 'user'}
+        assert provider.calls == [[1], [1]]
+        assert await provider.get_claims(1) == {'role': 'user'}
+        assert len(provider.calls) == 2
+
+    async def test_invalidate(self, provider: RolesProvider):
+        await provider.get_many_claims([1, 2])
+        provider.invalidate(1)
+        await provider.get_many_claims([1, 2])
+        assert provider.calls == [[1, 2], [1]]
+        provider.invalidate()
+        await provider.get_many_claims([1, 2])
+        assert provider.calls == [[1, 2], [1], [1, 2]]
+
+    async def test_ttl(self, provider: RolesProvider, monkeypatch):
+        clock = SimpleNamespace(now=100.0)
+        monkeypatch.setattr(claims, 'time', SimpleNamespace(monotonic=lambda: clock.now))
+        await provider.get_claims(1)
+        clock.now += provider.ttl_seconds - 1
+        await provider.get_claims(1)
+        assert len(provider.calls) == 1
+        clock.now += 1
+        await provider.get_claims(1)
+        assert len(provider.calls) == 2
+
+    async def test_zero_ttl_disables_cache(self):
+        provider = RolesProvider({1: 'admin'}, ttl_seconds=0)
+        await provider.get_claims(1)
+        await provider.get_claims(1)
+        assert provider.calls == [[1], [1]]
+
+    async def test_max_size_evicts_least_recently_loaded(self):
+        provider = RolesProvider({}, max_size=2)
+        for user_id in (1, 2, 3):
+            await provider.get_claims(user_id)
+        await provider.get_claims(1)
+        assert provider.calls == [[1], [2], [3], [1]]
+        await provider.get_claims(3)
+        assert len(provider.calls) == 4
+
+    async def test_load_error_reaches_all_waiters_and_is_not_cached(self, provider: RolesProvider):
+        async def fail(user_ids: list[int]) -> dict[int, dict]:
+            raise ConnectionError('database is down')
+
+        provider.load_claims = fail
+        results = await asyncio.gather(provider.get_claims(1), provider.get_claims(2), return_exceptions=True)
+        assert all(isinstance(result, ConnectionError) for result in results)
+
+        del provider.load_claims
+        assert await provider.get_claims(1) == {'role': 'admin'}
+        assert provider.calls == [[1]]
+
+    async def test_cancelled_load_releases_waiters(self, provider: RolesProvider):
+        provider.release = asyncio.Event()
+        waiter = asyncio.ensure_future(provider.get_claims(1))
+        await self.wait_for_load(provider, 1)
+        assert len(provider._tasks) == 1
+
+        next(iter(provider._tasks)).cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        assert provider._tasks == set()
+
+        provider.release = None
+        assert await asyncio.wait_for(provider.get_claims(1), 1) == {'role': 'admin'}
+        assert provider.calls == [[1], [1]]
+
+    async def test_claims_are_added_to_access_token(self, provider: RolesProvider):
+        jwt_service = JWTService(JWTRepository(), claims_provider=provider)
+        tokens = await asyncio.gather(*(jwt_service.create_auth_tokens(user_id) for user_id in (1, 2)))
+        roles = [decode_jwt(token['access_token'], 'JWT', 'HS256').get('role') for token in tokens]
+        assert roles == ['admin', 'user']
+        assert provider.calls == [[1, 2]]
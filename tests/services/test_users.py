@@ -0,0 +1,126 @@
+import logging
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import Boolean, Integer, String, insert, select
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
+
+from fastapi_jwt.managers.hashers import PBKDF2PasswordHasher
+from fastapi_jwt.managers.users import UserManager
+from fastapi_jwt.repositories.users import UserRepository
+from fastapi_jwt.services.users import UserService
+from fastapi_jwt.utils.bloom import BloomFilter
+
+
+class Base(DeclarativeBase):
+    pass
+
+
+class AccountTable(Base):
+    __tablename__ = 'account'
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    email: Mapped[str] = mapped_column(String(100), nullable=False)
+    password: Mapped[str] = mapped_column(String(128), nullable=False)
+    is_active: Mapped[bool] = mapped_column(Boolean, nullable=False, default=True)
+
+
+class OverridenUserRepository(UserRepository):
+    model = AccountTable
+
+
+class UserServiceTests:
+    @pytest.fixture(autouse=True)
+    def password_hasher(self, monkeypatch) -> PBKDF2PasswordHasher:
+        hasher = PBKDF2PasswordHasher(1000)
+        monkeypatch.setattr(UserManager, 'password_hasher', hasher)
+        return hasher
+
+    @pytest.fixture
+    async def user_repo(self, tmp_path) -> OverridenUserRepository:
+        engine = create_async_engine(f'sqlite+aiosqlite:///{tmp_path / "users.db"}')
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+            await conn.execute(insert(AccountTable).values(
+                id=1,
+                email='user@example.com',
+                password=UserManager.make_password('password'),
+            ))
+        yield OverridenUserRepository(engine, 'email')
+        await engine.dispose()
+
+    async def get_password(self, user_repo: OverridenUserRepository) -> str:
+        async with user_repo.get_session() as session:
+            return await session.scalar(select(AccountTable.password).where(AccountTable.id == 1))
+
+    async def test_authenticate(self, user_repo: OverridenUserRepository):
+        user_service = UserService(user_repo)
+        assert await user_service.authenticate('user@example.com', 'password') == 1
+        for username, password in (('user@example.com', 'wrong'), ('unknown@example.com', 'password')):
+            with pytest.raises(HTTPException) as exc_info:
+                await user_service.authenticate(username, password)
+            assert exc_info.value.status_code == 422
+
+    async def test_rehash_on_login(self, user_repo: OverridenUserRepository, monkeypatch):
+        old_password = await self.get_password(user_repo)
+        monkeypatch.setattr(UserManager, 'password_hasher', PBKDF2PasswordHasher(2000))
+        assert await UserService(user_repo).authenticate('user@example.com', 'password') == 1
+        new_password = await self.get_password(user_repo)
+        assert new_password != old_password
+        assert new_password.startswith('pbkdf2_sha256$2000$')
+
+    async def test_failed_rehash_does_not_block_login(
+            self,
+            user_repo: OverridenUserRepository,
+            monkeypatch,
+            caplog,
+    ):
+        async def update_password(user_id: int, password: str) -> None:
+            raise ConnectionError('database is read only')
+
+        monkeypatch.setattr(UserManager, 'password_hasher', PBKDF2PasswordHasher(2000))
+        monkeypatch.setattr(user_repo, 'update_password', update_password)
+        with caplog.at_level(logging.ERROR, logger='fastapi_jwt.services.users'):
+            assert await UserService(user_repo).authenticate('user@example.com', 'password') == 1
+        assert 'Failed to rehash password of user 1' in caplog.text
+
+    async def test_username_filter(self, user_repo: OverridenUserRepository, monkeypatch):
+        user_service = UserService(user_repo, username_filter=BloomFilter(capacity=1000, false_positive_rate=0.01))
+        await user_service.load_username_filter()
+        assert user_service.username_filter_loaded
+        assert await user_service.authenticate('user@example.com', 'password') == 1
+
+        async def get_info_for_authenticate(username_field: str):
+            raise AssertionError('filtered username must not reach the database')
+
+        monkeypatch.setattr(user_repo, 'get_info_for_authenticate', get_info_for_authenticate)
+        with pytest.raises(HTTPException):
+            await user_service.authenticate('unknown@example.com', 'password')
+
+    async def test_username_filter_is_bypassed_until_loaded(self, user_repo: OverridenUserRepository):
+        """ EMPTY FILTER STANDS FOR ONE THAT IS STILL LOADING """
+        user_service = UserService(user_repo, username_filter=BloomFilter(capacity=1000, false_positive_rate=0.01))
+        assert not user_service.username_filter_loaded
+        assert await user_service.authenticate('user@example.com', 'password') == 1
+
+    async def test_load_username_filter_without_filter(self, user_repo: OverridenUserRepository):
+        user_service = UserService(user_repo)
+        await user_service.load_username_filter()
+        user_service.add_username('new@example.com')
+        assert not user_service.username_filter_loaded
+
+    async def test_dummy_password_is_hashed_in_executor(self, monkeypatch):
+        monkeypatch.setattr(UserManager, '_dummy_passwords', {})
+        calls = []
+        run = UserManager.password_executor.run
+
+        async def run_in_executor(func, *args):
+            calls.append(func)
+            return await run(func, *args)
+
+        monkeypatch.setattr(UserManager.password_executor, 'run', run_in_executor)
+        dummy_password = await UserManager.aget_dummy_password()
+        assert await UserManager.aget_dummy_password() == dummy_password
+        assert len(calls) == 1
+        assert dummy_password.startswith('pbkdf2_sha256$1000$')
@@ -5,7 +5,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.sql.functions import count
 from starlette.requests import Request
 
-from fastapi_jwt.auth.jwt import decode_jwt, generate_jwt
+from fastapi_jwt.auth.jwt import decode_jwt, generate_jwt, get_token_digest
 from fastapi_jwt.exceptions.jwt import FailGetAttribute
 from fastapi_jwt.managers.users import UserManager
 from fastapi_jwt.schemas.jwt import AuthenticateSchema
@@ -13,9 +13,10 @@ from fastapi_jwt.repositories.jwt.sqldb import JWTRepository
 from fastapi_jwt.repositories.users import UserRepository
 from fastapi_jwt.services.jwt import JWTService
 from fastapi_jwt.services.users import UserService
-from tests.conftest import (
+from tests.sqldb.conftest import (
     TestAccountTable,
     TestRefreshTokenTable,
+    async_sessionmaker,
 )
 from fastapi_jwt.actions.jwt import login, refresh_access_token, logout
 
@@ -65,13 +66,13 @@ class JWTTests:
         data = AuthenticateSchema(username_field=username, input_password=password)
         jwt_service = JWTService(
             OverridenJWTRepository(
-                session,
+                async_sessionmaker,
             ),
         )
         try:
             user_service = UserService(
                 OverridenUserRepository(
-                    session,
+                    async_sessionmaker,
                     username_field=username_field,
                 ),
             )
@@ -153,11 +154,11 @@ class JWTTests:
 
         query = select(TestRefreshTokenTable)
         db_token = await session.execute(query)
-        assert db_token.scalar_one().token != token
+        assert db_token.scalar_one().token_digest != get_token_digest(token)
 
     @staticmethod
     async def save_refresh_token_to_db(session: AsyncSession, token: str):
-        stmt = insert(TestRefreshTokenTable).values(user_id=1, token=token)
+        stmt = insert(TestRefreshTokenTable).values(user_id=1, token_digest=get_token_digest(token))
         await session.execute(stmt)
         await session.commit()
 
@@ -223,3 +224,15 @@ class JWTTests:
             return
 
         await self.assert_db_token_count(session, 0)
+
+    async def test_rotate_refresh_token_wipes_user_tokens_on_reuse(self, session: AsyncSession):
+        """ POSTGRES RUNS THE WRITABLE CTE STATEMENT, NEW ROW MUST SURVIVE THE WIPE """
+        jwt_repo = OverridenJWTRepository(session)
+        await jwt_repo.save_refresh_tokens([(1, 'first'), (1, 'second')])
+
+        assert await jwt_repo.rotate_refresh_token('first', 'rotated', 1) == 1
+        await self.assert_db_token_count(session, 2)
+
+        assert await jwt_repo.rotate_refresh_token('first', 'after reuse', 1) is None
+        sessions = [info async for info in jwt_repo.iter_user_sessions(1)]
+        assert [info.token_digest for info in sessions] == [get_token_digest('after reuse')]
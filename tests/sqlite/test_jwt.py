@@ -0,0 +1,289 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import DateTime, Integer, String, event, func, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
+
+from fastapi_jwt.auth.jwt import decode_jwt, generate_jwt, get_token_digest
+from fastapi_jwt.models.jwt import RefreshToken, RefreshTokenGrace
+from fastapi_jwt.repositories.jwt.sqldb import JWTRepository
+from fastapi_jwt.services.jwt import JWTService
+from fastapi_jwt.services.purger import RefreshTokenPurger
+
+
+class Base(DeclarativeBase):
+    pass
+
+
+class RefreshTokenTable(Base, RefreshToken):
+    user_id: Mapped[int] = mapped_column(Integer, nullable=False)
+
+
+class RefreshTokenGraceTable(Base, RefreshTokenGrace):
+    pass
+
+
+class LegacyRefreshTokenTable(Base):
+    """ TABLE IN THE MIDDLE OF MIGRATION: OLD token COLUMN AND NEW NULLABLE token_digest """
+    __tablename__ = 'legacy_refresh_token'
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    user_id: Mapped[int] = mapped_column(Integer, nullable=False)
+    token: Mapped[str] = mapped_column(String(512), nullable=False)
+    token_digest: Mapped[str | None] = mapped_column(String(64), nullable=True, unique=True)
+    expires_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+
+
+class OverridenJWTRepository(JWTRepository):
+    model = RefreshTokenTable
+
+
+class LegacyJWTRepository(JWTRepository):
+    model = LegacyRefreshTokenTable
+
+
+class GraceJWTRepository(OverridenJWTRepository):
+    grace_model = RefreshTokenGraceTable
+
+
+class JWTTests:
+    """ SQL REPOSITORY ON aiosqlite, POSTGRES ONLY PATHS ARE COVERED BY tests/sqldb """
+
+    @pytest.fixture
+    async def engine(self, tmp_path) -> AsyncEngine:
+        engine = create_async_engine(f'sqlite+aiosqlite:///{tmp_path / "jwt.db"}')
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        yield engine
+        await engine.dispose()
+
+    @pytest.fixture
+    def jwt_repo(self, engine: AsyncEngine) -> OverridenJWTRepository:
+        return OverridenJWTRepository(engine)
+
+    async def count_tokens(self, jwt_repo: OverridenJWTRepository, user_id: int | None = None) -> int:
+        query = select(func.count()).select_from(RefreshTokenTable)
+        if user_id is not None:
+            query = query.where(RefreshTokenTable.user_id == user_id)
+        async with jwt_repo.get_session() as session:
+            return await session.scalar(query)
+
+    async def test_save_refresh_tokens_above_bind_parameter_limit(
+            self,
+            engine: AsyncEngine,
+            jwt_repo: OverridenJWTRepository,
+    ):
+        """ 12000 ROWS OF 4 COLUMNS NEED MORE THAN 32767 PARAMETERS (asyncpg LIMIT) IN ONE MULTI-ROW INSERT """
+        parameter_counts = []
+
+        @event.listens_for(engine.sync_engine, 'before_cursor_execute')
+        def count_parameters(conn, cursor, statement, parameters, context, executemany):
+            if statement.startswith('INSERT'):
+                parameter_counts.append(len(parameters[0]) if executemany else len(parameters))
+
+        tokens = [(user_id, f'token {user_id}') for user_id in range(12000)]
+        await jwt_repo.save_refresh_tokens(tokens, 60)
+        assert parameter_counts and max(parameter_counts) <= 32767
+        assert await self.count_tokens(jwt_repo) == 12000
+        async with jwt_repo.get_session() as session:
+            user_id = await session.scalar(
+                select(RefreshTokenTable.user_id)
+                .where(RefreshTokenTable.token_digest == get_token_digest('token 11999')),
+            )
+        assert user_id == 11999
+
+    async def test_save_refresh_tokens_empty(self, jwt_repo: OverridenJWTRepository):
+        await jwt_repo.save_refresh_tokens([], 60)
+        assert await self.count_tokens(jwt_repo) == 0
+
+    async def test_create_auth_tokens_many(self, jwt_repo: OverridenJWTRepository):
+        jwt_service = JWTService(jwt_repo)
+        user_ids = [1, 2, 3, 2]
+        pairs = await jwt_service.create_auth_tokens_many(user_ids)
+        assert len(pairs) == 4
+        for user_id, pair in zip(user_ids, pairs):
+            assert decode_jwt(pair['access_token'], 'JWT', 'HS256')['sub'] == str(user_id)
+            assert decode_jwt(pair['refresh_token'], 'JWT', 'HS256')['sub'] == str(user_id)
+        assert len({pair['refresh_token'] for pair in pairs}) == 4
+        assert await self.count_tokens(jwt_repo) == 4
+        assert await self.count_tokens(jwt_repo, 2) == 2
+
+    async def test_create_auth_tokens(self, jwt_repo: OverridenJWTRepository):
+        jwt_service = JWTService(jwt_repo)
+        tokens = await jwt_service.create_auth_tokens(1)
+        assert decode_jwt(tokens['access_token'], 'JWT', 'HS256')['sub'] == '1'
+        assert await self.count_tokens(jwt_repo, 1) == 1
+
+    async def test_max_sessions_keeps_newest_token_of_one_call(self, jwt_repo: OverridenJWTRepository):
+        await jwt_repo.save_refresh_tokens([(3, 'x'), (3, 'y'), (3, 'z')], 60, max_sessions=1)
+        sessions = [session async for session in jwt_repo.iter_user_sessions(3)]
+        assert [session.token_digest for session in sessions] == [get_token_digest('z')]
+
+    async def test_max_sessions_evicts_in_one_statement(self, engine: AsyncEngine, jwt_repo: OverridenJWTRepository):
+        await jwt_repo.save_refresh_tokens([(user_id, f'old {user_id}') for user_id in range(2000)], 60)
+        statements = []
+
+        @event.listens_for(engine.sync_engine, 'before_cursor_execute')
+        def record_statement(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement.split()[0])
+
+        jwt_service = JWTService(jwt_repo, max_sessions_per_user=2)
+        await jwt_service.create_auth_tokens_many([user_id for user_id in range(2000) for _ in range(2)])
+        assert statements.count('DELETE') == 1
+        assert await self.count_tokens(jwt_repo) == 4000
+        assert await self.count_tokens(jwt_repo, 1999) == 2
+
+    async def test_max_sessions_statements_are_chunked(self, jwt_repo: OverridenJWTRepository, monkeypatch):
+        monkeypatch.setattr(jwt_repo, 'evict_users_per_statement', 2)
+        await jwt_repo.save_refresh_tokens([(user_id, f'old {user_id}') for user_id in range(5)], 60)
+        await jwt_repo.save_refresh_tokens([(user_id, f'new {user_id}') for user_id in range(5)], 60, max_sessions=1)
+        for user_id in range(5):
+            sessions = [session async for session in jwt_repo.iter_user_sessions(user_id)]
+            assert [session.token_digest for session in sessions] == [get_token_digest(f'new {user_id}')]
+
+    async def test_tokens_of_one_call_get_increasing_created_at(self, jwt_repo: OverridenJWTRepository):
+        await jwt_repo.save_refresh_tokens([(3, str(index)) for index in range(5)], 60)
+        sessions = [session async for session in jwt_repo.iter_user_sessions(3, page_size=2)]
+        assert [session.token_digest for session in sessions] == [get_token_digest(str(index)) for index in range(5)]
+        assert len({session.created_at for session in sessions}) == 5
+
+    async def expire_tokens(self, jwt_repo: OverridenJWTRepository, user_id: int) -> None:
+        async with jwt_repo.get_session() as session:
+            await session.execute(
+                update(RefreshTokenTable)
+                .where(RefreshTokenTable.user_id == user_id)
+                .values(expires_at=datetime.utcnow() - timedelta(seconds=1)),
+            )
+            await session.commit()
+
+    async def test_delete_expired_refresh_tokens(self, jwt_repo: OverridenJWTRepository):
+        await jwt_repo.save_refresh_tokens([(1, str(index)) for index in range(5)], 60)
+        await jwt_repo.save_refresh_tokens([(2, 'active')], 60)
+        await jwt_repo.save_refresh_tokens([(3, 'no expiry')], None)
+        await self.expire_tokens(jwt_repo, 1)
+        assert await jwt_repo.delete_expired_refresh_tokens(limit=3) == 3
+        assert await jwt_repo.delete_expired_refresh_tokens(limit=3) == 2
+        assert await jwt_repo.delete_expired_refresh_tokens(limit=3) == 0
+        assert await self.count_tokens(jwt_repo, 1) == 0
+        assert await self.count_tokens(jwt_repo) == 2
+
+    async def test_purger(self, jwt_repo: OverridenJWTRepository):
+        await jwt_repo.save_refresh_tokens([(1, str(index)) for index in range(7)] + [(2, 'active')], 60)
+        await self.expire_tokens(jwt_repo, 1)
+        purger = RefreshTokenPurger(jwt_repo, interval_seconds=0.01, batch_size=3)
+        assert await purger.purge() == 7
+        assert await self.count_tokens(jwt_repo) == 1
+
+    async def test_iter_user_sessions_skips_expired_tokens(self, jwt_repo: OverridenJWTRepository):
+        await jwt_repo.save_refresh_tokens([(1, 'expired')], 60)
+        await self.expire_tokens(jwt_repo, 1)
+        await jwt_repo.save_refresh_tokens([(1, 'active')], 60)
+        sessions = [session async for session in jwt_repo.iter_user_sessions(1)]
+        assert [session.token_digest for session in sessions] == [get_token_digest('active')]
+
+    async def get_user_digests(self, jwt_repo, user_id: int) -> set[str]:
+        return {session.token_digest async for session in jwt_repo.iter_user_sessions(user_id)}
+
+    async def test_rotate_refresh_token_wipes_user_tokens_on_reuse(self, jwt_repo: OverridenJWTRepository):
+        await jwt_repo.save_refresh_tokens([(1, 'first'), (1, 'second')])
+        await jwt_repo.save_refresh_token(2, 'other user')
+
+        assert await jwt_repo.rotate_refresh_token('first', 'rotated', 1) == 1
+        assert await self.get_user_digests(jwt_repo, 1) == {get_token_digest('second'), get_token_digest('rotated')}
+
+        """ REUSED TOKEN WIPES ALL USER TOKENS, REPLACEMENT IS STILL SAVED """
+        assert await jwt_repo.rotate_refresh_token('first', 'after reuse', 1) is None
+        assert await self.get_user_digests(jwt_repo, 1) == {get_token_digest('after reuse')}
+        assert await self.get_user_digests(jwt_repo, 2) == {get_token_digest('other user')}
+
+        assert await jwt_repo.rotate_refresh_token('first', 'opaque', None) is None
+        assert await self.get_user_digests(jwt_repo, 1) == {get_token_digest('after reuse')}
+
+    async def test_rotate_refresh_token_with_per_model_binds(self, engine: AsyncEngine):
+        """ session.bind IS NONE WHEN SESSION ROUTES MODELS TO ENGINES WITH binds """
+        jwt_repo = OverridenJWTRepository(async_sessionmaker(binds={RefreshTokenTable: engine}))
+        await jwt_repo.save_refresh_token(1, 'old')
+        assert await jwt_repo.rotate_refresh_token('old', 'new', 1) == 1
+        assert await self.get_user_digests(jwt_repo, 1) == {get_token_digest('new')}
+
+    async def test_grace_window_is_shared_between_workers(self, engine: AsyncEngine):
+        """ EACH REPOSITORY STANDS FOR ONE WORKER PROCESS WITH ITS OWN MEMORY """
+        first_worker, second_worker = GraceJWTRepository(engine), GraceJWTRepository(engine)
+        await first_worker.save_refresh_tokens([(1, 'old'), (1, 'other tab')])
+
+        rotation = await first_worker.rotate_refresh_token_with_grace('old', 'new', 1, 60, grace_seconds=10)
+        assert rotation == (1, None)
+        rotation = await second_worker.rotate_refresh_token_with_grace('old', 'newer', 1, 60, grace_seconds=10)
+        assert rotation == (1, 'new')
+        assert await second_worker.get_rotation('old') == (1, 'new')
+        assert await self.get_user_digests(second_worker, 1) == {get_token_digest('new'), get_token_digest('other tab')}
+
+        async with engine.connect() as conn:
+            sealed_token = await conn.scalar(select(RefreshTokenGraceTable.sealed_token))
+        assert 'new' not in sealed_token
+
+    async def test_grace_window_ends(self, engine: AsyncEngine):
+        jwt_repo = GraceJWTRepository(engine)
+        await jwt_repo.save_refresh_tokens([(1, 'old'), (1, 'other tab')])
+        await jwt_repo.rotate_refresh_token_with_grace('old', 'new', 1, 60, grace_seconds=10)
+        async with jwt_repo.get_session() as session:
+            await session.execute(
+                update(RefreshTokenGraceTable).values(expires_at=datetime.utcnow() - timedelta(seconds=1)),
+            )
+            await session.commit()
+
+        assert await jwt_repo.get_rotation('old') is None
+        assert await jwt_repo.rotate_refresh_token_with_grace('old', 'after reuse', 1, 60) == (None, None)
+        assert await self.get_user_digests(jwt_repo, 1) == {get_token_digest('after reuse')}
+        assert await jwt_repo.delete_expired_refresh_tokens(100) == 1
+        async with engine.connect() as conn:
+            assert await conn.scalar(select(func.count()).select_from(RefreshTokenGraceTable)) == 0
+
+    async def test_grace_window_of_opaque_token(self, engine: AsyncEngine):
+        jwt_repo = GraceJWTRepository(engine)
+        await jwt_repo.save_refresh_token(1, 'old', 60)
+        assert await jwt_repo.rotate_refresh_token_with_grace('old', 'new', None, 60) == (1, None)
+        assert await jwt_repo.rotate_refresh_token_with_grace('old', 'newer', None, 60) == (1, 'new')
+        assert await jwt_repo.rotate_refresh_token_with_grace('unknown', 'newest', None, 60) == (None, None)
+        assert await self.get_user_digests(jwt_repo, 1) == {get_token_digest('new')}
+
+    async def test_grace_window_without_grace_model_is_process_local(self, engine: AsyncEngine):
+        first_worker, second_worker = OverridenJWTRepository(engine), OverridenJWTRepository(engine)
+        await first_worker.save_refresh_tokens([(1, 'old'), (1, 'other tab')])
+        await first_worker.rotate_refresh_token_with_grace('old', 'new', 1, 60, grace_seconds=10)
+        assert await first_worker.get_rotation('old') == (1, 'new')
+        assert await second_worker.get_rotation('old') is None
+
+    async def test_migrate_legacy_tokens(self, engine: AsyncEngine):
+        """ OLD TOKENS HAD ONLY sub AND exp, SO TWO LOGINS IN ONE SECOND GAVE THE SAME TOKEN """
+        same_second_token = generate_jwt({'sub': '1'}, 60, 'JWT', 'HS256')
+        other_token = generate_jwt({'sub': '2'}, 120, 'JWT', 'HS256')
+        rows = [
+            {'user_id': 1, 'token': same_second_token},
+            {'user_id': 2, 'token': other_token},
+            {'user_id': 1, 'token': same_second_token},
+            {'user_id': 3, 'token': 'not a jwt'},
+            {'user_id': 1, 'token': same_second_token},
+        ]
+        async with engine.begin() as conn:
+            await conn.execute(insert(LegacyRefreshTokenTable), rows)
+
+        jwt_repo = LegacyJWTRepository(engine)
+        assert await jwt_repo.migrate_legacy_tokens(batch_size=2) == 3
+        assert await jwt_repo.migrate_legacy_tokens(batch_size=2) == 0
+
+        async with engine.connect() as conn:
+            migrated = (await conn.execute(
+                select(LegacyRefreshTokenTable.user_id, LegacyRefreshTokenTable.token_digest, LegacyRefreshTokenTable.expires_at)
+                .order_by(LegacyRefreshTokenTable.id),
+            )).all()
+        assert [(user_id, digest) for user_id, digest, _ in migrated] == [
+            (1, get_token_digest(same_second_token)),
+            (2, get_token_digest(other_token)),
+            (3, get_token_digest('not a jwt')),
+        ]
+        expires_at = [expires_at for _, _, expires_at in migrated]
+        assert expires_at[0] == datetime.utcfromtimestamp(decode_jwt(same_second_token, 'JWT', 'HS256')['exp'])
+        assert expires_at[1] == datetime.utcfromtimestamp(decode_jwt(other_token, 'JWT', 'HS256')['exp'])
+        assert expires_at[2] is None